@@ -0,0 +1,96 @@
+import argparse
+import time
+import numpy as np
+import pandas as pd
+from typing import Callable
+from data_engines import CTickDataParser
+
+
+def parse_args():
+    arg_parser = argparse.ArgumentParser(description="Benchmark tick to 1-minute bar aggregation")
+    arg_parser.add_argument("--ticks", type=int, default=50000, help="number of ticks of one contract")
+    arg_parser.add_argument("--repeat", type=int, default=10)
+    arg_parser.add_argument("--seed", type=int, default=0)
+    return arg_parser.parse_args()
+
+
+def agg_tick_data_to_bar(tick_data: pd.DataFrame) -> pd.DataFrame:
+    """
+    the original pandas version of CTickDataParser.agg_tick_data_to_bars, the reference of the numpy kernel
+
+    """
+    ohlc_data = tick_data["LastPrice"].resample("1min").ohlc()
+    vol_data = tick_data[["Volume", "Turnover", "OpenInterest"]].resample("1min").aggregate({
+        "Volume": "sum",
+        "Turnover": "sum",
+        "OpenInterest": "last",
+    })
+    bar_data = pd.merge(left=ohlc_data, right=vol_data, left_index=True, right_index=True, how="inner")
+    return bar_data
+
+
+def reformat_bar(tick_parser: CTickDataParser, bar_data: pd.DataFrame) -> pd.DataFrame:
+    rft_data = bar_data.dropna(axis=0, subset=["open", "high", "low", "close", "OpenInterest"])
+    rft_data = rft_data.reset_index().rename(
+        columns={"Volume": "vol", "Turnover": "amount", "OpenInterest": "oi", "index": "timestamp"}
+    )
+    rft_data["ts_code"] = tick_parser.contract
+    rft_data["trade_date"] = tick_parser.this_trade_date
+    rft_data = rft_data[tick_parser.save_vars]
+    return rft_data
+
+
+def make_tick_data(n_ticks: int, seed: int) -> pd.DataFrame:
+    """
+
+    :return: sorted tick data indexed by timestamp, like the output of CTickDataParser.revise_ticks
+    """
+    rng = np.random.default_rng(seed)
+    bgn = np.datetime64("2024-01-08T09:00:00.000")
+    ts = np.sort(bgn + rng.integers(0, 6 * 3600 * 1000, n_ticks).astype("timedelta64[ms]"))
+    return pd.DataFrame({
+        "LastPrice": 70000 + (rng.integers(-2, 3, n_ticks) * 10).cumsum().astype(np.float64),
+        "Volume": rng.integers(0, 20, n_ticks).astype(np.float64),
+        "Turnover": rng.integers(0, 20, n_ticks) * 350000.0,
+        "OpenInterest": 180000 + rng.integers(-5, 6, n_ticks).cumsum().astype(np.float64),
+    }, index=pd.DatetimeIndex(ts.astype("datetime64[ns]")))
+
+
+def best_of(func: Callable[[], pd.DataFrame], repeat: int) -> float:
+    elapsed: list[float] = []
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        func()
+        elapsed.append(time.perf_counter() - t0)
+    return min(elapsed)
+
+
+def main(n_ticks: int, repeat: int, seed: int):
+    tick_parser = CTickDataParser(
+        "20240108", contract="CU2402.SHF", instru="CU.SHF", exchange="SHF",
+        save_vars=["ts_code", "trade_date", "timestamp", "open", "high", "low", "close", "vol", "amount", "oi"],
+        prev_trade_date="20240105",
+    )
+    tick_data = make_tick_data(n_ticks, seed)
+
+    def pandas_path() -> pd.DataFrame:
+        return reformat_bar(tick_parser, agg_tick_data_to_bar(tick_data))
+
+    def numpy_path() -> pd.DataFrame:
+        return tick_parser.reformat_bars(tick_parser.agg_tick_data_to_bars(tick_data))
+
+    ref, res = pandas_path(), numpy_path()
+    ref["timestamp"] = ref["timestamp"].astype("datetime64[ns]")
+    pd.testing.assert_frame_equal(ref.reset_index(drop=True), res, check_exact=False, rtol=1e-12)
+
+    t_pandas, t_numpy = best_of(pandas_path, repeat), best_of(numpy_path, repeat)
+    print(f"ticks = {n_ticks}, bars = {len(res)}, best of {repeat}")
+    print(f"pandas resample : {t_pandas * 1000:>8.2f} ms")
+    print(f"numpy kernel    : {t_numpy * 1000:>8.2f} ms")
+    print(f"speedup         : {t_pandas / t_numpy:>8.2f}x")
+    return 0
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    main(n_ticks=args.ticks, repeat=args.repeat, seed=args.seed)
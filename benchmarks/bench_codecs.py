@@ -0,0 +1,155 @@
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import tempfile
+import pandas as pd
+from husfort.qcalendar import CCalendar
+from data_info import CSaveDataInfo
+from metrics import get_dataset_name
+from storage import get_save_path, save_daily_data, load_daily_data
+from project_cfg import pro_cfg, futures_md, futures_contracts, futures_pos, futures_minute_bar
+
+DATASETS: dict[str, CSaveDataInfo] = {
+    "fmd": futures_md,
+    "position": futures_pos,
+    "minute": futures_minute_bar,
+}
+
+# (name, suffix, codec, compression_level), codec and level as in CSaveDataInfo
+CANDIDATES: list[tuple[str, str, str | None, int | None]] = [
+    ("csv.gz level 9 (pandas default)", ".csv.gz", None, None),
+    ("csv.gz level 6", ".csv.gz", None, 6),
+    ("csv.gz level 3", ".csv.gz", None, 3),
+    ("csv.gz level 1", ".csv.gz", None, 1),
+    ("csv.zst level 1", ".csv.zst", None, 1),
+    ("csv.zst level 3", ".csv.zst", None, 3),
+    ("csv.zst level 9", ".csv.zst", None, 9),
+    ("csv.lz4", ".csv.lz4", None, None),
+    ("parquet zstd level 1", ".parquet", "zstd", 1),
+    ("parquet zstd level 3", ".parquet", "zstd", None),
+    ("parquet zstd level 9", ".parquet", "zstd", 9),
+    ("parquet lz4", ".parquet", "lz4", None),
+    ("parquet gzip", ".parquet", "gzip", None),
+    ("parquet snappy", ".parquet", "snappy", None),
+]
+
+
+def parse_args():
+    arg_parser = argparse.ArgumentParser(
+        description="Size and speed of compression codecs, on saved daily data, or on synthetic data"
+    )
+    arg_parser.add_argument("--bgn", type=str, help="begin date of saved data, format = [YYYYMMDD]")
+    arg_parser.add_argument("--stp", type=str, help="stop date of saved data, format = [YYYYMMDD]")
+    arg_parser.add_argument("--datasets", type=str, nargs="*", default=list(DATASETS), choices=list(DATASETS))
+    arg_parser.add_argument("--synthetic", type=int, default=0,
+                            help="if > 0, build this many dates of synthetic data instead of reading saved data")
+    arg_parser.add_argument("--dir", type=str, default=None,
+                            help="where files are written, a temporary directory by default")
+    arg_parser.add_argument("--report", type=str, default=None, help="path of the json report")
+    return arg_parser.parse_args()
+
+
+def load_saved_data(bgn: str, stp: str, datasets: list[str]) -> dict[str, dict[str, pd.DataFrame]]:
+    calendar = CCalendar(pro_cfg.calendar_path)
+    trade_dates = calendar.get_iter_list(bgn, stp)
+    return {
+        name: {d: load_daily_data(pro_cfg.daily_data_root_dir, DATASETS[name].file_format, d) for d in trade_dates}
+        for name in datasets
+    }
+
+
+def make_synthetic_data(n_dates: int, datasets: list[str], root_dir: str) -> dict[str, dict[str, pd.DataFrame]]:
+    from benchmarks.synthetic import build_dataset
+    from data_engines import CDataEngineTushareFutDailyMinuteBar
+
+    trade_dates = [d.strftime("%Y%m%d") for d in pd.bdate_range("2024-01-08", periods=n_dates)]
+    paths = build_dataset(root_dir, trade_dates, n_ticks=20000, n_pos_rows=8000, seed=0)
+    data: dict[str, dict[str, pd.DataFrame]] = {}
+    if "fmd" in datasets:
+        data["fmd"] = {
+            d: load_daily_data(paths["daily_data_root_dir"], futures_md.file_format, d) for d in trade_dates
+        }
+    if "position" in datasets:
+        data["position"] = {
+            d: load_daily_data(paths["daily_data_root_dir"], futures_pos.file_format, d) for d in trade_dates
+        }
+    if "minute" in datasets:
+        calendar = CCalendar(paths["calendar_path"])
+        engine = CDataEngineTushareFutDailyMinuteBar(
+            save_root_dir=paths["daily_data_root_dir"], save_data_info=futures_minute_bar,
+            md_data_info=futures_md, cntrcts_data_info=futures_contracts,
+            tick_data_root_dir=paths["tick_data_root_dir"], calendar=calendar,
+        )
+        engine.download_data_range(trade_dates[0], calendar.get_next_date(trade_dates[-1], shift=1), calendar,
+                                   silent=True)
+        data["minute"] = {
+            d: load_daily_data(paths["daily_data_root_dir"], futures_minute_bar.file_format, d) for d in trade_dates
+        }
+    return data
+
+
+def bench_candidate(name: str, data: dict[str, pd.DataFrame], suffix: str, codec: str | None,
+                    compression_level: int | None, root_dir: str) -> dict[str, float]:
+    info = DATASETS[name]
+    file_format = f"{get_dataset_name(info.file_format)}_{{}}{suffix}"
+    shutil.rmtree(root_dir, ignore_errors=True)
+    t0 = time.perf_counter()
+    nbytes = 0
+    for trade_date, df in data.items():
+        save_path = get_save_path(root_dir, file_format, trade_date)
+        os.makedirs(os.path.dirname(save_path), exist_ok=True)
+        save_daily_data(df, save_path, file_format, info.fields, trade_date,
+                        codec=codec, compression_level=compression_level)
+        nbytes += os.path.getsize(save_path)
+    write_seconds = time.perf_counter() - t0
+    t0 = time.perf_counter()
+    for trade_date in data:
+        load_daily_data(root_dir, file_format, trade_date)
+    read_seconds = time.perf_counter() - t0
+    return {"bytes": nbytes, "write_seconds": write_seconds, "read_seconds": read_seconds}
+
+
+def main(data: dict[str, dict[str, pd.DataFrame]], work_dir: str, report_path: str | None) -> int:
+    report: dict[str, dict[str, dict[str, float]]] = {}
+    for name, dataset_data in data.items():
+        rows = sum(len(df) for df in dataset_data.values())
+        print(f"--- {name}: {len(dataset_data)} dates, {rows} rows")
+        print(f"{'codec':<32s} {'MB':>9s} {'size':>7s} {'write s':>9s} {'read s':>9s} {'write k rows/s':>15s}")
+        report[name] = {}
+        for candidate, suffix, codec, level in CANDIDATES:
+            try:
+                res = bench_candidate(name, dataset_data, suffix, codec, level, os.path.join(work_dir, name))
+            except ImportError as e:  # lz4 is optional
+                print(f"{candidate:<32s} skipped, {e}")
+                continue
+            report[name][candidate] = res
+            base = next(iter(report[name].values()))
+            print(f"{candidate:<32s} {res['bytes'] / 1024 ** 2:>9.2f} {res['bytes'] / base['bytes']:>7.1%} "
+                  f"{res['write_seconds']:>9.3f} {res['read_seconds']:>9.3f} "
+                  f"{rows / res['write_seconds'] / 1000:>15.1f}")
+    if report_path is not None:
+        with open(report_path, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"report is saved to {report_path}")
+    return 0
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    bench_dir = args.dir or tempfile.mkdtemp(prefix="bench_codecs_")
+    try:
+        if args.synthetic > 0:
+            bench_data = make_synthetic_data(args.synthetic, args.datasets, os.path.join(bench_dir, "synthetic"))
+        elif args.bgn and args.stp:
+            bench_data = load_saved_data(args.bgn, args.stp, args.datasets)
+        else:
+            print("either --bgn and --stp, or --synthetic is required")
+            sys.exit(2)
+        exit_code = main(bench_data, os.path.join(bench_dir, "codecs"), args.report)
+    finally:
+        if args.dir is None:
+            shutil.rmtree(bench_dir, ignore_errors=True)
+    sys.exit(exit_code)
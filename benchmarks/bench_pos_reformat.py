@@ -0,0 +1,72 @@
+import re
+import argparse
+import time
+import numpy as np
+import pandas as pd
+from functools import partial
+from husfort.qutility import SFY
+from husfort.qinstruments import parse_instrument_from_contract
+from databases import CDbWriterPos
+from benchmarks.synthetic import make_pos_data, make_pos_db_struct
+
+
+def parse_args():
+    arg_parser = argparse.ArgumentParser(description="Benchmark reformat of futures positions")
+    arg_parser.add_argument("--days", type=int, default=244, help="number of trade dates, 244 is about a year")
+    arg_parser.add_argument("--rows", type=int, default=8000, help="rows of one trade date, at most about 7800")
+    arg_parser.add_argument("--seed", type=int, default=0)
+    return arg_parser.parse_args()
+
+
+def parse_code_type(code: str, trade_date: str) -> int:
+    if re.match(pattern=CDbWriterPos.CONTRACT_PATTERN, string=code) is not None:
+        return 0
+    elif re.match(pattern=CDbWriterPos.INSTRUMENT_PATTERN, string=code) is not None:
+        return 1
+    else:
+        raise ValueError(f"Pattern can not be parsed for code = {SFY(code)} @ {SFY(trade_date)}")
+
+
+def reformat_by_row(writer: CDbWriterPos, raw_data: pd.DataFrame, trade_date: str) -> pd.DataFrame:
+    """
+    the original row by row version of CDbWriterPos.reformat, the reference of the vectorized one
+
+    """
+    raw_data = raw_data[raw_data["symbol"].map(lambda _: not _.endswith("ACTV"))].copy()
+    raw_data = writer.drop_nan_rows(raw_data)
+    raw_data["broker"] = raw_data["broker"].map(writer.rft_broker)
+    raw_data["symbol"] = raw_data["symbol"].map(writer.rft_symbol)
+    raw_data["exchange"] = raw_data["exchange"].map(writer.rft_exchange)
+    raw_data["ts_code"] = raw_data[["symbol", "exchange"]].apply(lambda z: f"{z['symbol']}.{z['exchange']}", axis=1)
+    raw_data["instrument"] = raw_data["ts_code"].map(parse_instrument_from_contract)
+    raw_data["code_type"] = raw_data["ts_code"].map(lambda _: parse_code_type(_, trade_date))
+    rft_data = raw_data[writer.db_struct.table.vars.names]
+    return rft_data
+
+
+def main(n_days: int, n_rows: int, seed: int):
+    db_struct = make_pos_db_struct(db_save_dir=".")
+    writer = CDbWriterPos(db_struct=db_struct, raw_data_root_dir=".", raw_data_info=None)  # type:ignore
+    rng = np.random.default_rng(seed)
+    trade_dates = [d.strftime("%Y%m%d") for d in pd.bdate_range("2024-01-01", periods=n_days)]
+    raw_data_list = [make_pos_data(n_rows, trade_date, rng) for trade_date in trade_dates]
+
+    elapsed: dict[str, float] = {}
+    results: dict[str, list[pd.DataFrame]] = {}
+    for name, reformat in [("by row", partial(reformat_by_row, writer)), ("vectorized", writer.reformat)]:
+        t0 = time.perf_counter()
+        results[name] = [reformat(raw_data.copy(), d) for raw_data, d in zip(raw_data_list, trade_dates)]
+        elapsed[name] = time.perf_counter() - t0
+    for ref, res in zip(results["by row"], results["vectorized"]):
+        pd.testing.assert_frame_equal(ref, res, check_dtype=False)
+
+    print(f"days = {n_days}, rows = {n_days * n_rows}")
+    print(f"by row     : {elapsed['by row']:>8.2f} s")
+    print(f"vectorized : {elapsed['vectorized']:>8.2f} s")
+    print(f"speedup    : {elapsed['by row'] / elapsed['vectorized']:>8.2f}x")
+    return 0
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    main(n_days=args.days, n_rows=args.rows, seed=args.seed)
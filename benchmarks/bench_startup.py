@@ -0,0 +1,56 @@
+import os
+import sys
+import time
+import argparse
+import subprocess
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# modules imported by "main.py update", and provider SDKs that must not be among them
+UPDATE_IMPORTS = ("project_cfg", "databases", "storage", "metrics")
+PROVIDER_MODULES = ("tushare", "WindPy", "data_engines")
+# only needed by parquet datasets, all datasets of pro_cfg are csv
+COLUMNAR_MODULES = ("pyarrow.dataset", "pyarrow.parquet")
+
+
+def parse_args():
+    arg_parser = argparse.ArgumentParser(description="Check start up time of the command line interface")
+    arg_parser.add_argument("--repeat", type=int, default=5, help="best of this many runs")
+    arg_parser.add_argument("--max-seconds", type=float, default=1.0, help="exit with 1 if any command is slower")
+    return arg_parser.parse_args()
+
+
+def best_of(cmd: list[str], repeat: int) -> float:
+    elapsed: list[float] = []
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        subprocess.run(cmd, cwd=ROOT_DIR, check=True, stdout=subprocess.DEVNULL)
+        elapsed.append(time.perf_counter() - t0)
+    return min(elapsed)
+
+
+def main(repeat: int, max_seconds: float) -> int:
+    check_update_imports = (
+        f"import sys, {', '.join(UPDATE_IMPORTS)}; "
+        f"loaded = [m for m in {PROVIDER_MODULES + COLUMNAR_MODULES!r} if m in sys.modules]; "
+        f"sys.exit(f'update path imports {{loaded}}' if loaded else 0)"
+    )
+    commands = {
+        "python": [sys.executable, "-c", "pass"],
+        "main.py --help": [sys.executable, "main.py", "--help"],
+        "main.py update --help": [sys.executable, "main.py", "update", "--help"],
+        "update imports": [sys.executable, "-c", check_update_imports],
+    }
+    exit_code = 0
+    for name, cmd in commands.items():
+        seconds = best_of(cmd, repeat)
+        status = "ok" if seconds <= max_seconds else "SLOW"
+        print(f"{name:<24s} {seconds * 1000:>8.1f} ms  {status}")
+        if status != "ok":
+            exit_code = 1
+    return exit_code
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    sys.exit(main(repeat=args.repeat, max_seconds=args.max_seconds))
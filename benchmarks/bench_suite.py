@@ -0,0 +1,288 @@
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import platform
+import tempfile
+import pandas as pd
+from contextlib import contextmanager
+from husfort.qcalendar import CCalendar
+from data_engines import CDataEngineTushareFutDailyMinuteBar, CTickZipReader, CTickDataParser, CMinuteBarTask
+from databases import CDbWriterPos, CDbWriterMinuteBar, CDbReader
+from storage import data_store
+from manifest import get_manifest
+from project_cfg import futures_md, futures_contracts, futures_pos, futures_minute_bar
+from benchmarks.synthetic import build_dataset, make_pos_db_struct, make_minute_bar_db_struct
+from benchmarks.bench_bar_kernel import agg_tick_data_to_bar, reformat_bar
+from benchmarks.bench_pos_reformat import reformat_by_row
+
+THRESHOLDS_PATH = os.path.join(os.path.dirname(__file__), "thresholds.json")
+
+
+def parse_args():
+    arg_parser = argparse.ArgumentParser(description="Offline benchmark suite on synthetic data")
+    arg_parser.add_argument("--dir", type=str, default=None,
+                            help="where to build the synthetic data, a temporary directory by default")
+    arg_parser.add_argument("--dates", type=int, default=5, help="number of trade dates")
+    arg_parser.add_argument("--ticks", type=int, default=20000, help="number of ticks of one contract in one date")
+    arg_parser.add_argument("--rows", type=int, default=8000, help="number of rows of positions in one date")
+    arg_parser.add_argument("--processes", type=int, default=None, help="processes of the minute bar engine")
+    arg_parser.add_argument("--seed", type=int, default=0)
+    arg_parser.add_argument("--report", type=str, default="bench_report.json", help="path of the json report")
+    arg_parser.add_argument("--check", action="store_true", default=False,
+                            help=f"exit with 1 if any threshold in {THRESHOLDS_PATH} is broken")
+    return arg_parser.parse_args()
+
+
+class CStageTimer:
+    def __init__(self):
+        self.stages: dict[str, dict[str, float]] = {}
+
+    @contextmanager
+    def time(self, stage: str, rows: int = 0):
+        t0 = time.perf_counter()
+        yield
+        record = self.stages.setdefault(stage, {"seconds": 0.0, "rows": 0})
+        record["seconds"] += time.perf_counter() - t0
+        record["rows"] += rows
+
+    def to_dict(self) -> dict[str, dict[str, float]]:
+        return {
+            stage: {
+                "seconds": round(record["seconds"], 6),
+                "rows": record["rows"],
+                "us_per_row": round(record["seconds"] * 1e6 / record["rows"], 3) if record["rows"] else None,
+            }
+            for stage, record in self.stages.items()
+        }
+
+
+def bench_tick_parser(engine: CDataEngineTushareFutDailyMinuteBar, trade_dates: list[str], timer: CStageTimer):
+    """
+    every stage of CTickDataParser.main, on the same tasks as download_data_range,
+    and the pandas reference of the aggregation
+
+    """
+    for trade_date in trade_dates:
+        tasks: list[CMinuteBarTask] = engine.get_minute_bar_tasks(trade_date)
+        reader = CTickZipReader(engine.get_tick_zip_path(trade_date))
+        for task in tasks:
+            with timer.time("tick_parser.read_member"):
+                tick_data = reader.read_member(task.member)
+            rows = len(tick_data)
+            _, exchange = engine.reformat_contract(task.contract)
+            tick_parser = CTickDataParser(
+                task.trade_date, contract=task.contract, instru=task.instru, exchange=exchange,
+                save_vars=list(task.save_vars), prev_trade_date=task.prev_trade_date,
+            )
+            with timer.time("tick_parser.cal_vol_and_to", rows):
+                engine.cal_vol_and_to(tick_data)
+            with timer.time("tick_parser.add_trade_date", rows):
+                tick_parser.add_trade_date(tick_data)
+            with timer.time("tick_parser.add_ticks", rows):
+                tick_parser.add_ticks(tick_data)
+            with timer.time("tick_parser.revise_ticks", rows):
+                truncated_data = tick_parser.revise_ticks(tick_data)
+            with timer.time("tick_parser.agg_tick_data_to_bars", len(truncated_data)):
+                bars = tick_parser.agg_tick_data_to_bars(truncated_data)
+            with timer.time("tick_parser.reformat_bars", len(truncated_data)):
+                tick_parser.reformat_bars(bars)
+            with timer.time("tick_parser.agg_tick_data_to_bar.pandas", len(truncated_data)):
+                reformat_bar(tick_parser, agg_tick_data_to_bar(truncated_data))
+        reader.close()
+    return 0
+
+
+def bench_tick_cache(engine: CDataEngineTushareFutDailyMinuteBar, trade_dates: list[str], cache_dir: str,
+                     timer: CStageTimer):
+    """
+    read the tick files of all tasks from the zip and save them to the tick cache,
+    then read them again from the cache
+
+    """
+    shutil.rmtree(cache_dir, ignore_errors=True)  # left by a previous run in the same --dir
+    for stage in ("tick_cache.cold", "tick_cache.warm"):
+        for trade_date in trade_dates:
+            reader = CTickZipReader(engine.get_tick_zip_path(trade_date), cache_dir)
+            for task in engine.get_minute_bar_tasks(trade_date):
+                with timer.time(stage):
+                    tick_data = reader.read_member(task.member)
+                timer.stages[stage]["rows"] += len(tick_data)
+            reader.close()
+    return 0
+
+
+def bench_minute_bar_engine(engine: CDataEngineTushareFutDailyMinuteBar, trade_dates: list[str],
+                            calendar: CCalendar, timer: CStageTimer):
+    """
+    the whole range through the shared worker pool, as "download --switch minute" runs it
+
+    """
+    file_format = engine.save_file_format
+    manifest = get_manifest(engine.save_root_dir)
+    for trade_date in trade_dates:  # saved by a previous run in the same --dir
+        if os.path.exists(save_path := engine.get_save_path(trade_date)):
+            os.remove(save_path)
+    manifest.remove(file_format, trade_dates)
+    stp_date = calendar.get_next_date(trade_dates[-1], shift=1)
+    with timer.time("minute_bar.download_data_range"):
+        engine.download_data_range(trade_dates[0], stp_date, calendar, silent=True)
+    partitions = manifest.get_partitions(file_format, trade_dates[0], trade_dates[-1])
+    timer.stages["minute_bar.download_data_range"]["rows"] += sum(_.rows for _ in partitions.values())
+    return 0
+
+
+def bench_pos_reformat(writer: CDbWriterPos, trade_dates: list[str], timer: CStageTimer):
+    for trade_date in trade_dates:
+        raw_data = writer.load_data(trade_date)
+        with timer.time("pos.reformat_by_row", len(raw_data)):
+            reformat_by_row(writer, raw_data.copy(), trade_date)
+        with timer.time("pos.reformat", len(raw_data)):
+            writer.reformat(raw_data.copy(), trade_date)
+    return 0
+
+
+def bench_db_writer(writer: CDbWriterPos | CDbWriterMinuteBar, name: str, trade_dates: list[str],
+                    calendar: CCalendar, timer: CStageTimer):
+    stp_date = calendar.get_next_date(trade_dates[-1], shift=1)
+    if os.path.exists(db_path := writer.get_db_path()):
+        os.remove(db_path)  # left by a previous run in the same --dir
+    rows = sum(len(writer.load_data(trade_date)) for trade_date in trade_dates)
+    with timer.time(f"{name}.db_writer_main", rows):
+        writer.main(trade_dates[0], stp_date, calendar, silent=True)
+    return 0
+
+
+def bench_db_reader(writer: CDbWriterPos, trade_dates: list[str], calendar: CCalendar, timer: CStageTimer):
+    """
+    queries of the whole range and of single instruments, first from the database, then from the cache
+
+    """
+    stp_date = calendar.get_next_date(trade_dates[-1], shift=1)
+    reader = CDbReader(writer.db_struct)
+    reader.ensure_indexes()
+    instruments = reader.query(trade_dates[0], stp_date, fields=["instrument"])["instrument"].unique()
+    queries = [{}] + [{"instruments": [instrument]} for instrument in instruments[:10]]
+    for stage in ("db_reader.cold", "db_reader.warm"):
+        for query in queries:
+            with timer.time(stage):
+                data = reader.query(trade_dates[0], stp_date, fields=["trade_date", "instrument", "vol"], **query)
+            timer.stages[stage]["rows"] += len(data)
+    reader.close()
+    return 0
+
+
+def get_speedups(stages: dict[str, dict[str, float]]) -> dict[str, float]:
+    pairs = {
+        "tick_parser.agg": ("tick_parser.agg_tick_data_to_bar.pandas", "tick_parser.agg_tick_data_to_bars"),
+        "pos.reformat": ("pos.reformat_by_row", "pos.reformat"),
+        "tick_cache": ("tick_parser.read_member", "tick_cache.warm"),
+        "db_reader.cache": ("db_reader.cold", "db_reader.warm"),
+    }
+    return {
+        name: round(stages[ref]["seconds"] / stages[res]["seconds"], 3)
+        for name, (ref, res) in pairs.items() if ref in stages and res in stages and stages[res]["seconds"] > 0
+    }
+
+
+def check_thresholds(report: dict, thresholds: dict) -> list[str]:
+    """
+
+    :return: descriptions of broken thresholds, empty if all are kept
+    """
+    broken: list[str] = []
+    for stage, max_us_per_row in thresholds.get("max_us_per_row", {}).items():
+        if (us_per_row := report["stages"].get(stage, {}).get("us_per_row")) is None:
+            broken.append(f"{stage}: not measured")
+        elif us_per_row > max_us_per_row:
+            broken.append(f"{stage}: {us_per_row:.3f} us/row > {max_us_per_row} us/row")
+    for name, min_speedup in thresholds.get("min_speedup", {}).items():
+        if (speedup := report["speedups"].get(name)) is None:
+            broken.append(f"{name}: not measured")
+        elif speedup < min_speedup:
+            broken.append(f"{name}: speedup {speedup:.2f}x < {min_speedup}x")
+    return broken
+
+
+def main(root_dir: str, n_dates: int, n_ticks: int, n_rows: int, processes: int | None, seed: int,
+         report_path: str, check: bool) -> int:
+    trade_dates = [d.strftime("%Y%m%d") for d in pd.bdate_range("2024-01-08", periods=n_dates)]
+    t0 = time.perf_counter()
+    paths = build_dataset(root_dir, trade_dates, n_ticks=n_ticks, n_pos_rows=n_rows, seed=seed)
+    print(f"synthetic data is built in {time.perf_counter() - t0:.2f} s, at {root_dir}")
+    calendar = CCalendar(paths["calendar_path"])
+    daily_data_root_dir = paths["daily_data_root_dir"]
+    engine = CDataEngineTushareFutDailyMinuteBar(
+        save_root_dir=daily_data_root_dir,
+        save_data_info=futures_minute_bar,
+        md_data_info=futures_md,
+        cntrcts_data_info=futures_contracts,
+        tick_data_root_dir=paths["tick_data_root_dir"],
+        calendar=calendar,
+        processes=processes,
+    )
+    pos_writer = CDbWriterPos(
+        db_struct=make_pos_db_struct(root_dir), raw_data_root_dir=daily_data_root_dir, raw_data_info=futures_pos,
+    )
+    minute_bar_writer = CDbWriterMinuteBar(
+        db_struct=make_minute_bar_db_struct(root_dir), raw_data_root_dir=daily_data_root_dir,
+        raw_data_info=futures_minute_bar,
+    )
+
+    timer = CStageTimer()
+    bench_tick_parser(engine, trade_dates, timer)
+    bench_tick_cache(engine, trade_dates, os.path.join(root_dir, "tick_cache"), timer)
+    bench_minute_bar_engine(engine, trade_dates, calendar, timer)
+    bench_pos_reformat(pos_writer, trade_dates, timer)
+    data_store.clear()  # db writers load raw data from files, as in a separate update run
+    bench_db_writer(pos_writer, "pos", trade_dates, calendar, timer)
+    bench_db_reader(pos_writer, trade_dates, calendar, timer)
+    bench_db_writer(minute_bar_writer, "minute_bar", trade_dates, calendar, timer)
+
+    stages = timer.to_dict()
+    report = {
+        "meta": {
+            "created": time.strftime("%Y-%m-%d %H:%M:%S"),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "dates": n_dates, "ticks": n_ticks, "rows": n_rows, "processes": processes, "seed": seed,
+        },
+        "stages": stages,
+        "speedups": get_speedups(stages),
+    }
+    with open(report_path, "w") as f:
+        json.dump(report, f, indent=2)
+
+    for stage, record in stages.items():
+        us_per_row = "" if record["us_per_row"] is None else f"{record['us_per_row']:>10.3f} us/row"
+        print(f"{stage:<45s} {record['seconds']:>10.4f} s {record['rows']:>10d} rows {us_per_row}")
+    for name, speedup in report["speedups"].items():
+        print(f"speedup of {name:<34s} {speedup:>10.2f}x")
+    print(f"report is saved to {report_path}")
+
+    if check:
+        with open(THRESHOLDS_PATH, "r") as f:
+            thresholds = json.load(f)
+        if broken := check_thresholds(report, thresholds):
+            for description in broken:
+                print(f"REGRESSION {description}")
+            return 1
+        print("all thresholds are kept")
+    return 0
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    bench_dir = args.dir or tempfile.mkdtemp(prefix="bench_")
+    try:
+        exit_code = main(
+            root_dir=bench_dir, n_dates=args.dates, n_ticks=args.ticks, n_rows=args.rows,
+            processes=args.processes, seed=args.seed, report_path=args.report, check=args.check,
+        )
+    finally:
+        if args.dir is None:
+            shutil.rmtree(bench_dir, ignore_errors=True)
+    sys.exit(exit_code)
@@ -0,0 +1,209 @@
+import argparse
+import time
+import datetime as dt
+import numpy as np
+import pandas as pd
+from husfort.qutility import SFR
+from data_engines import CTickDataParser
+
+# (instru, exchange, trade_date, prev_trade_date), cases where the original parser and sessions.py must agree
+CASES: list[tuple[str, str, str, str]] = [
+    ("AU.SHF", "SHF", "20240109", "20240108"),  # commodity, night session closes at 02:30 of the next day
+    ("AU.SHF", "SHF", "20240108", "20240105"),  # commodity, night session of Friday, closes on Saturday
+    ("IF.CFX", "CFX", "20151231", "20151230"),  # cfx equity, 09:15 - 15:15
+    ("IF.CFX", "CFX", "20160104", "20151231"),  # cfx equity, 09:30 - 15:00
+    ("IC.CFX", "CFX", "20240109", "20240108"),
+    ("TF.CFX", "CFX", "20151231", "20151230"),  # cfx bond, 09:15 - 15:15
+    ("T.CFX", "CFX", "20200717", "20200716"),
+    ("T.CFX", "CFX", "20200720", "20200717"),  # cfx bond, 09:30 - 15:15
+    ("T.CFX", "CFX", "20240109", "20240108"),
+]
+
+# open and close of all sessions above, ticks are generated around each of them
+BOUNDARIES = (
+    "20:59", "21:00", "02:30", "02:35", "08:59", "09:00", "09:10", "09:15", "09:25", "09:30",
+    "10:15", "10:16", "10:29", "10:30", "11:30", "11:31", "12:59", "13:00", "13:29", "13:30",
+    "15:00", "15:05", "15:15", "15:20",
+)
+
+
+def parse_args():
+    arg_parser = argparse.ArgumentParser(
+        description="Check that the vectorized tick parser revises ticks as the original loop did")
+    arg_parser.add_argument("--ticks", type=int, default=50000, help="number of random ticks of one case")
+    arg_parser.add_argument("--seed", type=int, default=0)
+    return arg_parser.parse_args()
+
+
+class CTickDataParserByLoop:
+    """
+    the original row by row trade dates, timestamps and revisions, the reference of CTickDataParser
+
+    """
+
+    EQT_TRADE_TIME_CHG_DATE = "20160101"
+    BND_TRADE_TIME_CHG_DATE = "20200720"
+
+    def __init__(self, trade_date: str, instru: str, exchange: str, prev_trade_date: str):
+        self.instru, self.exchange = instru, exchange
+        self.this_trade_date = trade_date
+        self.prev_trade_date = prev_trade_date
+        self.t_date = dt.datetime.strptime(self.this_trade_date, "%Y%m%d")
+        self.p_date = dt.datetime.strptime(self.prev_trade_date, "%Y%m%d")
+        self.l_date = self.p_date + dt.timedelta(days=1)
+        self.tail_trade_date = self.l_date.strftime("%Y%m%d")
+
+    def __parse_date_from_time(self, t_time: str):
+        if t_time <= "04:00:00":
+            return self.tail_trade_date
+        elif t_time <= "16:00:00":
+            return self.this_trade_date
+        else:
+            return self.prev_trade_date
+
+    def add_trade_date(self, tick_data: pd.DataFrame) -> None:
+        tick_data["trade_date"] = tick_data["UpdateTime"].map(self.__parse_date_from_time)
+
+    @staticmethod
+    def add_ticks(tick_data: pd.DataFrame) -> None:
+        tick_data["ts"] = tick_data[["trade_date", "UpdateTime", "UpdateMillisec"]].apply(
+            lambda z: f"{z['trade_date']} {z['UpdateTime']}.{z['UpdateMillisec']:03d}", axis=1)
+        tick_data["ts"] = pd.to_datetime(tick_data["ts"])
+        tick_data.set_index(keys="ts", inplace=True)
+
+    @staticmethod
+    def __revise_to_end(db: dt.datetime, de: dt.datetime, i: int, timestamp: dt.datetime, s: list[dt.datetime]) -> bool:
+        if db <= timestamp <= de:
+            s[i] = de
+            return True
+        return False
+
+    @staticmethod
+    def __revise_to_bgn(db: dt.datetime, de: dt.datetime, i: int, timestamp: dt.datetime, s: list[dt.datetime]) -> bool:
+        if db <= timestamp <= de:
+            s[i] = db - dt.timedelta(milliseconds=1)
+            return True
+        return False
+
+    def __revise(self, tick_data: pd.DataFrame, bounds: list[tuple[dt.datetime, dt.datetime, bool]]) -> None:
+        """
+
+        :param bounds: (db, de, to_end) of each revision, in the original order, the first match wins
+        """
+        ts_lst = tick_data.index.tolist()
+        for i, timestamp in enumerate(ts_lst):
+            for db, de, to_end in bounds:
+                if (self.__revise_to_end if to_end else self.__revise_to_bgn)(db, de, i, timestamp, ts_lst):
+                    break
+        tick_data.index = ts_lst
+
+    def __revise_non_cfx(self, tick_data: pd.DataFrame) -> pd.DataFrame:
+        hm = dt.timedelta(hours=1), dt.timedelta(minutes=1)
+        d0b, d0e = self.p_date + 20 * hm[0] + 59 * hm[1], self.p_date + 21 * hm[0]  # night
+        d1b, d1e = self.l_date + 2 * hm[0] + 30 * hm[1], self.l_date + 2 * hm[0] + 35 * hm[1]
+        d2b, d2e = self.t_date + 8 * hm[0] + 59 * hm[1], self.t_date + 9 * hm[0]  # morning
+        d3b, d3e = self.t_date + 10 * hm[0] + 15 * hm[1], self.t_date + 10 * hm[0] + 16 * hm[1]
+        d4b, d4e = self.t_date + 10 * hm[0] + 29 * hm[1], self.t_date + 10 * hm[0] + 30 * hm[1]  # middle
+        d5b, d5e = self.t_date + 11 * hm[0] + 30 * hm[1], self.t_date + 11 * hm[0] + 31 * hm[1]
+        d6b, d6e = self.t_date + 13 * hm[0] + 29 * hm[1], self.t_date + 13 * hm[0] + 30 * hm[1]  # afternoon
+        d7b, d7e = self.t_date + 15 * hm[0], self.t_date + 15 * hm[0] + 5 * hm[1]
+        self.__revise(tick_data, [
+            (d0b, d0e, True), (d1b, d1e, False), (d2b, d2e, True), (d3b, d3e, False),
+            (d4b, d4e, True), (d5b, d5e, False), (d6b, d6e, True), (d7b, d7e, False),
+        ])
+        return tick_data.query(f"(index >= '{d0e}' & index < '{d1b}')  | (index >= '{d2e}' & index < '{d7b}')")
+
+    def __revise_cfx(self, tick_data: pd.DataFrame, open_at_930: bool, close_at_1515: bool) -> pd.DataFrame:
+        hm = dt.timedelta(hours=1), dt.timedelta(minutes=1)
+        if open_at_930:
+            d0b, d0e = self.t_date + 9 * hm[0] + 25 * hm[1], self.t_date + 9 * hm[0] + 30 * hm[1]
+        else:
+            d0b, d0e = self.t_date + 9 * hm[0] + 10 * hm[1], self.t_date + 9 * hm[0] + 15 * hm[1]
+        if close_at_1515:
+            d3b, d3e = self.t_date + 15 * hm[0] + 15 * hm[1], self.t_date + 15 * hm[0] + 20 * hm[1]
+        else:
+            d3b, d3e = self.t_date + 15 * hm[0], self.t_date + 15 * hm[0] + 5 * hm[1]
+        d1b, d1e = self.t_date + 11 * hm[0] + 30 * hm[1], self.t_date + 11 * hm[0] + 31 * hm[1]
+        d2b, d2e = self.t_date + 12 * hm[0] + 59 * hm[1], self.t_date + 13 * hm[0]
+        self.__revise(tick_data, [(d0b, d0e, True), (d1b, d1e, False), (d2b, d2e, True), (d3b, d3e, False)])
+        return tick_data.query(f"index >= '{d0e}' & index < '{d3b}'")
+
+    def revise_ticks(self, tick_data: pd.DataFrame) -> pd.DataFrame:
+        if self.exchange == "CFX":
+            if self.instru.upper() in ["IH.CFX", "IF.CFX", "IC.CFX", "IM.CFX"]:
+                open_at_930 = self.this_trade_date >= self.EQT_TRADE_TIME_CHG_DATE
+                return self.__revise_cfx(tick_data, open_at_930=open_at_930, close_at_1515=not open_at_930)
+            elif self.instru.upper() in ["TS.CFX", "TF.CFX", "T.CFX", "TL.CFX"]:
+                open_at_930 = self.this_trade_date >= self.BND_TRADE_TIME_CHG_DATE
+                return self.__revise_cfx(tick_data, open_at_930=open_at_930, close_at_1515=True)
+            else:
+                raise ValueError(f"instru = {SFR(self.instru)} is illegal for CFX")
+        else:
+            return self.__revise_non_cfx(tick_data)
+
+
+def make_tick_data(rng: np.random.Generator, n_ticks: int) -> pd.DataFrame:
+    """
+
+    :return: juejin style tick data from 20:50 to 02:45 and from 08:50 to 15:30, night session first,
+             with ticks at, and just before and after, every minute in BOUNDARIES
+    """
+    secs = np.concatenate([
+        rng.integers(20 * 3600 + 50 * 60, 24 * 3600, n_ticks // 2),
+        rng.integers(0, 2 * 3600 + 45 * 60, n_ticks // 8),
+        rng.integers(8 * 3600 + 50 * 60, 15 * 3600 + 30 * 60, n_ticks // 2),
+    ])
+    edges = np.array([int(hhmm[0:2]) * 3600 + int(hhmm[3:5]) * 60 for hhmm in BOUNDARIES])
+    secs = np.sort(np.concatenate([secs, edges - 1, edges, edges + 1, edges + 59, edges + 60]) % (24 * 3600))
+    secs = np.concatenate([secs[secs >= 18 * 3600], secs[secs < 18 * 3600]])
+    n = len(secs)
+    return pd.DataFrame({
+        "UpdateTime": pd.to_datetime(secs, unit="s").strftime("%H:%M:%S"),
+        "UpdateMillisec": rng.choice([0, 500, 999], n),
+        "LastPrice": (500 + rng.integers(-2, 3, n).cumsum() * 0.05).round(2),
+        "Volume": rng.integers(0, 20, n).astype(np.float64),
+        "Turnover": rng.integers(0, 20, n) * 5000.0,
+        "OpenInterest": (100000 + rng.integers(-5, 6, n).cumsum()).astype(np.float64),
+    })
+
+
+def main(n_ticks: int, seed: int):
+    rng = np.random.default_rng(seed)
+    elapsed = {"loop": 0.0, "vectorized": 0.0}
+    for instru, exchange, trade_date, prev_trade_date in CASES:
+        tick_data = make_tick_data(rng, n_ticks)
+        ref_parser = CTickDataParserByLoop(trade_date, instru, exchange, prev_trade_date)
+        res_parser = CTickDataParser(
+            trade_date, contract=instru, instru=instru, exchange=exchange,
+            save_vars=[], prev_trade_date=prev_trade_date,
+        )
+        results: dict[str, pd.DataFrame] = {}
+        for name, parser in [("loop", ref_parser), ("vectorized", res_parser)]:
+            t0 = time.perf_counter()
+            data = tick_data.copy()
+            parser.add_trade_date(data)
+            parser.add_ticks(data)
+            results[name] = parser.revise_ticks(data)
+            elapsed[name] += time.perf_counter() - t0
+        # tick cache path, UpdateTime in seconds of the day
+        data = tick_data.assign(UpdateTime=pd.to_timedelta(tick_data["UpdateTime"]).dt.total_seconds().astype(np.int64))
+        res_parser.add_trade_date(data)
+        res_parser.add_ticks(data)
+        results["cached"] = res_parser.revise_ticks(data).assign(UpdateTime=results["vectorized"]["UpdateTime"])
+
+        ref = results["loop"]
+        ref.index = pd.DatetimeIndex(ref.index).astype("datetime64[ns]")
+        for name in ("vectorized", "cached"):
+            pd.testing.assert_frame_equal(ref, results[name], check_dtype=False, check_freq=False)
+        print(f"{instru:<7s} {trade_date}, ticks = {len(tick_data):>6d}, kept = {len(ref):>6d}, "
+              f"first = {ref.index[0]}, last = {ref.index[-1]}, equal")
+
+    print(f"loop       : {elapsed['loop']:>8.2f} s")
+    print(f"vectorized : {elapsed['vectorized']:>8.2f} s")
+    print(f"speedup    : {elapsed['loop'] / elapsed['vectorized']:>8.2f}x")
+    return 0
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    main(n_ticks=args.ticks, seed=args.seed)
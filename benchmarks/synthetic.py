@@ -0,0 +1,223 @@
+import os
+import zipfile
+import numpy as np
+import pandas as pd
+from husfort.qsqlite import CDbStruct, CSqlTable
+from data_engines import CDataEngineTushareFutDailyMinuteBar, CTickZipReader
+from project_cfg import futures_md, futures_contracts, futures_pos, futures_minute_bar
+
+# trading sessions in seconds of the day, night sessions belong to the next trade date,
+# those past midnight are split at it, like sessions.py does with anchors "prev" and "tail"
+SESSIONS: dict[str, list[tuple[int, int]]] = {
+    "night_2300": [(21 * 3600, 23 * 3600), (9 * 3600, 10 * 3600 + 15 * 60),
+                   (10 * 3600 + 30 * 60, 11 * 3600 + 30 * 60), (13 * 3600 + 30 * 60, 15 * 3600)],
+    "night_0100": [(21 * 3600, 24 * 3600), (0, 1 * 3600), (9 * 3600, 10 * 3600 + 15 * 60),
+                   (10 * 3600 + 30 * 60, 11 * 3600 + 30 * 60), (13 * 3600 + 30 * 60, 15 * 3600)],
+    "night_0230": [(21 * 3600, 24 * 3600), (0, 2 * 3600 + 30 * 60), (9 * 3600, 10 * 3600 + 15 * 60),
+                   (10 * 3600 + 30 * 60, 11 * 3600 + 30 * 60), (13 * 3600 + 30 * 60, 15 * 3600)],
+    "commodity_day": [(9 * 3600, 10 * 3600 + 15 * 60),
+                      (10 * 3600 + 30 * 60, 11 * 3600 + 30 * 60), (13 * 3600 + 30 * 60, 15 * 3600)],
+    "cfx_equity": [(9 * 3600 + 30 * 60, 11 * 3600 + 30 * 60), (13 * 3600, 15 * 3600)],
+    "cfx_bond": [(9 * 3600 + 30 * 60, 11 * 3600 + 30 * 60), (13 * 3600, 15 * 3600 + 15 * 60)],
+}
+
+# instrument -> (exchange, session, price level)
+INSTRUMENTS: dict[str, tuple[str, str, float]] = {
+    "CU": ("SHF", "night_0100", 70000.0),
+    "AU": ("SHF", "night_0230", 480.0),
+    "RB": ("SHF", "night_2300", 3800.0),
+    "SC": ("INE", "night_0230", 550.0),
+    "M": ("DCE", "night_2300", 3100.0),
+    "SR": ("ZCE", "night_2300", 6200.0),
+    "AP": ("ZCE", "commodity_day", 8500.0),
+    "SI": ("GFE", "commodity_day", 13000.0),
+    "IF": ("CFX", "cfx_equity", 3500.0),
+    "IC": ("CFX", "cfx_equity", 5300.0),
+    "T": ("CFX", "cfx_bond", 103.0),
+    "TF": ("CFX", "cfx_bond", 102.0),
+}
+
+# instruments in position data, symbols of SHFE, INE, DCE and GFEX are in lower case
+POS_INSTRUMENTS: list[tuple[str, str]] = [
+    ("rb", "SHFE"), ("cu", "SHFE"), ("au", "SHFE"), ("sc", "INE"), ("m", "DCE"), ("i", "DCE"), ("p", "DCE"),
+    ("TA", "CZCE"), ("SR", "CZCE"), ("MA", "CZCE"), ("si", "GFEX"), ("IF", "CFFEX"), ("IC", "CFFEX"), ("T", "CFFEX"),
+]
+
+BROKERS = [
+    "中信期货", "国泰君安", "永安期货", "银河期货", "海通期货", "华泰期货", "东证期货", "广发期货",
+    "国投安信", "申银万国", "中粮期货", "方正中期", "光大期货", "南华期货", "五矿期货", "徽商期货",
+    "宏源期货", "浙商期货", "招商期货", "中金财富", "建信期货", "鲁证期货", "格林大华", "新湖期货",
+    "一德期货", "信达期货", "华安期货", "国信期货", "兴证期货", "东海期货", "长江期货", "中信建投",
+    "安粮期货", "金瑞期货", "中泰期货", "国元期货", "瑞达期货", "大地期货", "混沌天成", "前海期货",
+]
+
+
+def get_contracts(trade_date: str, n_months: int = 4) -> list[str]:
+    """
+
+    :return: tushare style contracts, like "CU2402.SHF", the nearest n_months of each instrument
+    """
+    y, m = int(trade_date[0:4]), int(trade_date[4:6])
+    contracts: list[str] = []
+    for instru, (exchange, _, _) in INSTRUMENTS.items():
+        for k in range(1, n_months + 1):
+            yy, mm = y + (m + k - 1) // 12, (m + k - 1) % 12 + 1
+            contracts.append(f"{instru}{yy % 100:02d}{mm:02d}.{exchange}")
+    return contracts
+
+
+def make_tick_data(rng: np.random.Generator, n_ticks: int, session: str, price: float) -> pd.DataFrame:
+    """
+
+    :return: juejin style tick data of one contract in one trade date, night session first,
+             Volume and Turnover are cumulative
+    """
+    spans = SESSIONS[session]
+    secs = np.sort(np.concatenate([rng.integers(b, e, n_ticks // len(spans)) for b, e in spans]))
+    secs = np.concatenate([secs[secs >= 18 * 3600], secs[secs < 18 * 3600]])
+    n = len(secs)
+    update_time = pd.to_datetime(secs, unit="s").strftime("%H:%M:%S")
+    last_price = (price + rng.integers(-2, 3, n).cumsum() * price * 1e-4).round(2)
+    volume = rng.integers(0, 20, n).cumsum()
+    return pd.DataFrame({
+        "UpdateTime": update_time,
+        "UpdateMillisec": rng.choice([0, 500], n),
+        "LastPrice": last_price,
+        "Volume": volume,
+        "Turnover": (volume * last_price * 10).round(2),
+        "OpenInterest": (100000 + rng.integers(-5, 6, n).cumsum()).astype(np.float64),
+    })
+
+
+def make_md_data(trade_date: str, contracts: list[str], rng: np.random.Generator) -> pd.DataFrame:
+    """
+
+    :return: raw market data of one trade date, with the same columns as futures_md.fields
+    """
+    n = len(contracts)
+    close = rng.uniform(100, 10000, n).round(2)
+    data = {"ts_code": contracts, "trade_date": trade_date}
+    for field in futures_md.fields[2:]:
+        data[field] = close
+    data.update({
+        "vol": rng.integers(1, 100000, n).astype(np.float64),
+        "amount": rng.uniform(1e4, 1e7, n).round(2),
+        "oi": rng.integers(1, 200000, n).astype(np.float64),
+    })
+    return pd.DataFrame(data)
+
+
+def make_pos_data(n_rows: int, trade_date: str, rng: np.random.Generator) -> pd.DataFrame:
+    """
+
+    :param n_rows: it is capped by the number of (symbol, broker) pairs, about 7800
+    :return: raw positions of one trade date, like the output of CDataEngineTushareFutDailyPos.
+             Brokers are in Chinese, some with "(代客)", instruments are listed by contracts, by
+             themselves, like "rb" or "PTA", and by "ACTV". (symbol, broker) is still unique after
+             reformat, as the primary keys of the table require.
+    """
+    y, m = int(trade_date[0:4]), int(trade_date[4:6])
+    months = [f"{(y + (m + k - 1) // 12) % 100:02d}{(m + k - 1) % 12 + 1:02d}" for k in range(12)]
+    symbols, exchanges = [], []
+    for prefix, exchange in POS_INSTRUMENTS:
+        for symbol in [f"{prefix}{month}" for month in months] + ["PTA" if prefix == "TA" else prefix, f"{prefix}ACTV"]:
+            symbols.append(symbol)
+            exchanges.append(exchange)
+    n_pairs = len(symbols) * len(BROKERS)
+    pairs = np.sort(rng.choice(n_pairs, size=min(n_rows, n_pairs), replace=False))
+    broker = np.array(BROKERS, dtype=object)[pairs % len(BROKERS)]
+    agent = rng.random(len(pairs))
+    broker[agent < 0.03] += "（代客）"
+    broker[(agent >= 0.03) & (agent < 0.05)] += "(代客)"
+    values = {
+        k: rng.integers(0, 10000, len(pairs)).astype(np.float64)
+        for k in ("vol", "vol_chg", "long_hld", "long_chg", "short_hld", "short_chg")
+    }
+    return pd.DataFrame({
+        "trade_date": trade_date,
+        "symbol": np.array(symbols)[pairs // len(BROKERS)],
+        "broker": broker,
+        **values,
+        "exchange": np.array(exchanges)[pairs // len(BROKERS)],
+    })
+
+
+def make_pos_db_struct(db_save_dir: str, db_name: str = "bench_position.db") -> CDbStruct:
+    return CDbStruct(
+        db_save_dir=db_save_dir,
+        db_name=db_name,
+        table=CSqlTable(cfg={
+            "name": "position",
+            "primary_keys": {"trade_date": "TEXT", "ts_code": "TEXT", "broker": "TEXT"},
+            "value_columns": {
+                "vol": "REAL", "vol_chg": "REAL", "long_hld": "REAL", "long_chg": "REAL",
+                "short_hld": "REAL", "short_chg": "REAL", "instrument": "TEXT", "code_type": "INTEGER",
+            },
+        }),
+    )
+
+
+def make_minute_bar_db_struct(db_save_dir: str, db_name: str = "bench_minute_bar.db") -> CDbStruct:
+    return CDbStruct(
+        db_save_dir=db_save_dir,
+        db_name=db_name,
+        table=CSqlTable(cfg={
+            "name": "fMinuteBar",
+            "primary_keys": {"ts_code": "TEXT", "trade_date": "TEXT", "timestamp": "TEXT"},
+            "value_columns": {
+                "open": "REAL", "high": "REAL", "low": "REAL", "close": "REAL",
+                "vol": "REAL", "amount": "REAL", "oi": "REAL",
+            },
+        }),
+    )
+
+
+def build_dataset(root_dir: str, trade_dates: list[str], n_ticks: int, n_pos_rows: int, seed: int) -> dict[str, str]:
+    """
+    write a complete synthetic dataset, in the same layout as the real one
+
+    :param root_dir:
+    :param trade_dates: sorted trade dates
+    :param n_ticks: number of ticks of each contract in each trade date
+    :param n_pos_rows: number of rows of positions in each trade date
+    :param seed:
+    :return: dict of "daily_data_root_dir", "tick_data_root_dir", "calendar_path"
+    """
+    rng = np.random.default_rng(seed)
+    daily_data_root_dir = os.path.join(root_dir, "by_date")
+    tick_data_root_dir = os.path.join(root_dir, "juejindata")
+    zip_files: dict[str, zipfile.ZipFile] = {}
+    for trade_date in trade_dates:
+        save_dir = os.path.join(daily_data_root_dir, trade_date[0:4], trade_date)
+        os.makedirs(save_dir, exist_ok=True)
+        contracts = get_contracts(trade_date)
+        make_md_data(trade_date, contracts, rng).to_csv(
+            os.path.join(save_dir, futures_md.file_format.format(trade_date)), index=False)
+        pd.DataFrame({"contract": contracts}).to_csv(
+            os.path.join(save_dir, futures_contracts.file_format.format(trade_date)), index=False)
+        make_pos_data(n_pos_rows, trade_date, rng).to_csv(
+            os.path.join(save_dir, futures_pos.file_format.format(trade_date)), index=False)
+
+        zip_path = os.path.join(tick_data_root_dir, trade_date[0:4], f"{trade_date[0:6]}.zip")
+        if (zf := zip_files.get(zip_path)) is None:
+            os.makedirs(os.path.dirname(zip_path), exist_ok=True)
+            zf = zip_files[zip_path] = zipfile.ZipFile(zip_path, "w", compression=zipfile.ZIP_DEFLATED)
+        for contract in contracts:
+            _, session, price = INSTRUMENTS[contract.split(".")[0].rstrip("0123456789")]
+            contract_ctp, _ = CDataEngineTushareFutDailyMinuteBar.reformat_contract(contract)
+            tick_data = make_tick_data(rng, n_ticks, session, price)
+            zf.writestr(CTickZipReader.get_member_name(contract_ctp, trade_date), tick_data.to_csv(index=False))
+    for zf in zip_files.values():
+        zf.close()
+
+    # one more date before and after, for previous and next trade date
+    calendar_dates = pd.bdate_range(
+        pd.Timestamp(trade_dates[0]) - pd.offsets.BDay(5), pd.Timestamp(trade_dates[-1]) + pd.offsets.BDay(5)
+    ).strftime("%Y%m%d")
+    calendar_path = os.path.join(root_dir, "calendar.csv")
+    pd.DataFrame({"trade_date": calendar_dates}).to_csv(calendar_path, index=False)
+    return {
+        "daily_data_root_dir": daily_data_root_dir,
+        "tick_data_root_dir": tick_data_root_dir,
+        "calendar_path": calendar_path,
+    }
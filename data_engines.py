@@ -1,85 +1,215 @@
 import os
-import sys
+import io
 import re
 import zipfile
-import time
 import datetime as dt
-import tushare as ts
+import itertools as ittl
+import numpy as np
 import pandas as pd
 import multiprocessing as mp
 from loguru import logger
 from dataclasses import dataclass
+from collections import deque
+from contextlib import contextmanager
+from typing import Iterator
+from concurrent.futures import ThreadPoolExecutor, Future, as_completed
+from multiprocessing.pool import Pool, AsyncResult
 from rich.progress import Progress, TaskID
-from WindPy import w as wapi
-from husfort.qutility import check_and_makedirs, qtimer, SFG, SFR, SFY, error_handler
+from husfort.qutility import check_and_makedirs, qtimer, SFG, SFR, SFY
 from husfort.qcalendar import CCalendar
+from throttle import CRateLimiter, CRetryPolicy, CProviderError, CDownloadSkipped
+from data_info import CSaveDataInfo
+from storage import get_save_path, save_daily_data, find_saved_dates, CWriteBehind
+from metrics import metrics, get_dataset_name
+from sessions import get_session_group, get_session_registry, set_session_registry
 
 pd.set_option('display.unicode.east_asian_width', True)
-logger.add("logs/download_and_update.log")
 
-
-@dataclass(frozen=True)
-class CSaveDataInfo:
-    file_format: str
-    desc: str
-    fields: tuple[str, ...]
+WRITE_QUEUE_SIZE = 2
 
 
 class __CDataEngine:
-    def __init__(self, save_root_dir: str, save_file_format: str, data_desc: str):
+    def __init__(self, save_root_dir: str, save_data_info: CSaveDataInfo, max_workers: int = 1,
+                 retry_policy: CRetryPolicy | None = None, write_queue_size: int = WRITE_QUEUE_SIZE):
+        """
+
+        :param save_root_dir:
+        :param save_data_info: if its file_format ends with ".parquet", data is saved in columnar format
+        :param max_workers: number of dates downloaded concurrently
+        :param retry_policy: only for engines calling data providers
+        :param write_queue_size: dates waiting to be written by a background thread while a range is
+                                 downloaded, 0 means data is written by the thread downloading it
+        """
         self.save_root_dir = save_root_dir
-        self.save_file_format = save_file_format
-        self.data_desc = data_desc
+        self.save_data_info = save_data_info
+        self.save_file_format = save_data_info.file_format
+        self.data_desc = save_data_info.desc
+        self.dataset = get_dataset_name(save_data_info.file_format)
+        self.max_workers = max_workers
+        self.retry_policy = retry_policy
+        self.skipped_dates: dict[str, str] = {}
+        self.write_queue_size = write_queue_size
+        self.writer: CWriteBehind | None = None
+
+    def skip_date(self, trade_date: str, reason: str):
+        logger.error(f"{self.data_desc} for {trade_date} is skipped, {reason}")
+        self.skipped_dates[trade_date] = reason
+
+    def report_skipped_and_retries(self):
+        if self.skipped_dates:
+            logger.warning(f"{len(self.skipped_dates)} dates of {self.data_desc} are skipped: "
+                           f"{', '.join(self.skipped_dates)}, run again to download them")
+        if self.retry_policy is not None:
+            logger.info(f"Retry stats of {self.data_desc}: {self.retry_policy.stats}")
 
     def download_daily_data(self, trade_date: str, task_id: TaskID, pb: Progress) -> pd.DataFrame:
         raise NotImplementedError
 
+    def timed_download_daily_data(self, trade_date: str, task_id: TaskID, pb: Progress) -> pd.DataFrame:
+        with metrics.timer("download_seconds", dataset=self.dataset):
+            return self.download_daily_data(trade_date, task_id=task_id, pb=pb)
+
+    def get_save_path(self, trade_date: str) -> str:
+        return get_save_path(self.save_root_dir, self.save_file_format, trade_date)
+
+    def write_data(self, data: pd.DataFrame, save_path: str, trade_date: str):
+        check_and_makedirs(os.path.dirname(save_path))
+        return save_daily_data(data, save_path, self.save_file_format, self.save_data_info.fields, trade_date,
+                               root_dir=self.save_root_dir, codec=self.save_data_info.codec,
+                               compression_level=self.save_data_info.compression_level)
+
+    def save_data(self, data: pd.DataFrame, save_path: str, trade_date: str):
+        if self.writer is not None:
+            return self.writer.submit(trade_date, self.write_data, data, save_path, trade_date)
+        return self.write_data(data, save_path, trade_date)
+
+    @contextmanager
+    def write_behind(self):
+        """
+        data saved within this context is written by a background thread, all of it
+        is written when the context exits. A date failed to be written does not stop
+        the others, all failed dates are raised together by CWriteBehindError at exit
+
+        """
+        if self.write_queue_size <= 0:
+            yield
+            return
+        with CWriteBehind(self.write_queue_size, name=self.dataset) as self.writer:
+            try:
+                yield
+            finally:
+                self.writer = None
+
+    def download_dates_concurrently(self, todo: list[tuple[str, str]], task_pri: TaskID, task_sub: TaskID,
+                                    pb: Progress):
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            jobs: dict[Future, tuple[str, str]] = {
+                executor.submit(self.timed_download_daily_data, trade_date, task_id=task_sub, pb=pb):
+                    (trade_date, save_path)
+                for trade_date, save_path in todo
+            }
+            try:
+                for job in as_completed(jobs):
+                    trade_date, save_path = jobs[job]
+                    try:
+                        trade_date_data = job.result()
+                        self.save_data(trade_date_data, save_path, trade_date)
+                    except CDownloadSkipped as e:
+                        self.skip_date(trade_date, reason=str(e))
+                    pb.update(task_id=task_pri, description=f"Processing data for {SFG(trade_date)}", advance=1)
+            except BaseException:
+                executor.shutdown(wait=True, cancel_futures=True)
+                raise
+        return 0
+
     @qtimer
-    def download_data_range(self, bgn_date: str, stp_date: str, calendar: CCalendar):
+    def download_data_range(self, bgn_date: str, stp_date: str, calendar: CCalendar, silent: bool = False):
+        """
+
+        :param silent: if True, no progress bar is displayed, set it when engines run in parallel threads,
+                       because rich allows only one live display at once
+        """
         iter_dates = calendar.get_iter_list(bgn_date, stp_date)
-        with Progress() as pb:
+        with Progress(disable=silent) as pb, self.write_behind():
             task_pri = pb.add_task(description="Pri-task description to be updated", total=len(iter_dates))
             task_sub = pb.add_task(description="Sub-task description to be updated")
+            todo: list[tuple[str, str]] = []
+            saved_dates = find_saved_dates(self.save_root_dir, self.save_file_format, iter_dates)
             for trade_date in iter_dates:
-                pb.update(task_id=task_pri, description=f"Processing data for {SFG(trade_date)}")
-                check_and_makedirs(save_dir := os.path.join(self.save_root_dir, trade_date[0:4], trade_date))
-                save_file = self.save_file_format.format(trade_date)
-                save_path = os.path.join(save_dir, save_file)
-                if os.path.exists(save_path):
+                if trade_date in saved_dates:
                     logger.info(f"{self.data_desc} for {trade_date} exists, program will skip it")
+                    pb.update(task_id=task_pri, advance=1)
                 else:
-                    trade_date_data = self.download_daily_data(trade_date, task_id=task_sub, pb=pb)
-                    trade_date_data.to_csv(save_path, index=False)
-                pb.update(task_id=task_pri, advance=1)
+                    todo.append((trade_date, self.get_save_path(trade_date)))
+            self.download_todo(todo, task_pri=task_pri, task_sub=task_sub, pb=pb)
+        self.report_skipped_and_retries()
+        return 0
+
+    def download_todo(self, todo: list[tuple[str, str]], task_pri: TaskID, task_sub: TaskID, pb: Progress):
+        """
+
+        :param todo: list of (trade_date, save_path) to be downloaded
+        """
+        if self.max_workers > 1:
+            return self.download_dates_concurrently(todo, task_pri=task_pri, task_sub=task_sub, pb=pb)
+        for trade_date, save_path in todo:
+            pb.update(task_id=task_pri, description=f"Processing data for {SFG(trade_date)}")
+            try:
+                trade_date_data = self.timed_download_daily_data(trade_date, task_id=task_sub, pb=pb)
+                self.save_data(trade_date_data, save_path, trade_date)
+            except CDownloadSkipped as e:
+                self.skip_date(trade_date, reason=str(e))
+            pb.update(task_id=task_pri, advance=1)
         return 0
 
 
 class __CDataEngineTushare(__CDataEngine):
-    def __init__(self, save_root_dir: str, save_file_format: str, data_desc: str):
+    def __init__(self, save_root_dir: str, save_data_info: CSaveDataInfo,
+                 rate_limiter: CRateLimiter, max_workers: int, retry_policy: CRetryPolicy | None):
+        """
+
+        :param save_root_dir:
+        :param save_data_info:
+        :param rate_limiter: shared by all tushare engines, limits calls per minute of each endpoint
+        :param max_workers: number of dates downloaded concurrently, the real pace is set by rate_limiter
+        :param retry_policy: if None, a default policy is used
+        """
+        import tushare as ts  # imported here, only engines calling tushare need it
+
         # ts.set_token("<KEY>")
         self.api = ts.pro_api()
-        super().__init__(save_root_dir, save_file_format, data_desc)
+        self.rate_limiter = rate_limiter
+        super().__init__(save_root_dir, save_data_info, max_workers=max_workers,
+                         retry_policy=retry_policy or CRetryPolicy())
+
+    def call_api(self, endpoint: str, **kwargs) -> pd.DataFrame:
+        """
+        call api with rate limit and retries, raise CDownloadSkipped if it is given up
+
+        """
+
+        def query() -> pd.DataFrame:
+            self.rate_limiter.acquire(endpoint)
+            with metrics.timer("provider_call_seconds", provider="tushare", endpoint=endpoint):
+                return getattr(self.api, endpoint)(**kwargs)
+
+        return self.retry_policy.call(query)
 
 
 class CDataEngineTushareFutDailyMd(__CDataEngineTushare):
-    def __init__(self, save_root_dir: str, save_data_info: CSaveDataInfo):
+    def __init__(self, save_root_dir: str, save_data_info: CSaveDataInfo,
+                 rate_limiter: CRateLimiter, max_workers: int = 4, retry_policy: CRetryPolicy | None = None):
         self.fields = ",".join(save_data_info.fields)
-        super().__init__(save_root_dir, save_data_info.file_format, save_data_info.desc)
+        super().__init__(save_root_dir, save_data_info, rate_limiter, max_workers, retry_policy)
 
     def download_daily_data(self, trade_date: str, task_id: TaskID, pb: Progress) -> pd.DataFrame:
-        while True:
-            try:
-                time.sleep(0.5)
-                df = self.api.fut_daily(trade_date=trade_date, fields=self.fields)
-                return df
-            except TimeoutError as e:
-                logger.error(e)
-                time.sleep(5)
+        df = self.call_api("fut_daily", trade_date=trade_date, fields=self.fields)
+        return df
 
 
 class CDataEngineTushareFutDailyCntrcts(__CDataEngine):
     def __init__(self, save_root_dir: str, save_data_info: CSaveDataInfo, md_data_info: CSaveDataInfo):
-        super().__init__(save_root_dir, save_data_info.file_format, save_data_info.desc)
+        super().__init__(save_root_dir, save_data_info)
         self.md_data_info = md_data_info
 
     @staticmethod
@@ -88,10 +218,7 @@ class CDataEngineTushareFutDailyCntrcts(__CDataEngine):
         return re.match(pattern=r"^[A-Z]{1,2}[\d]{4}\.[A-Z]{3}$", string=symbol) is not None
 
     def download_daily_data(self, trade_date: str, task_id: TaskID, pb: Progress) -> pd.DataFrame:
-        md_dir = os.path.join(self.save_root_dir, trade_date[0:4], trade_date)
-        md_file = self.md_data_info.file_format.format(trade_date)
-        md_path = os.path.join(md_dir, md_file)
-        md = pd.read_csv(md_path)
+        md = self.md_data_info.load(self.save_root_dir, trade_date)
         contracts = filter(self.is_contract, md["ts_code"])
         df = pd.DataFrame({"contract": contracts})
         return df
@@ -100,7 +227,7 @@ class CDataEngineTushareFutDailyCntrcts(__CDataEngine):
 class CDataEngineTushareFutDailyUnvrs(__CDataEngine):
     def __init__(self, save_root_dir: str, save_data_info: CSaveDataInfo, cntrcts_data_info: CSaveDataInfo,
                  exceptions: set[str]):
-        super().__init__(save_root_dir, save_data_info.file_format, save_data_info.desc)
+        super().__init__(save_root_dir, save_data_info)
         self.cntrcts_data_info = cntrcts_data_info
         self.exceptions: set[str] = exceptions
 
@@ -113,10 +240,7 @@ class CDataEngineTushareFutDailyUnvrs(__CDataEngine):
         return symbol.replace(".ZCE", ".CZC").replace(".CFX", ".CFE")
 
     def download_daily_data(self, trade_date: str, task_id: TaskID, pb: Progress) -> pd.DataFrame:
-        cntrcts_dir = os.path.join(self.save_root_dir, trade_date[0:4], trade_date)
-        cntrcts_file = self.cntrcts_data_info.file_format.format(trade_date)
-        cntrcts_path = os.path.join(cntrcts_dir, cntrcts_file)
-        cntrcts = pd.read_csv(cntrcts_path)["contract"]
+        cntrcts = self.cntrcts_data_info.load(self.save_root_dir, trade_date)["contract"]
         universe_ts = list(set(map(self.to_instrument, cntrcts)) - self.exceptions)
         universe_wd = [self.to_wind_code(_) for _ in universe_ts]
         df = pd.DataFrame({
@@ -126,10 +250,46 @@ class CDataEngineTushareFutDailyUnvrs(__CDataEngine):
         return df
 
 
+# --- minute bar tasks ---
+@dataclass(frozen=True)
+class CMinuteBarTask:
+    trade_date: str
+    prev_trade_date: str
+    instru: str
+    contract: str
+    idx: int  # position of the contract in the output of its trade date
+    tick_zip_path: str
+    member: str
+    save_vars: tuple[str, ...]
+    tick_cache_dir: str | None = None
+
+
+class CMinuteBarAssembler:
+    def __init__(self, todo: dict[str, list[CMinuteBarTask]]):
+        self.dfs: dict[str, list[pd.DataFrame]] = {d: [pd.DataFrame()] * len(tasks) for d, tasks in todo.items()}
+        self.left: dict[str, int] = {d: len(tasks) for d, tasks in todo.items()}
+        self.empty_dates: list[str] = [d for d, tasks in todo.items() if not tasks]  # put is never called for them
+
+    def put(self, task: CMinuteBarTask, minute_bar: pd.DataFrame) -> pd.DataFrame | None:
+        """
+
+        :return: minute bar data of task.trade_date, in the original contract order,
+                 if all its contracts are finished, else None. It has no column if none
+                 of the contracts has tick data
+        """
+        self.dfs[task.trade_date][task.idx] = minute_bar
+        self.left[task.trade_date] -= 1
+        if self.left[task.trade_date] > 0:
+            return None
+        del self.left[task.trade_date]
+        return pd.concat(self.dfs.pop(task.trade_date), axis=0, ignore_index=True)
+
+
 class CDataEngineTushareFutDailyMinuteBar(__CDataEngine):
     def __init__(self, save_root_dir: str, save_data_info: CSaveDataInfo,
                  md_data_info: CSaveDataInfo, cntrcts_data_info: CSaveDataInfo,
-                 tick_data_root_dir: str, calendar: CCalendar, top: int = 3,
+                 tick_data_root_dir: str, calendar: CCalendar, top: int = 3, month_sweep: bool = False,
+                 processes: int | None = None, chunksize: int = 4, tick_cache_dir: str | None = None,
                  ):
         """
 
@@ -140,6 +300,11 @@ class CDataEngineTushareFutDailyMinuteBar(__CDataEngine):
         :param tick_data_root_dir: like 'E:\\OneDrive\\Data\\juejindata'
         :param calendar:
         :param top: how many contracts of each instrument will be downloaded for minute data
+        :param month_sweep: if True, all tick files needed by a month are read in one sequential pass
+                            over the monthly zip, instead of being opened date by date
+        :param processes: number of worker processes, None to use all cores
+        :param chunksize: number of (date, contract) tasks sent to a worker at once
+        :param tick_cache_dir: where decoded tick data is cached, None to parse tick data from zips every time
         """
 
         self.md_data_info = md_data_info
@@ -148,13 +313,14 @@ class CDataEngineTushareFutDailyMinuteBar(__CDataEngine):
         self.tick_data_root_dir = tick_data_root_dir
         self.calendar = calendar
         self.top = top
-        super().__init__(save_root_dir, save_data_info.file_format, save_data_info.desc)
+        self.month_sweep = month_sweep
+        self.processes = processes
+        self.chunksize = chunksize
+        self.tick_cache_dir = tick_cache_dir
+        super().__init__(save_root_dir, save_data_info)
 
     def load_md(self, trade_date) -> pd.DataFrame:
-        md_dir = os.path.join(self.save_root_dir, trade_date[0:4], trade_date)
-        md_file = self.md_data_info.file_format.format(trade_date)
-        md_path = os.path.join(md_dir, md_file)
-        md = pd.read_csv(md_path)
+        md = self.md_data_info.load(self.save_root_dir, trade_date)
         return md
 
     @staticmethod
@@ -165,10 +331,7 @@ class CDataEngineTushareFutDailyMinuteBar(__CDataEngine):
         return md
 
     def load_cntrcts(self, trade_date) -> pd.DataFrame:
-        cntrcts_dir = os.path.join(self.save_root_dir, trade_date[0:4], trade_date)
-        cntrcts_file = self.cntrcts_data_info.file_format.format(trade_date)
-        cntrcts_path = os.path.join(cntrcts_dir, cntrcts_file)
-        cntrcts = pd.read_csv(cntrcts_path)
+        cntrcts = self.cntrcts_data_info.load(self.save_root_dir, trade_date)
         return cntrcts
 
     @staticmethod
@@ -193,42 +356,49 @@ class CDataEngineTushareFutDailyMinuteBar(__CDataEngine):
         elif exchange in ["DCE", "SHF", "INE", "GFE"]:
             return contract_ctp.lower(), exchange
 
+    def get_tick_zip_path(self, trade_date: str) -> str:
+        return os.path.join(self.tick_data_root_dir, trade_date[0:4], f"{trade_date[0:6]}.zip")
+
     def load_contract_file_from_zipfile(self, new_contract: str, trade_date: str) -> pd.DataFrame:
-        zip_path = os.path.join(self.tick_data_root_dir, trade_date[0:4], f"{trade_date[0:6]}.zip")
-        with zipfile.ZipFile(zip_path, mode="r") as zf:
-            files = zf.namelist()
-            target_file = f"{trade_date[0:6]}/{trade_date}/{new_contract}_{trade_date}.csv"
-            if target_file in files:
-                sf = zf.open(target_file)
-                try:
-                    tick_data = pd.read_csv(sf)
-                except pd.errors.EmptyDataError:
-                    logger.info(f"File {SFY(target_file)} has no data")
-                    tick_data = pd.DataFrame()
-                return tick_data
-            else:
-                logger.info(f"{SFR(target_file)} is not found.")
-                return pd.DataFrame()
+        reader = get_tick_zip_reader(self.get_tick_zip_path(trade_date), self.tick_cache_dir)
+        return reader.read_member(CTickZipReader.get_member_name(new_contract, trade_date))
 
     @staticmethod
     def cal_vol_and_to(tick_data: pd.DataFrame) -> None:
         tick_data["Volume"] = tick_data["Volume"] - tick_data["Volume"].shift(1).fillna(0)
         tick_data["Turnover"] = tick_data["Turnover"] - tick_data["Turnover"].shift(1).fillna(0)
 
-    def generate_minute_bar(self, instru: str, contract: str, trade_date: str) -> pd.DataFrame:
-        contract_ctp, exchange = self.reformat_contract(contract)
-        tick_data = self.load_contract_file_from_zipfile(contract_ctp, trade_date)
+    @staticmethod
+    def parse_tick_data(tick_data: pd.DataFrame, task: CMinuteBarTask) -> pd.DataFrame:
         if tick_data.empty:
             return pd.DataFrame()
-        self.cal_vol_and_to(tick_data)
+        _, exchange = CDataEngineTushareFutDailyMinuteBar.reformat_contract(task.contract)
+        CDataEngineTushareFutDailyMinuteBar.cal_vol_and_to(tick_data)
         tick_parser = CTickDataParser(
-            trade_date, contract=contract, instru=instru, exchange=exchange,
-            save_vars=self.fields.split(","), calendar=self.calendar,
+            task.trade_date, contract=task.contract, instru=task.instru, exchange=exchange,
+            save_vars=list(task.save_vars), prev_trade_date=task.prev_trade_date,
         )
         rft_data = tick_parser.main(tick_data=tick_data)
         return rft_data
 
-    def download_daily_data(self, trade_date: str, task_id: TaskID, pb: Progress) -> pd.DataFrame:
+    @staticmethod
+    def generate_minute_bar(task: CMinuteBarTask, content: bytes | None = None,
+                            ) -> tuple[CMinuteBarTask, pd.DataFrame, dict]:
+        """
+        run in worker processes, only the small task object is pickled, and each worker
+        keeps its own cached zip reader
+
+        :param content: tick file of the task read by CTickZipReader.read_content in the main process,
+                        None to read it by the worker
+        :return: task, minute bar, and metrics recorded by the worker since its last task,
+                 to be merged into the metrics of the main process
+        """
+        reader = get_tick_zip_reader(task.tick_zip_path, task.tick_cache_dir)
+        tick_data = reader.parse_member(task.member, content)
+        minute_bar = CDataEngineTushareFutDailyMinuteBar.parse_tick_data(tick_data, task)
+        return task, minute_bar, metrics.drain()
+
+    def get_iter_args(self, trade_date: str) -> list[tuple[str, str]]:
         md = self.reformat_md(self.load_md(trade_date))
         cntrcts = self.load_cntrcts(trade_date)
         md_cntrcts = pd.merge(left=cntrcts, right=md, on="contract", how="left")
@@ -239,358 +409,765 @@ class CDataEngineTushareFutDailyMinuteBar(__CDataEngine):
         for instru, contracts in top_cntrcts_for_instru.items():
             for contract in contracts:
                 iter_args.append((instru, contract))
-        pb.update(task_id, total=len(iter_args), description=f"Processing contracts of {SFG(trade_date)}", completed=0)
-        with mp.get_context("spawn").Pool() as pool:
-            jobs = []
-            for instru, contract in iter_args:
-                job = pool.apply_async(
-                    self.generate_minute_bar,
-                    args=(instru, contract, trade_date),
-                    callback=lambda _: pb.update(task_id, advance=1),
-                    error_callback=error_handler,
-                )
-                jobs.append(job)
-            pool.close()
-            pool.join()
-        dfs: list[pd.DataFrame] = [job.get() for job in jobs]
+        return iter_args
+
+    def get_minute_bar_tasks(self, trade_date: str) -> list[CMinuteBarTask]:
+        prev_trade_date = self.calendar.get_next_date(trade_date, shift=-1)
+        get_session_registry().add_dates([trade_date], [prev_trade_date])
+        tick_zip_path = self.get_tick_zip_path(trade_date)
+        save_vars = tuple(self.fields.split(","))
+        tasks: list[CMinuteBarTask] = []
+        for idx, (instru, contract) in enumerate(self.get_iter_args(trade_date)):
+            contract_ctp, _ = self.reformat_contract(contract)
+            task = CMinuteBarTask(
+                trade_date=trade_date, prev_trade_date=prev_trade_date,
+                instru=instru, contract=contract, idx=idx,
+                tick_zip_path=tick_zip_path, member=CTickZipReader.get_member_name(contract_ctp, trade_date),
+                save_vars=save_vars, tick_cache_dir=self.tick_cache_dir,
+            )
+            tasks.append(task)
+        return tasks
+
+    def make_empty_data(self) -> pd.DataFrame:
+        return pd.DataFrame(columns=list(self.save_data_info.fields))
+
+    def save_minute_bar_data(self, minute_bar_data: pd.DataFrame, trade_date: str, task_pri: TaskID, pb: Progress):
+        """
+
+        :param minute_bar_data: without any column if no contract of trade_date has tick data,
+                                it is saved as make_empty_data, with columns of save_vars
+        """
+        if minute_bar_data.columns.empty:
+            logger.warning(f"No contract of {trade_date} has tick data to parse, {self.data_desc} is saved empty")
+            minute_bar_data = self.make_empty_data()
+        self.save_data(minute_bar_data, self.get_save_path(trade_date), trade_date)
+        pb.update(task_id=task_pri, advance=1)
+        return 0
+
+    def save_empty_dates(self, empty_dates: list[str], task_pri: TaskID, pb: Progress):
+        """
+        dates without any task are saved empty as soon as the assembler is built, so they
+        are recorded as done and count in the progress, instead of being tried again forever
+
+        """
+        for trade_date in empty_dates:
+            self.save_minute_bar_data(pd.DataFrame(), trade_date, task_pri, pb)
+        return 0
+
+    def get_todo_tasks(self, iter_dates: list[str], task_pri: TaskID, pb: Progress) -> dict[str, list[CMinuteBarTask]]:
+        todo: dict[str, list[CMinuteBarTask]] = {}
+        saved_dates = find_saved_dates(self.save_root_dir, self.save_file_format, iter_dates)
+        for trade_date in iter_dates:
+            if trade_date in saved_dates:
+                logger.info(f"{self.data_desc} for {trade_date} exists, program will skip it")
+                pb.update(task_id=task_pri, advance=1)
+            else:
+                todo[trade_date] = self.get_minute_bar_tasks(trade_date)
+        return todo
+
+    def make_pool(self) -> Pool:
+        # workers get a copy of the session registry as it is now, dates added later are looked up again by them
+        return mp.get_context("spawn").Pool(
+            processes=self.processes, initializer=set_session_registry, initargs=(get_session_registry(),),
+        )
+
+    def collect_minute_bar(self, assembler: CMinuteBarAssembler, result: tuple[CMinuteBarTask, pd.DataFrame, dict],
+                           task_pri: TaskID, task_sub: TaskID, pb: Progress):
+        """
+
+        :param result: of generate_minute_bar, its date is saved if all its contracts are finished
+        """
+        task, minute_bar, worker_metrics = result
+        metrics.merge(worker_metrics)
+        if (minute_bar_data := assembler.put(task, minute_bar)) is not None:
+            self.save_minute_bar_data(minute_bar_data, task.trade_date, task_pri, pb)
+        pb.update(task_sub, advance=1)
+        return 0
+
+    def sweep_month(self, month_dates: list[str], pool: Pool, task_pri: TaskID, task_sub: TaskID, pb: Progress):
+        """
+        read all tick files needed by the dates of one month in archive order, so the
+        monthly zip is scanned sequentially once instead of being opened date by date.
+        Files are read by the main process and parsed by the pool. At most chunksize files
+        for each worker are waiting or being parsed, so memory does not grow with the month,
+        which is why apply_async is used here, imap_unordered would read the whole month ahead.
+
+        """
+
+        if not (todo := self.get_todo_tasks(month_dates, task_pri, pb)):
+            return 0
+        assembler = CMinuteBarAssembler(todo)
+        self.save_empty_dates(assembler.empty_dates, task_pri, pb)
+        if not (member_to_task := {task.member: task for tasks in todo.values() for task in tasks}):
+            return 0
+        pb.update(task_sub, total=len(member_to_task), description=f"Sweeping ticks of {SFG(month_dates[0][0:6])}",
+                  completed=0)
+        window = (self.processes or os.cpu_count() or 1) * self.chunksize
+        reader = get_tick_zip_reader(self.get_tick_zip_path(month_dates[0]), self.tick_cache_dir)
+        jobs: deque[AsyncResult] = deque()
+        for member, content in reader.sweep(list(member_to_task)):
+            jobs.append(pool.apply_async(self.generate_minute_bar, (member_to_task[member], content)))
+            if len(jobs) >= window:
+                self.collect_minute_bar(assembler, jobs.popleft().get(), task_pri, task_sub, pb)
+        while jobs:
+            self.collect_minute_bar(assembler, jobs.popleft().get(), task_pri, task_sub, pb)
+        return 0
+
+    @qtimer
+    def sweep_data_range(self, bgn_date: str, stp_date: str, calendar: CCalendar, silent: bool = False):
+        """
+        months are swept one by one, with one pool for the whole range
+
+        """
+        iter_dates = calendar.get_iter_list(bgn_date, stp_date)
+        with Progress(disable=silent) as pb, self.make_pool() as pool:
+            task_pri = pb.add_task(description="Pri-task description to be updated", total=len(iter_dates))
+            task_sub = pb.add_task(description="Sub-task description to be updated")
+            for trade_month, month_dates in ittl.groupby(iter_dates, key=lambda _: _[0:6]):
+                pb.update(task_id=task_pri, description=f"Processing data for {SFG(trade_month)}")
+                self.sweep_month(list(month_dates), pool, task_pri=task_pri, task_sub=task_sub, pb=pb)
+        return 0
 
-        # dfs: list[pd.DataFrame] = []
-        # for instru, contract in iter_args:
-        #     dfs.append(self.generate_minute_bar(instru, contract, trade_date))
+    @qtimer
+    def pool_data_range(self, bgn_date: str, stp_date: str, calendar: CCalendar, silent: bool = False):
+        """
+        one pool for the whole range, tasks are fanned out over (date, contract) pairs,
+        and each date is saved as soon as all its contracts are finished
 
-        minute_bar_data = pd.concat(dfs, axis=0, ignore_index=True)
-        return minute_bar_data
+        """
+        iter_dates = calendar.get_iter_list(bgn_date, stp_date)
+        with Progress(disable=silent) as pb:
+            task_pri = pb.add_task(description="Pri-task description to be updated", total=len(iter_dates))
+            task_sub = pb.add_task(description="Sub-task description to be updated")
+            pb.update(task_id=task_pri, description=f"Processing data from {SFG(bgn_date)} to {SFG(stp_date)}")
+            if not (todo := self.get_todo_tasks(iter_dates, task_pri, pb)):
+                return 0
+            assembler = CMinuteBarAssembler(todo)
+            self.save_empty_dates(assembler.empty_dates, task_pri, pb)
+            if not (tasks := [task for date_tasks in todo.values() for task in date_tasks]):
+                return 0
+            pb.update(task_sub, total=len(tasks), description="Processing contracts", completed=0)
+            # boundaries of all dates are in the registry now, as tasks are made, workers get a copy once
+            with self.make_pool() as pool:
+                for result in pool.imap_unordered(self.generate_minute_bar, tasks, chunksize=self.chunksize):
+                    self.collect_minute_bar(assembler, result, task_pri, task_sub, pb)
+        return 0
+
+    def download_data_range(self, bgn_date: str, stp_date: str, calendar: CCalendar, silent: bool = False):
+        with self.write_behind():
+            if self.month_sweep:
+                return self.sweep_data_range(bgn_date, stp_date, calendar, silent=silent)
+            return self.pool_data_range(bgn_date, stp_date, calendar, silent=silent)
 
 
 class CDataEngineTushareFutDailyPos(__CDataEngineTushare):
-    def __init__(self, save_root_dir: str, save_data_info: CSaveDataInfo, exchanges: list[str]):
+    def __init__(self, save_root_dir: str, save_data_info: CSaveDataInfo, exchanges: list[str],
+                 rate_limiter: CRateLimiter, max_workers: int = 4, retry_policy: CRetryPolicy | None = None):
         self.fields = ",".join(save_data_info.fields)
         self.exchanges = exchanges
-        super().__init__(save_root_dir, save_data_info.file_format, save_data_info.desc)
+        super().__init__(save_root_dir, save_data_info, rate_limiter, max_workers, retry_policy)
+
+    def download_exchange_data(self, trade_date: str, exchange: str) -> pd.DataFrame:
+        return self.call_api("fut_holding", trade_date=trade_date, exchange=exchange, fields=self.fields)
 
     def download_daily_data(self, trade_date: str, task_id: TaskID, pb: Progress) -> pd.DataFrame:
-        while True:
-            try:
-                dfs: list[pd.DataFrame] = []
-                for exchange in self.exchanges:
-                    time.sleep(0.2)
-                    exchange_data = self.api.fut_holding(
-                        trade_date=trade_date,
-                        exchange=exchange,
-                        fields=self.fields,
-                    )
-                    if not exchange_data.empty:
-                        dfs.append(exchange_data)
-                df = pd.concat(dfs, axis=0, ignore_index=True)
-                return df
-            except TimeoutError as e:
-                logger.error(e)
-                time.sleep(5)
+        with ThreadPoolExecutor(max_workers=len(self.exchanges)) as executor:
+            exchanges_data = list(executor.map(
+                lambda exchange: self.download_exchange_data(trade_date, exchange), self.exchanges,
+            ))
+        dfs: list[pd.DataFrame] = [_ for _ in exchanges_data if not _.empty]
+        df = pd.concat(dfs, axis=0, ignore_index=True)
+        return df
 
 
 class __CDataEngineWind(__CDataEngine):
-    def __init__(self, save_root_dir: str, save_file_format: str, data_desc: str, unvrs_data_info: CSaveDataInfo):
-        self.api = wapi
+    def __init__(self, save_root_dir: str, save_data_info: CSaveDataInfo, unvrs_data_info: CSaveDataInfo,
+                 rate_limiter: CRateLimiter, retry_policy: CRetryPolicy | None, range_batch: int, api):
+        """
+
+        :param save_root_dir:
+        :param save_data_info:
+        :param unvrs_data_info:
+        :param rate_limiter: shared by all wind engines, limits calls per minute of "wss" and "wsd"
+        :param retry_policy: if None, a default policy is used
+        :param range_batch: if > 0, dates are downloaded in batches of this size with wsd,
+                            else they are downloaded one by one with wss
+        :param api: object with the same interface as WindPy.w, if None, WindPy.w is used
+        """
+        if api is None:
+            from WindPy import w as api  # imported here, loading WindPy starts the wind terminal bridge
+        self.api = api
         self.api.start()
         self.unvrs_data_info = unvrs_data_info
-        super().__init__(save_root_dir, save_file_format, data_desc)
+        self.rate_limiter = rate_limiter
+        self.range_batch = range_batch
+        super().__init__(save_root_dir, save_data_info, retry_policy=retry_policy or CRetryPolicy())
+
+    def split_universe(self, universe: pd.DataFrame) -> list[tuple[list[str], dict[str, str]]]:
+        """
+
+        :param universe: with column "wd_code"
+        :return: list of (wind codes, indicators), indicators map wind fields to column names
+        """
+        raise NotImplementedError
 
     @staticmethod
-    def convert_data_to_dataframe(downloaded_data, download_values: list[str], col_names: list[str]) -> pd.DataFrame:
+    def check_error_code(downloaded_data):
         if downloaded_data.ErrorCode != 0:
-            logger.error(f"When download data from WIND, ErrorCode = {downloaded_data.ErrorCode}.")
-            logger.info("Program will terminate at once, please check again.")
-            sys.exit()
-        else:
-            df = pd.DataFrame(downloaded_data.Data, index=download_values, columns=col_names).T
-            return df
+            raise CProviderError(provider="WIND", code=downloaded_data.ErrorCode, msg=str(downloaded_data.Data))
 
-    def load_universe(self, trade_date: str) -> pd.DataFrame:
-        unvrs_file = self.unvrs_data_info.file_format.format(trade_date)
-        unvrs_dir = os.path.join(self.save_root_dir, trade_date[0:4], trade_date)
-        unvrs_path = os.path.join(unvrs_dir, unvrs_file)
-        unvrs_data = pd.read_csv(unvrs_path)
-        return unvrs_data
+    @classmethod
+    def convert_data_to_dataframe(cls, downloaded_data, download_values: list[str], col_names: list[str]) -> pd.DataFrame:
+        cls.check_error_code(downloaded_data)
+        df = pd.DataFrame(downloaded_data.Data, index=download_values, columns=col_names).T
+        return df
 
+    def download_wss(self, codes: list[str], indicators: dict[str, str], trade_date: str) -> pd.DataFrame:
+        """
+        call wss with rate limit and retries, raise CDownloadSkipped if it is given up
 
-class CDataEngineWindFutDailyBasis(__CDataEngineWind):
-    def __init__(self, save_root_dir: str, save_data_info: CSaveDataInfo, unvrs_data_info: CSaveDataInfo):
-        super().__init__(save_root_dir, save_data_info.file_format, save_data_info.desc, unvrs_data_info)
+        :param codes: wind codes
+        :param indicators: wind fields to column names
+        :param trade_date:
+        :return:
+        """
 
-    def download_daily_data(self, trade_date: str, task_id: TaskID, pb: Progress) -> pd.DataFrame:
-        while True:
-            try:
-                time.sleep(0.5)
-                universe = self.load_universe(trade_date)
-                universe["isInCFE"] = universe["wd_code"].map(lambda _: _.split(".")[1] == "CFE")
-                unvrs_f = universe.loc[universe["isInCFE"], "wd_code"].tolist()
-                unvrs_c = universe.loc[~universe["isInCFE"], "wd_code"].tolist()
-
-                # download financial
-                indicators = {
-                    "anal_basis_stkidx": "basis",
-                    "anal_basispercent_stkidx": "basis_rate",
-                    "anal_basisannualyield_stkidx": "basis_annual",
-                }
-                f_data = self.api.wss(codes=unvrs_f, fields=list(indicators), options=f"tradeDate={trade_date}")
-                df_f = self.convert_data_to_dataframe(f_data, download_values=list(indicators), col_names=unvrs_f)
-                df_f = df_f.rename(mapper=indicators, axis=1)
-
-                # download commodity
-                indicators = {
-                    "anal_basis": "basis",
-                    "anal_basispercent2": "basis_rate",
-                    "basisannualyield": "basis_annual",
-                }
-                c_data = self.api.wss(codes=unvrs_c, fields=list(indicators), options=f"tradeDate={trade_date}")
-                df_c = self.convert_data_to_dataframe(c_data, download_values=list(indicators), col_names=unvrs_c)
-                df_c = df_c.rename(mapper=indicators, axis=1)
-
-                # concat
-                df = pd.concat([df_f, df_c], axis=0, ignore_index=False)
-                res = pd.merge(
-                    left=universe[["ts_code", "wd_code"]],
-                    right=df,
-                    left_on="wd_code",
-                    right_index=True,
-                    how="left",
+        def wss() -> pd.DataFrame:
+            self.rate_limiter.acquire("wss")
+            with metrics.timer("provider_call_seconds", provider="wind", endpoint="wss"):
+                downloaded_data = self.api.wss(
+                    codes=codes, fields=list(indicators), options=f"tradeDate={trade_date}",
                 )
-                return res
-            except TimeoutError as e:
-                logger.error(e)
-                time.sleep(5)
+            return self.convert_data_to_dataframe(downloaded_data, download_values=list(indicators), col_names=codes)
 
+        df = self.retry_policy.call(wss)
+        return df.rename(mapper=indicators, axis=1)
 
-class CDataEngineWindFutDailyStock(__CDataEngineWind):
-    def __init__(self, save_root_dir: str, save_data_info: CSaveDataInfo, unvrs_data_info: CSaveDataInfo):
-        super().__init__(save_root_dir, save_data_info.file_format, save_data_info.desc, unvrs_data_info)
+    def download_wsd(self, codes: list[str], field: str, bgn_date: str, end_date: str) -> pd.DataFrame:
+        """
+        call wsd with rate limit and retries for one field of many codes, raise CDownloadSkipped if it is given up
+
+        :return: a DataFrame with index = trade dates in format "YYYYMMDD", columns = codes
+        """
+
+        def wsd() -> pd.DataFrame:
+            self.rate_limiter.acquire("wsd")
+            with metrics.timer("provider_call_seconds", provider="wind", endpoint="wsd"):
+                downloaded_data = self.api.wsd(codes, field, bgn_date, end_date, "")
+            self.check_error_code(downloaded_data)
+            trade_dates = [t.strftime("%Y%m%d") for t in downloaded_data.Times]
+            return pd.DataFrame(downloaded_data.Data, index=downloaded_data.Codes, columns=trade_dates).T
+
+        return self.retry_policy.call(wsd)
+
+    def load_universe(self, trade_date: str) -> pd.DataFrame:
+        unvrs_data = self.unvrs_data_info.load(self.save_root_dir, trade_date)
+        return unvrs_data
+
+    @staticmethod
+    def merge_universe(universe: pd.DataFrame, dfs: list[pd.DataFrame]) -> pd.DataFrame:
+        df = pd.concat(dfs, axis=0, ignore_index=False)
+        res = pd.merge(
+            left=universe[["ts_code", "wd_code"]],
+            right=df,
+            left_on="wd_code",
+            right_index=True,
+            how="left",
+        )
+        return res
 
     def download_daily_data(self, trade_date: str, task_id: TaskID, pb: Progress) -> pd.DataFrame:
-        while True:
+        universe = self.load_universe(trade_date)
+        dfs: list[pd.DataFrame] = []
+        for codes, indicators in self.split_universe(universe):
+            dfs.append(self.download_wss(codes=codes, indicators=indicators, trade_date=trade_date))
+        return self.merge_universe(universe, dfs)
+
+    def download_batch_data(self, trade_dates: list[str]) -> dict[str, pd.DataFrame]:
+        """
+        download data for the union of universes of all trade dates with a few
+        multi-date wsd requests, then split them by date
+
+        :param trade_dates: sorted trade dates
+        :return: a dict, with trade date as key, and data of that date as value
+        """
+        universes = {trade_date: self.load_universe(trade_date) for trade_date in trade_dates}
+        unvrs_union = pd.concat(universes.values(), axis=0, ignore_index=True).drop_duplicates(subset="wd_code")
+        groups: list[tuple[list[str], dict[str, pd.DataFrame]]] = []
+        for codes, indicators in self.split_universe(unvrs_union):
+            wide_data = {
+                col_name: self.download_wsd(codes, field, bgn_date=trade_dates[0], end_date=trade_dates[-1])
+                for field, col_name in indicators.items()
+            }
+            groups.append((codes, wide_data))
+
+        res: dict[str, pd.DataFrame] = {}
+        for trade_date, universe in universes.items():
+            dfs: list[pd.DataFrame] = []
+            for codes, wide_data in groups:
+                df = pd.DataFrame({
+                    col_name: wide.loc[trade_date] if trade_date in wide.index else pd.Series(index=codes)
+                    for col_name, wide in wide_data.items()
+                })
+                dfs.append(df)
+            res[trade_date] = self.merge_universe(universe, dfs)
+        return res
+
+    def download_todo(self, todo: list[tuple[str, str]], task_pri: TaskID, task_sub: TaskID, pb: Progress):
+        if self.range_batch <= 0:
+            return super().download_todo(todo, task_pri=task_pri, task_sub=task_sub, pb=pb)
+        for i in range(0, len(todo), self.range_batch):
+            batch = todo[i:i + self.range_batch]
+            pb.update(task_id=task_pri, description=f"Processing data from {SFG(batch[0][0])} to {SFG(batch[-1][0])}")
             try:
-                time.sleep(0.5)
-                universe = self.load_universe(trade_date)
-                unvrs = universe["wd_code"].tolist()
-                indicators = {"st_stock": "stock"}
-                stock_data = self.api.wss(codes=unvrs, fields=list(indicators), options=f"tradeDate={trade_date}")
-                df = self.convert_data_to_dataframe(stock_data, download_values=list(indicators), col_names=unvrs)
-                df = df.rename(mapper=indicators, axis=1)
-                res = pd.merge(
-                    left=universe[["ts_code", "wd_code"]],
-                    right=df,
-                    left_on="wd_code",
-                    right_index=True,
-                    how="left",
-                )
-                return res
-            except TimeoutError as e:
-                logger.error(e)
-                time.sleep(5)
+                with metrics.timer("download_seconds", dataset=self.dataset):
+                    batch_data = self.download_batch_data([trade_date for trade_date, _ in batch])
+                for trade_date, save_path in batch:
+                    self.save_data(batch_data[trade_date], save_path, trade_date)
+            except CDownloadSkipped as e:
+                for trade_date, _ in batch:
+                    self.skip_date(trade_date, reason=str(e))
+            pb.update(task_id=task_pri, advance=len(batch))
+        return 0
 
 
-# --- tick data aggregate ---
-class CTickDataParser:
-    EQT_TRADE_TIME_CHG_DATE = "20160101"
+class CDataEngineWindFutDailyBasis(__CDataEngineWind):
+    def __init__(self, save_root_dir: str, save_data_info: CSaveDataInfo, unvrs_data_info: CSaveDataInfo,
+                 rate_limiter: CRateLimiter, retry_policy: CRetryPolicy | None = None, range_batch: int = 0, api=None):
+        super().__init__(save_root_dir, save_data_info, unvrs_data_info, rate_limiter, retry_policy, range_batch, api)
+
+    def split_universe(self, universe: pd.DataFrame) -> list[tuple[list[str], dict[str, str]]]:
+        is_in_cfe = universe["wd_code"].map(lambda _: _.split(".")[1] == "CFE")
+        unvrs_f = universe.loc[is_in_cfe, "wd_code"].tolist()
+        unvrs_c = universe.loc[~is_in_cfe, "wd_code"].tolist()
+
+        # financial
+        indicators_f = {
+            "anal_basis_stkidx": "basis",
+            "anal_basispercent_stkidx": "basis_rate",
+            "anal_basisannualyield_stkidx": "basis_annual",
+        }
+
+        # commodity
+        indicators_c = {
+            "anal_basis": "basis",
+            "anal_basispercent2": "basis_rate",
+            "basisannualyield": "basis_annual",
+        }
+        return [(unvrs_f, indicators_f), (unvrs_c, indicators_c)]
 
-    def __init__(
-            self, trade_date: str, contract: str, instru: str, exchange: str,
-            save_vars: list[str], calendar: CCalendar,
-    ):
-        self.contract = contract
-        self.instru, self.exchange = instru, exchange
-        self.save_vars = save_vars
-        self.this_trade_date = trade_date
-        self.prev_trade_date = calendar.get_next_date(self.this_trade_date, shift=-1)
-        self.t_date = dt.datetime.strptime(self.this_trade_date, "%Y%m%d")
-        self.p_date = dt.datetime.strptime(self.prev_trade_date, "%Y%m%d")
-        self.l_date = self.p_date + dt.timedelta(days=1)
-        self.tail_trade_date = self.l_date.strftime("%Y%m%d")
-
-    def __parse_date_from_time(self, t_time: str):
-        if t_time <= "04:00:00":
-            return self.tail_trade_date
-        elif t_time <= "16:00:00":
-            return self.this_trade_date
-        else:
-            return self.prev_trade_date
 
-    def add_trade_date(self, tick_data: pd.DataFrame) -> None:
-        tick_data["trade_date"] = tick_data["UpdateTime"].map(self.__parse_date_from_time)
+class CDataEngineWindFutDailyStock(__CDataEngineWind):
+    def __init__(self, save_root_dir: str, save_data_info: CSaveDataInfo, unvrs_data_info: CSaveDataInfo,
+                 rate_limiter: CRateLimiter, retry_policy: CRetryPolicy | None = None, range_batch: int = 0, api=None):
+        super().__init__(save_root_dir, save_data_info, unvrs_data_info, rate_limiter, retry_policy, range_batch, api)
+
+    def split_universe(self, universe: pd.DataFrame) -> list[tuple[list[str], dict[str, str]]]:
+        unvrs = universe["wd_code"].tolist()
+        indicators = {"st_stock": "stock"}
+        return [(unvrs, indicators)]
+
+
+# --- decoded tick cache ---
+# narrow dtypes of the columns kept in the cache, UpdateTime is saved as seconds of the day.
+# A column falls back to its dtype in the csv if it can not be narrowed without loss.
+TICK_CACHE_DTYPES: dict[str, str] = {
+    "UpdateTime": "<i4",
+    "UpdateMillisec": "<i2",
+    "LastPrice": "<f8",
+    "Volume": "<i4",
+    "Turnover": "<f8",
+    "OpenInterest": "<i4",
+}
+
+
+class CTickCache:
+    def __init__(self, cache_dir: str):
+        """
+        Decoded tick data of each contract-day, one .npy file of a single record, whose fields
+        are the columns as sub-arrays, so every column is contiguous in the file and can be
+        memory-mapped. The name of each file carries the crc32 of its source member in the
+        zip, so a cache file is never used once the member is replaced.
+
+        :param cache_dir: like 'E:\\Data\\juejindata_cache', better on a local disk
+        """
+        self.cache_dir = cache_dir
+
+    def get_cache_path(self, member: str, info: zipfile.ZipInfo) -> str:
+        """
+
+        :param member: like "202401/20240102/cu2402_20240102.csv"
+        :param info: of the member in the zip
+        :return: like "{cache_dir}/2024/202401/20240102/cu2402_20240102_1a2b3c4d.npy"
+        """
+        month, trade_date, file_name = member.split("/")
+        stem = os.path.splitext(file_name)[0]
+        return os.path.join(self.cache_dir, month[0:4], month, trade_date, f"{stem}_{info.CRC:08x}.npy")
 
     @staticmethod
-    def add_ticks(tick_data: pd.DataFrame) -> None:
-        tick_data["ts"] = tick_data[["trade_date", "UpdateTime", "UpdateMillisec"]].apply(
-            lambda z: f"{z['trade_date']} {z['UpdateTime']}.{z['UpdateMillisec']:03d}", axis=1)
-        # tick_data["ts"] = tick_data["ts"].map(lambda _: dt.datetime.strptime(_, "%Y%m%d %H:%M:%S.%f"))
-        tick_data["ts"] = pd.to_datetime(tick_data["ts"])
-        tick_data.set_index(keys="ts", inplace=True)
+    def narrow(values: np.ndarray, dtype: str) -> np.ndarray:
+        narrowed = values.astype(dtype)
+        return narrowed if np.array_equal(narrowed, values) else values
 
     @staticmethod
-    def __revise_to_end(db: dt.datetime, de: dt.datetime, i: int, timestamp: dt.datetime, s: list[dt.datetime]) -> bool:
-        if db <= timestamp <= de:
-            s[i] = de
-            return True
-        return False
+    def encode(tick_data: pd.DataFrame) -> np.ndarray | None:
+        """
+
+        :return: a single record with a sub-array for each column, None if tick data can not be encoded
+        """
+        if not set(TICK_CACHE_DTYPES).issubset(tick_data.columns):
+            return None
+        update_time = pd.to_timedelta(tick_data["UpdateTime"], errors="coerce").to_numpy(dtype="timedelta64[ns]")
+        if np.isnat(update_time).any() or (update_time.view(np.int64) % 10 ** 9).any():
+            return None
+        columns: dict[str, np.ndarray] = {"UpdateTime": update_time.view(np.int64) // 10 ** 9}
+        for name in TICK_CACHE_DTYPES:
+            if name != "UpdateTime":
+                columns[name] = tick_data[name].to_numpy()
+        columns = {name: CTickCache.narrow(values, TICK_CACHE_DTYPES[name]) for name, values in columns.items()}
+        n = len(tick_data)
+        record = np.zeros(1, dtype=[(name, values.dtype, (n,)) for name, values in columns.items()])
+        for name, values in columns.items():
+            record[0][name] = values
+        return record
 
     @staticmethod
-    def __revise_to_bgn(db: dt.datetime, de: dt.datetime, i: int, timestamp: dt.datetime, s: list[dt.datetime]) -> bool:
-        if db <= timestamp <= de:
-            s[i] = db - dt.timedelta(milliseconds=1)
-            return True
-        return False
+    def decode(record: np.ndarray) -> pd.DataFrame:
+        # columns are views on the record, nothing is copied if it is memory-mapped
+        return pd.DataFrame({name: record[0][name] for name in record.dtype.names}, copy=False)
 
-    def __revise_non_cfx(self, tick_data: pd.DataFrame) -> pd.DataFrame:
-        # night
-        d0b = self.p_date + dt.timedelta(hours=20, minutes=59)
-        d0e = self.p_date + dt.timedelta(hours=21, minutes=0)
+    def load(self, member: str, info: zipfile.ZipInfo) -> pd.DataFrame | None:
+        """
 
-        d1b = self.l_date + dt.timedelta(hours=2, minutes=30)
-        d1e = self.l_date + dt.timedelta(hours=2, minutes=35)
+        :return: tick data decoded from the memory-mapped cache file, None if it is not cached
+        """
+        cache_path = self.get_cache_path(member, info)
+        if not os.path.exists(cache_path):
+            metrics.inc("cache_requests_total", cache="tick_cache", result="miss")
+            return None
+        metrics.inc("cache_requests_total", cache="tick_cache", result="hit")
+        with metrics.timer("tick_cache_load_seconds"):
+            tick_data = self.decode(np.load(cache_path, mmap_mode="r"))
+        metrics.record_io("juejin_tick_cache", member.split("/")[1], "read", rows=len(tick_data),
+                          nbytes=os.path.getsize(cache_path))
+        return tick_data
+
+    def save(self, member: str, info: zipfile.ZipInfo, tick_data: pd.DataFrame) -> pd.DataFrame:
+        """
+        save tick data to the cache, by a temporary file and then a rename, so workers never
+        read a partial file
 
-        # morning
-        d2b = self.t_date + dt.timedelta(hours=8, minutes=59)
-        d2e = self.t_date + dt.timedelta(hours=9, minutes=0)
+        :return: tick data decoded from what is cached, the same as what load returns later,
+                 or tick data itself if it can not be cached
+        """
+        if (record := self.encode(tick_data)) is None:
+            logger.info(f"Ticks of {SFY(member)} can not be cached")
+            return tick_data
+        cache_path = self.get_cache_path(member, info)
+        tmp_path = f"{cache_path}.{os.getpid()}.tmp"
+        try:
+            check_and_makedirs(os.path.dirname(cache_path))
+            with open(tmp_path, "wb") as f:
+                np.save(f, record)
+            os.replace(tmp_path, cache_path)
+        except OSError as e:
+            logger.warning(f"Failed to cache ticks of {SFY(member)}: {e}")
+            return self.decode(record)
+        metrics.record_io("juejin_tick_cache", member.split("/")[1], "written", rows=len(tick_data),
+                          nbytes=os.path.getsize(cache_path))
+        return self.decode(record)
+
+
+# --- tick data zip reader ---
+class CTickZipReader:
+    def __init__(self, zip_path: str, cache_dir: str | None = None):
+        """
 
-        d3b = self.t_date + dt.timedelta(hours=10, minutes=15)
-        d3e = self.t_date + dt.timedelta(hours=10, minutes=16)
+        :param zip_path: monthly juejin tick data zip, like 'E:\\OneDrive\\Data\\juejindata\\2024\\202401.zip'
+        :param cache_dir: root dir of CTickCache, None to parse tick data from the zip every time
+        """
+        self.zip_path = zip_path
+        self.zf = zipfile.ZipFile(zip_path, mode="r")
+        self.members: dict[str, zipfile.ZipInfo] = {info.filename: info for info in self.zf.infolist()}
+        self.tick_cache = None if cache_dir is None else CTickCache(cache_dir)
 
-        # middle
-        d4b = self.t_date + dt.timedelta(hours=10, minutes=29)
-        d4e = self.t_date + dt.timedelta(hours=10, minutes=30)
+    @staticmethod
+    def get_member_name(contract_ctp: str, trade_date: str) -> str:
+        return f"{trade_date[0:6]}/{trade_date}/{contract_ctp}_{trade_date}.csv"
 
-        d5b = self.t_date + dt.timedelta(hours=11, minutes=30)
-        d5e = self.t_date + dt.timedelta(hours=11, minutes=31)
+    def read_content(self, member: str) -> bytes | None:
+        """
 
-        # afternoon
-        d6b = self.t_date + dt.timedelta(hours=13, minutes=29)
-        d6e = self.t_date + dt.timedelta(hours=13, minutes=30)
+        :return: the decompressed tick file, None if it is not found, or it is in the tick cache
+        """
+        if (info := self.members.get(member)) is None:
+            return None
+        if self.tick_cache is not None and os.path.exists(self.tick_cache.get_cache_path(member, info)):
+            return None
+        with metrics.timer("tick_decompress_seconds"):
+            with self.zf.open(info) as sf:
+                return sf.read()
+
+    def read_member(self, member: str) -> pd.DataFrame:
+        return self.parse_member(member, content=None)
+
+    def parse_member(self, member: str, content: bytes | None) -> pd.DataFrame:
+        """
 
-        d7b = self.t_date + dt.timedelta(hours=15, minutes=0)
-        d7e = self.t_date + dt.timedelta(hours=15, minutes=5)
+        :param content: from read_content, maybe of another reader of the same zip,
+                        None to load the member from the tick cache, or from the zip
+        """
+        if (info := self.members.get(member)) is None:
+            logger.info(f"{SFR(member)} is not found.")
+            return pd.DataFrame()
+        if content is None:
+            if self.tick_cache is not None and (tick_data := self.tick_cache.load(member, info)) is not None:
+                return tick_data
+            with metrics.timer("tick_decompress_seconds"):
+                with self.zf.open(info) as sf:
+                    content = sf.read()
+        with metrics.timer("tick_parse_csv_seconds"):
+            try:
+                tick_data = pd.read_csv(io.BytesIO(content))
+            except pd.errors.EmptyDataError:
+                logger.info(f"File {SFY(member)} has no data")
+                tick_data = pd.DataFrame()
+        metrics.record_io("juejin_tick", member.split("/")[1], "read", rows=len(tick_data), nbytes=info.compress_size)
+        if self.tick_cache is not None and not tick_data.empty:
+            tick_data = self.tick_cache.save(member, info, tick_data)
+        return tick_data
+
+    def sweep(self, members: list[str]) -> Iterator[tuple[str, bytes | None]]:
+        """
+        yield (member, read_content(member)) for all members, existing ones in the order
+        they are stored in the archive, so the zip file is read in one sequential pass
 
-        ts_lst = tick_data.index.tolist()
-        for i, timestamp in enumerate(ts_lst):
-            if self.__revise_to_end(d0b, d0e, i, timestamp, ts_lst):
-                continue
-            if self.__revise_to_bgn(d1b, d1e, i, timestamp, ts_lst):
-                continue
-            if self.__revise_to_end(d2b, d2e, i, timestamp, ts_lst):
-                continue
-            if self.__revise_to_bgn(d3b, d3e, i, timestamp, ts_lst):
-                continue
-            if self.__revise_to_end(d4b, d4e, i, timestamp, ts_lst):
-                continue
-            if self.__revise_to_bgn(d5b, d5e, i, timestamp, ts_lst):
-                continue
-            if self.__revise_to_end(d6b, d6e, i, timestamp, ts_lst):
-                continue
-            if self.__revise_to_bgn(d7b, d7e, i, timestamp, ts_lst):
-                continue
-        tick_data.index = ts_lst
-        truncated_data = tick_data.query(
-            f"(index >= '{d0e}' & index < '{d1b}')  | (index >= '{d2e}' & index < '{d7b}')"
-        )
-        return truncated_data
+        """
+        found = [m for m in members if m in self.members]
+        for member in set(members) - set(found):
+            yield member, None
+        for member in sorted(found, key=lambda _: self.members[_].header_offset):
+            yield member, self.read_content(member)
+
+    def close(self):
+        self.zf.close()
+
+
+TICK_ZIP_READERS_MAX_OPEN = 2
+_tick_zip_readers: dict[str, CTickZipReader] = {}
 
-    def __revise_cfx_equity(self, tick_data: pd.DataFrame) -> pd.DataFrame:
-        # morning section
-        if self.this_trade_date < self.EQT_TRADE_TIME_CHG_DATE:
-            d0b = self.t_date + dt.timedelta(hours=9, minutes=10)
-            d0e = self.t_date + dt.timedelta(hours=9, minutes=15)
+
+def get_tick_zip_reader(zip_path: str, cache_dir: str | None = None) -> CTickZipReader:
+    """
+    readers are cached per process, so each monthly zip is opened and indexed
+    once per worker. Only the latest TICK_ZIP_READERS_MAX_OPEN zips are kept open.
+    All readers of a process are expected to use the same cache_dir.
+
+    """
+    if (reader := _tick_zip_readers.pop(zip_path, None)) is None:
+        metrics.inc("cache_requests_total", cache="tick_zip_reader", result="miss")
+        reader = CTickZipReader(zip_path, cache_dir)
+        while len(_tick_zip_readers) >= TICK_ZIP_READERS_MAX_OPEN:
+            _tick_zip_readers.pop(next(iter(_tick_zip_readers))).close()
+    else:
+        metrics.inc("cache_requests_total", cache="tick_zip_reader", result="hit")
+    _tick_zip_readers[zip_path] = reader
+    return reader
+
+
+# --- minute bar kernel ---
+@dataclass(frozen=True)
+class CMinuteBars:
+    timestamp: np.ndarray  # datetime64[ns], open time of each bar
+    open: np.ndarray
+    high: np.ndarray
+    low: np.ndarray
+    close: np.ndarray
+    vol: np.ndarray
+    amount: np.ndarray
+    oi: np.ndarray
+
+    def to_dataframe(self, columns: list[str] | None = None, **constants) -> pd.DataFrame:
+        """
+
+        :param columns: columns of the result, default is all bar fields in order
+        :param constants: constant columns, like ts_code="CU2409.SHF"
+        :return:
+        """
+        data = {
+            "timestamp": self.timestamp,
+            "open": self.open,
+            "high": self.high,
+            "low": self.low,
+            "close": self.close,
+            "vol": self.vol,
+            "amount": self.amount,
+            "oi": self.oi,
+            **constants,
+        }
+        columns = columns or list(data)
+        return pd.DataFrame({c: data[c] for c in columns}, index=pd.RangeIndex(len(self.timestamp)))
+
+
+def group_bounds(codes: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+    """
+
+    :param codes: sorted group codes
+    :return: (starts, ends) of each group of equal codes, ends are exclusive
+    """
+    if len(codes) == 0:
+        return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64)
+    starts = np.flatnonzero(np.r_[True, codes[1:] != codes[:-1]])
+    ends = np.r_[starts[1:], len(codes)]
+    return starts, ends
+
+
+def agg_ticks_to_minute_bars(
+        ts: np.ndarray, price: np.ndarray, volume: np.ndarray, turnover: np.ndarray, oi: np.ndarray,
+) -> CMinuteBars:
+    """
+    aggregate ticks to 1-minute bars in one grouped pass, with the same result as
+    resample("1min") with ohlc/sum/last followed by dropping bars without price or oi
+
+    :param ts: datetime64 timestamps of ticks
+    :param price: last price of each tick
+    :param volume: volume traded within each tick
+    :param turnover: turnover traded within each tick
+    :param oi: open interest at each tick
+    :return:
+    """
+    if len(ts) > 1 and np.any(ts[1:] < ts[:-1]):
+        order = np.argsort(ts, kind="stable")
+        ts, price, volume, turnover, oi = ts[order], price[order], volume[order], turnover[order], oi[order]
+    codes = ts.astype("datetime64[m]").view(np.int64)
+
+    # sum of volume and turnover over all ticks
+    starts, _ = group_bounds(codes)
+    keys = codes[starts]
+    vol = np.add.reduceat(np.nan_to_num(volume), starts) if len(starts) else np.zeros(0)
+    amount = np.add.reduceat(np.nan_to_num(turnover), starts) if len(starts) else np.zeros(0)
+
+    # open, high, low, close from ticks with valid price
+    vp = ~np.isnan(price)
+    p_codes, p = codes[vp], price[vp]
+    p_starts, p_ends = group_bounds(p_codes)
+    p_keys = p_codes[p_starts]
+
+    # last valid open interest
+    vo = ~np.isnan(oi)
+    o_codes, o = codes[vo], oi[vo]
+    o_starts, o_ends = group_bounds(o_codes)
+    o_keys = o_codes[o_starts]
+
+    high = np.maximum.reduceat(p, p_starts) if len(p_starts) else np.zeros(0)
+    low = np.minimum.reduceat(p, p_starts) if len(p_starts) else np.zeros(0)
+
+    bar_keys = np.intersect1d(p_keys, o_keys, assume_unique=True)
+    i, ip, io = np.searchsorted(keys, bar_keys), np.searchsorted(p_keys, bar_keys), np.searchsorted(o_keys, bar_keys)
+    return CMinuteBars(
+        timestamp=bar_keys.astype("datetime64[m]").astype("datetime64[ns]"),
+        open=p[p_starts[ip]],
+        high=high[ip],
+        low=low[ip],
+        close=p[p_ends[ip] - 1],
+        vol=vol[i],
+        amount=amount[i],
+        oi=o[o_ends[io] - 1],
+    )
+
+
+# --- tick data aggregate ---
+class CTickDataParser:
+    def __init__(
+            self, trade_date: str, contract: str, instru: str, exchange: str,
+            save_vars: list[str], prev_trade_date: str,
+    ):
+        self.contract = contract
+        self.instru, self.exchange = instru, exchange
+        self.save_vars = save_vars
+        self.this_trade_date = trade_date
+        self.prev_trade_date = prev_trade_date
+        p_date = dt.datetime.strptime(self.prev_trade_date, "%Y%m%d")
+        self.tail_trade_date = (p_date + dt.timedelta(days=1)).strftime("%Y%m%d")
+
+    def add_trade_date(self, tick_data: pd.DataFrame) -> None:
+        if pd.api.types.is_integer_dtype(tick_data["UpdateTime"]):  # seconds of the day, from CTickCache
+            t_secs = tick_data["UpdateTime"].to_numpy()
+            condlist = [t_secs <= 4 * 3600, t_secs <= 16 * 3600]
         else:
-            d0b = self.t_date + dt.timedelta(hours=9, minutes=25)
-            d0e = self.t_date + dt.timedelta(hours=9, minutes=30)
-
-        d1b = self.t_date + dt.timedelta(hours=11, minutes=30)
-        d1e = self.t_date + dt.timedelta(hours=11, minutes=31)
-
-        # afternoon section
-        d2b = self.t_date + dt.timedelta(hours=12, minutes=59)
-        d2e = self.t_date + dt.timedelta(hours=13, minutes=0)
-        if self.this_trade_date < self.EQT_TRADE_TIME_CHG_DATE:
-            d3b = self.t_date + dt.timedelta(hours=15, minutes=15)
-            d3e = self.t_date + dt.timedelta(hours=15, minutes=20)
+            t_time = tick_data["UpdateTime"].to_numpy(dtype=str)
+            condlist = [t_time <= "04:00:00", t_time <= "16:00:00"]
+        tick_data["trade_date"] = np.select(
+            condlist=condlist,
+            choicelist=[self.tail_trade_date, self.this_trade_date],
+            default=self.prev_trade_date,
+        )
+
+    @staticmethod
+    def add_ticks(tick_data: pd.DataFrame) -> None:
+        if pd.api.types.is_integer_dtype(tick_data["UpdateTime"]):
+            time_of_day = pd.to_timedelta(tick_data["UpdateTime"], unit="s")
         else:
-            d3b = self.t_date + dt.timedelta(hours=15, minutes=0)
-            d3e = self.t_date + dt.timedelta(hours=15, minutes=5)
+            time_of_day = pd.to_timedelta(tick_data["UpdateTime"])
+        tick_data["ts"] = (
+                pd.to_datetime(tick_data["trade_date"], format="%Y%m%d")
+                + time_of_day
+                + pd.to_timedelta(tick_data["UpdateMillisec"], unit="ms")
+        )
+        tick_data.set_index(keys="ts", inplace=True)
 
-        ts_lst = tick_data.index.tolist()
-        for i, timestamp in enumerate(ts_lst):
-            if self.__revise_to_end(d0b, d0e, i, timestamp, ts_lst):
-                continue
-            if self.__revise_to_bgn(d1b, d1e, i, timestamp, ts_lst):
-                continue
-            if self.__revise_to_end(d2b, d2e, i, timestamp, ts_lst):
-                continue
-            if self.__revise_to_bgn(d3b, d3e, i, timestamp, ts_lst):
-                continue
-        tick_data.index = ts_lst
-        truncated_data = tick_data.query(f"index >= '{d0e}' & index < '{d3b}'")
-        return truncated_data
-
-    def __revise_cfx_treasury_bond(self, tick_data: pd.DataFrame) -> pd.DataFrame:
-        # morning section
-        d0b = self.t_date + dt.timedelta(hours=9, minutes=10)
-        d0e = self.t_date + dt.timedelta(hours=9, minutes=15)
-        d1b = self.t_date + dt.timedelta(hours=11, minutes=30)
-        d1e = self.t_date + dt.timedelta(hours=11, minutes=31)
-
-        # afternoon section
-        d2b = self.t_date + dt.timedelta(hours=12, minutes=59)
-        d2e = self.t_date + dt.timedelta(hours=13, minutes=0)
-        d3b = self.t_date + dt.timedelta(hours=15, minutes=15)
-        d3e = self.t_date + dt.timedelta(hours=15, minutes=20)
-
-        ts_lst = tick_data.index.tolist()
-        for i, timestamp in enumerate(ts_lst):
-            if self.__revise_to_end(d0b, d0e, i, timestamp, ts_lst):
-                continue
-            if self.__revise_to_bgn(d1b, d1e, i, timestamp, ts_lst):
-                continue
-            if self.__revise_to_end(d2b, d2e, i, timestamp, ts_lst):
-                continue
-            if self.__revise_to_bgn(d3b, d3e, i, timestamp, ts_lst):
-                continue
-        tick_data.index = ts_lst
-        truncated_data = tick_data.query(f"index >= '{d0e}' & index < '{d3b}'")
-        return truncated_data
+    @staticmethod
+    def __revise_and_truncate(
+            tick_data: pd.DataFrame, revisions: np.ndarray, sections: np.ndarray,
+    ) -> pd.DataFrame:
+        """
+
+        :param tick_data: tick data indexed by timestamp
+        :param revisions: (n, 3) datetime64[ns] of (db, de, target), ticks in [db, de] are moved to target,
+                          intervals do not overlap, so the first match wins
+        :param sections: (m, 2) datetime64[ns] of (bgn, end), revised ticks in any [bgn, end) are kept
+        :return:
+        """
+        ts = tick_data.index.to_numpy(dtype="datetime64[ns]")
+        revised_ts = np.select(
+            condlist=[(ts >= db) & (ts <= de) for db, de, _ in revisions],
+            choicelist=[target for _, _, target in revisions],
+            default=ts,
+        )
+        keep = np.zeros(len(revised_ts), dtype=bool)
+        for bgn, end in sections:
+            keep |= (revised_ts >= bgn) & (revised_ts < end)
+        tick_data.index = pd.DatetimeIndex(revised_ts)
+        return tick_data[keep]
 
     def revise_ticks(self, tick_data: pd.DataFrame) -> pd.DataFrame:
-        if self.exchange == "CFX":
-            if self.instru.upper() in ["IH.CFX", "IF.CFX", "IC.CFX", "IM.CFX"]:
-                return self.__revise_cfx_equity(tick_data)
-            elif self.instru.upper() in ["TS.CFX", "TF.CFX", "T.CFX", "TL.CFX"]:
-                return self.__revise_cfx_treasury_bond(tick_data)
-            else:
-                raise ValueError(f"instru = {SFR(self.instru)} is illegal for CFX")
-        else:
-            return self.__revise_non_cfx(tick_data)
+        group = get_session_group(self.instru, self.exchange)
+        revisions, sections = get_session_registry().lookup(group, self.this_trade_date, self.prev_trade_date)
+        return self.__revise_and_truncate(tick_data, revisions, sections)
 
     @staticmethod
-    def agg_tick_data_to_bar(tick_data: pd.DataFrame) -> pd.DataFrame:
-        ohlc_data = tick_data["LastPrice"].resample("1min").ohlc()
-        vol_data = tick_data[["Volume", "Turnover", "OpenInterest"]].resample("1min").aggregate({
-            "Volume": "sum",
-            "Turnover": "sum",
-            "OpenInterest": "last",
-        })
-        bar_data = pd.merge(left=ohlc_data, right=vol_data, left_index=True, right_index=True, how="inner")
-        return bar_data
-
-    def reformat_bar(self, bar_data: pd.DataFrame) -> pd.DataFrame:
-        rft_data = bar_data.dropna(axis=0, subset=["open", "high", "low", "close", "OpenInterest"])
-        rft_data = rft_data.reset_index().rename(
-            columns={"Volume": "vol", "Turnover": "amount", "OpenInterest": "oi", "index": "timestamp"}
+    def agg_tick_data_to_bars(tick_data: pd.DataFrame) -> CMinuteBars:
+        return agg_ticks_to_minute_bars(
+            ts=tick_data.index.to_numpy(dtype="datetime64[ns]"),
+            price=tick_data["LastPrice"].to_numpy(dtype=np.float64),
+            volume=tick_data["Volume"].to_numpy(dtype=np.float64),
+            turnover=tick_data["Turnover"].to_numpy(dtype=np.float64),
+            oi=tick_data["OpenInterest"].to_numpy(dtype=np.float64),
         )
-        rft_data["ts_code"] = self.contract
-        rft_data["trade_date"] = self.this_trade_date
-        rft_data = rft_data[self.save_vars]
-        return rft_data
+
+    def reformat_bars(self, bars: CMinuteBars) -> pd.DataFrame:
+        return bars.to_dataframe(columns=self.save_vars, ts_code=self.contract, trade_date=self.this_trade_date)
 
     def main(self, tick_data: pd.DataFrame) -> pd.DataFrame:
-        self.add_trade_date(tick_data)
-        self.add_ticks(tick_data)
-        truncated_data = self.revise_ticks(tick_data)
-        bar_data = self.agg_tick_data_to_bar(truncated_data)
-        rft_data = self.reformat_bar(bar_data)
+        with metrics.timer("tick_parser_seconds", stage="add_trade_date"):
+            self.add_trade_date(tick_data)
+        with metrics.timer("tick_parser_seconds", stage="add_ticks"):
+            self.add_ticks(tick_data)
+        with metrics.timer("tick_parser_seconds", stage="revise_ticks"):
+            truncated_data = self.revise_ticks(tick_data)
+        with metrics.timer("tick_parser_seconds", stage="agg_tick_data_to_bars"):
+            bars = self.agg_tick_data_to_bars(truncated_data)
+        with metrics.timer("tick_parser_seconds", stage="reformat_bars"):
+            rft_data = self.reformat_bars(bars)
+        metrics.inc("ticks_parsed_total", len(tick_data))
         return rft_data
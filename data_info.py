@@ -0,0 +1,28 @@
+from dataclasses import dataclass
+from typing import TYPE_CHECKING
+
+if TYPE_CHECKING:
+    import pandas as pd
+
+
+# Kept free of heavy imports, so project_cfg and the CLI can describe datasets
+# without loading pandas, pyarrow or any provider SDK.
+
+@dataclass(frozen=True)
+class CSaveDataInfo:
+    file_format: str
+    desc: str
+    fields: tuple[str, ...]
+    codec: str | None = None  # only for parquet, like "zstd", "lz4" or "gzip", csv is compressed by its suffix
+    compression_level: int | None = None  # None for the default level of the codec
+
+    def __post_init__(self):
+        if self.codec is not None and not self.file_format.endswith(".parquet"):
+            raise ValueError(
+                f"codec of {self.file_format} is given by its suffix, like '.csv.gz', '.csv.zst' or '.csv.lz4'"
+            )
+
+    def load(self, root_dir: str, trade_date: str, columns: list[str] | None = None) -> "pd.DataFrame":
+        from storage import data_store
+
+        return data_store.load(root_dir, self.file_format, trade_date, columns=columns)
@@ -1,56 +1,458 @@
 import os
 import re
+import sqlite3
+import threading
+import numpy as np
 import pandas as pd
-from rich.progress import track
+import multiprocessing as mp
+from collections import deque, OrderedDict
+from concurrent.futures import ThreadPoolExecutor, Future
+from contextlib import closing
+from typing import Iterator, Callable, Iterable
+from loguru import logger
+from rich.progress import Progress
 from husfort.qutility import qtimer, SFY, SFG
 from husfort.qinstruments import parse_instrument_from_contract
 from husfort.qcalendar import CCalendar
 from husfort.qsqlite import CDbStruct, CMgrSqlDb
-from data_engines import CSaveDataInfo
+from data_info import CSaveDataInfo
+from storage import is_columnar, load_daily_data_range, find_saved_dates
+from metrics import metrics
+
+
+def get_index_name(table_name: str, index: tuple[str, ...]) -> str:
+    return f"idx_{table_name}_{'_'.join(index)}"
+
+
+def create_table_indexes(conn: sqlite3.Connection, table_name: str, indexes: Iterable[tuple[str, ...]]) -> int:
+    """
+    create indexes which are missing, an index made of the leading columns of the primary key is
+    skipped, because the primary key covers it. The table is analyzed if any index is created,
+    so the query planner knows about it.
+
+    :return: number of indexes created
+    """
+    table_info = conn.execute(f"PRAGMA table_info({table_name})").fetchall()
+    primary_keys = tuple(row[1] for row in sorted(table_info, key=lambda z: z[5]) if row[5] > 0)
+    existing = {row[0] for row in conn.execute(
+        "SELECT name FROM sqlite_master WHERE type = 'index' AND tbl_name = ?", (table_name,)
+    )}
+    created = 0
+    with conn:
+        for index in indexes:
+            index_name = get_index_name(table_name, index)
+            if index != primary_keys[:len(index)] and index_name not in existing:
+                conn.execute(f"CREATE INDEX {index_name} ON {table_name} ({', '.join(index)})")
+                created += 1
+    if created > 0:
+        conn.execute(f"ANALYZE {table_name}")
+        logger.info(f"{created} indexes of {table_name} are created")
+    return created
+
+
+def drop_table_indexes(conn: sqlite3.Connection, table_name: str, indexes: Iterable[tuple[str, ...]]) -> int:
+    with conn:
+        for index in indexes:
+            conn.execute(f"DROP INDEX IF EXISTS {get_index_name(table_name, index)}")
+    return 0
 
 
 class __CDbWriter:
+    # secondary indexes, created when missing. The one on trade_date serves the continuity check,
+    # the deletes of replace_dates, and the derived tables which look for new dates
+    INDEXES: tuple[tuple[str, ...], ...] = (("trade_date",),)
+    # if > 0, an append of at least BULK_DATES dates drops the other indexes before loading and builds
+    # them once after it. The trade_date index is kept, new dates only extend its end.
+    BULK_DATES = 0
+
     def __init__(self, db_struct: CDbStruct, raw_data_root_dir: str, raw_data_info: CSaveDataInfo):
         self.db_struct = db_struct
         self.save_root_dir = raw_data_root_dir
         self.raw_data_info = raw_data_info
 
     def load_data(self, trade_date: str) -> pd.DataFrame:
-        raw_data_dir = os.path.join(self.save_root_dir, trade_date[0:4], trade_date)
-        raw_data_file = self.raw_data_info.file_format.format(trade_date)
-        raw_data_path = os.path.join(raw_data_dir, raw_data_file)
-        raw_data = pd.read_csv(raw_data_path, dtype={"trade_date": str})
+        raw_data = self.raw_data_info.load(self.save_root_dir, trade_date)
         return raw_data
 
+    def prefetch_data(self, iter_dates: list[str], prefetch: int) -> Iterator[tuple[str, pd.DataFrame]]:
+        """
+        yield (trade_date, raw_data) in date order, while the next prefetch files are being read by threads
+
+        """
+        with ThreadPoolExecutor(max_workers=prefetch) as executor:
+            jobs: deque[tuple[str, Future]] = deque()
+            for trade_date in iter_dates:
+                jobs.append((trade_date, executor.submit(self.load_data, trade_date)))
+                if len(jobs) > prefetch:
+                    trade_date, job = jobs.popleft()
+                    yield trade_date, job.result()
+            while jobs:
+                trade_date, job = jobs.popleft()
+                yield trade_date, job.result()
+
+    def load_data_range(self, bgn_date: str, stp_date: str, calendar: CCalendar,
+                        prefetch: int = 0) -> Iterator[tuple[str, pd.DataFrame]]:
+        """
+        yield (trade_date, raw_data) in date order, columnar raw data of the whole range is loaded by one scan
+
+        :param prefetch: if > 0, csv files are read by this many threads ahead of the consumer
+        """
+        if is_columnar(self.raw_data_info.file_format):
+            raw_data_range = load_daily_data_range(
+                root_dir=self.save_root_dir,
+                file_format=self.raw_data_info.file_format,
+                fields=self.raw_data_info.fields,
+                bgn_date=bgn_date, stp_date=stp_date, calendar=calendar,
+            )
+            for trade_date, raw_data in raw_data_range.groupby(by="trade_date", sort=True):
+                yield trade_date, raw_data.reset_index(drop=True)  # type:ignore
+        elif prefetch > 0:
+            yield from self.prefetch_data(calendar.get_iter_list(bgn_date, stp_date), prefetch)
+        else:
+            for trade_date in calendar.get_iter_list(bgn_date, stp_date):
+                yield trade_date, self.load_data(trade_date)
+
     def reformat(self, raw_data: pd.DataFrame, trade_date: str) -> pd.DataFrame:
         raise NotImplementedError
 
-    def to_sqldb(self, new_data: pd.DataFrame, calendar: CCalendar):
-        sqldb = CMgrSqlDb(
+    def reformat_task(self, task: tuple[str, pd.DataFrame]) -> tuple[str, pd.DataFrame]:
+        trade_date, raw_data = task
+        return trade_date, self.reformat(raw_data, trade_date)
+
+    def get_sqldb(self) -> CMgrSqlDb:
+        return CMgrSqlDb(
             db_save_dir=self.db_struct.db_save_dir,
             db_name=self.db_struct.db_name,
             table=self.db_struct.table,
             mode="a",
             verbose=False
         )
-        if sqldb.check_continuity(incoming_date=new_data["trade_date"].iloc[0], calendar=calendar) == 0:
-            sqldb.update(update_data=new_data)
-        return 0
+
+    def to_sqldb(self, new_data: pd.DataFrame, calendar: CCalendar, sqldb: CMgrSqlDb | None = None,
+                 incoming_date: str | None = None) -> int:
+        """
+
+        :param incoming_date: the first date new_data covers, default is the first trade_date of new_data.
+                              Leading dates of a chunk may have no rows, like dates saved without minute bars.
+        :return: result of continuity check, new data is written in one transaction only if it is 0
+        """
+        sqldb = sqldb or self.get_sqldb()
+        incoming_date = incoming_date or new_data["trade_date"].iloc[0]
+        if (continuity := sqldb.check_continuity(incoming_date=incoming_date, calendar=calendar)) == 0:
+            if not new_data.empty:
+                sqldb.update(update_data=new_data)
+        return continuity
+
+    def replace_dates(self, new_data: pd.DataFrame, trade_dates: list[str]) -> int:
+        """
+        delete rows of trade_dates and insert new_data in one transaction, without continuity check,
+        so dates in the middle of history can be written again. Readers see the old rows or the new
+        ones, never a mix of them.
+
+        :param new_data: rows of trade_dates, dates without rows are only deleted
+        :param trade_dates:
+        :return: rows inserted
+        """
+        table_name, var_names = self.db_struct.table.name, self.db_struct.table.vars.names
+        sql = f"INSERT INTO {table_name} ({', '.join(var_names)}) VALUES ({', '.join(['?'] * len(var_names))})"
+        new_data = new_data[var_names]
+        rows = new_data.astype(object).where(new_data.notna(), None).to_numpy().tolist()
+        with closing(sqlite3.connect(self.get_db_path(), timeout=60)) as conn:
+            with conn:  # one transaction
+                conn.execute(
+                    f"DELETE FROM {table_name} WHERE trade_date IN ({', '.join(['?'] * len(trade_dates))})",
+                    trade_dates,
+                )
+                conn.executemany(sql, rows)
+        return len(rows)
+
+    def get_db_path(self) -> str:
+        return os.path.join(self.db_struct.db_save_dir, self.db_struct.db_name)
+
+    def get_last_date(self) -> str | None:
+        """
+
+        :return: the last trade_date in the table, None if the database or the table does not exist, or it is empty
+        """
+        if not os.path.exists(db_path := self.get_db_path()):
+            return None
+        with closing(sqlite3.connect(db_path)) as conn:
+            try:
+                return conn.execute(f"SELECT MAX(trade_date) FROM {self.db_struct.table.name}").fetchone()[0]
+            except sqlite3.OperationalError:
+                return None
+
+    def trim_to_available(self, iter_dates: list[str]) -> list[str]:
+        """
+
+        :return: leading dates of iter_dates whose raw data exists, stop at the first missing one
+        """
+        saved_dates = find_saved_dates(self.save_root_dir, self.raw_data_info.file_format, iter_dates)
+        for i, trade_date in enumerate(iter_dates):
+            if trade_date not in saved_dates:
+                logger.info(f"Raw {self.raw_data_info.desc} for {trade_date} does not exist, update stops before it")
+                return iter_dates[:i]
+        return iter_dates
 
     @qtimer
-    def main(self, bgn_date: str, stp_date: str, calendar: CCalendar):
-        iter_dates = calendar.get_iter_list(bgn_date, stp_date)
-        new_data_list: list[pd.DataFrame] = []
-        for trade_date in track(iter_dates, description=f"Processing {SFG(self.raw_data_info.desc)} to sql"):
-            raw_data = self.load_data(trade_date)
-            rft_data = self.reformat(raw_data, trade_date)
-            new_data_list.append(rft_data)
-        new_data = pd.concat(new_data_list, axis=0, ignore_index=True)
-        self.to_sqldb(new_data, calendar)
+    def main(self, bgn_date: str | None, stp_date: str, calendar: CCalendar, silent: bool = False,
+             chunk_size: int = 0, resume: bool = False, workers: int = 1, replace: bool = False):
+        """
+
+        :param bgn_date: if resume is True, it is only used when the table is empty
+        :param stp_date:
+        :param calendar:
+        :param silent: if True, no progress bar is displayed
+        :param chunk_size: if > 0, data is loaded, reformatted and written every chunk_size dates,
+                           each chunk in one transaction, so memory does not grow with the range,
+                           and chunks written before a failure are kept. If 0, the whole range
+                           is written at once.
+        :param resume: start from the date after the last trade_date in the table, and stop
+                       before the first date whose raw data does not exist
+        :param workers: if > 1, raw data is reformatted by a pool of this many processes, and
+                        workers - 1 threads read the next files ahead. Results are still
+                        written in date order.
+        :param replace: rows of dates in [bgn_date, stp_date) are replaced by replace_dates, chunk by
+                        chunk, instead of appended after the continuity check. Any window works,
+                        including one in the middle of history. Raw data of every date in the window
+                        must exist, otherwise FileNotFoundError is raised before any row is deleted.
+        :return: 0 if all dates are written, else the result of the failed continuity check
+        """
+        if resume and replace:
+            raise ValueError("resume and replace can not be used together")
+        if resume and (last_date := self.get_last_date()) is not None:
+            bgn_date = calendar.get_next_date(last_date, shift=1)
+            logger.info(f"Last date of {self.db_struct.table.name} is {last_date}, resume from {bgn_date}")
+        if bgn_date is None:
+            raise ValueError(f"bgn_date must be provided, because {self.db_struct.table.name} is empty")
+        iter_dates = calendar.get_iter_list(bgn_date, stp_date) if bgn_date < stp_date else []
+        if resume and (available_dates := self.trim_to_available(iter_dates)) != iter_dates:
+            iter_dates = available_dates
+            stp_date = calendar.get_next_date(iter_dates[-1], shift=1) if iter_dates else bgn_date
+        if not iter_dates:
+            logger.info(f"No new data for {self.db_struct.table.name}")
+            return 0
+        if replace and (available_dates := self.trim_to_available(iter_dates)) != iter_dates:
+            missing_date = iter_dates[len(available_dates)]
+            raise FileNotFoundError(f"Raw {self.raw_data_info.desc} for {missing_date} does not exist, no row replaced")
+
+        sqldb = self.get_sqldb()
+        table_name = self.db_struct.table.name
+        bulk_indexes = [index for index in self.INDEXES if index != ("trade_date",)]
+        bulk = not replace and 0 < self.BULK_DATES <= len(iter_dates) and len(bulk_indexes) > 0
+        with closing(sqlite3.connect(self.get_db_path(), timeout=60)) as conn:
+            if bulk:
+                drop_table_indexes(conn, table_name, bulk_indexes)
+            create_table_indexes(conn, table_name, [_ for _ in self.INDEXES if not (bulk and _ in bulk_indexes)])
+        size = chunk_size if chunk_size > 0 else len(iter_dates)
+        pool = mp.get_context("spawn").Pool(processes=workers) if workers > 1 else None
+        incoming_date: str | None = None  # the first date after the last one with rows written
+        continuity = 0
+        try:
+            with Progress(disable=silent) as pb:
+                task = pb.add_task(
+                    description=f"Processing {SFG(self.raw_data_info.desc)} to sql", total=len(iter_dates)
+                )
+                for i in range(0, len(iter_dates), size):
+                    chunk_dates = iter_dates[i:i + size]
+                    chunk_stp = iter_dates[i + size] if i + size < len(iter_dates) else stp_date
+                    incoming_date = incoming_date or chunk_dates[0]
+                    raw_data_range = self.load_data_range(chunk_dates[0], chunk_stp, calendar, prefetch=workers - 1)
+                    new_data_list: list[pd.DataFrame] = []
+                    rows_of_dates: list[tuple[str, int]] = []
+                    with metrics.timer("db_writer_seconds", table=table_name, stage="load_and_reformat"):
+                        for trade_date, rft_data in (pool.imap(self.reformat_task, raw_data_range) if pool is not None
+                                                     else map(self.reformat_task, raw_data_range)):
+                            new_data_list.append(rft_data)
+                            rows_of_dates.append((trade_date, len(rft_data)))
+                            pb.update(task, advance=1)
+                    if not new_data_list:
+                        continue
+                    new_data = pd.concat(new_data_list, axis=0, ignore_index=True)
+                    with metrics.timer("db_writer_seconds", table=table_name, stage="write"):
+                        if replace:
+                            self.replace_dates(new_data, [trade_date for trade_date, _ in rows_of_dates])
+                            continuity = 0
+                        else:
+                            continuity = self.to_sqldb(new_data, calendar, sqldb, incoming_date=incoming_date)
+                    if continuity != 0:
+                        logger.error(f"{SFY(incoming_date)} is not continuous with {table_name}, update stops")
+                        break
+                    if written_dates := [trade_date for trade_date, rows in rows_of_dates if rows > 0]:
+                        incoming_date = next((d for d in chunk_dates if d > written_dates[-1]), None)
+                    for trade_date, rows in rows_of_dates:
+                        metrics.record_io(f"sqlite.{table_name}", trade_date, "written", rows=rows)
+        finally:
+            if pool is not None:
+                pool.close()
+                pool.join()
+            if bulk:
+                with metrics.timer("db_writer_seconds", table=table_name, stage="create_index"):
+                    with closing(sqlite3.connect(self.get_db_path(), timeout=60)) as conn:
+                        create_table_indexes(conn, table_name, bulk_indexes)
+        return continuity
+
+
+class CDbReader:
+    """
+    Read side of a table written by the writers in this module. Opening it never changes the database,
+    indexes on (instrument, trade_date), (ts_code, trade_date) and trade_date are created by an explicit
+    call of ensure_indexes, once for each table, and sqlite maintains them as writers append. Query
+    results are cached by an LRU keyed by the query, which is cleared whenever PRAGMA data_version
+    shows that any connection, of this process or another, has committed to the database since the last query.
+    It is thread-safe, all threads share one read-only connection.
+    """
+
+    CODE_VARS = ("instrument", "ts_code")
+
+    def __init__(self, db_struct: CDbStruct, table_name: str | None = None, max_bytes: int = 256 * 1024 ** 2):
+        """
+
+        :param db_struct:
+        :param table_name: default is the table of db_struct, other tables of the same database,
+                           like "{table}_summary" or "{table}_continuous", can be read too
+        :param max_bytes: the least recently used result is evicted when the total memory usage
+                          of cached results exceeds it
+        """
+        self.db_path = os.path.join(db_struct.db_save_dir, db_struct.db_name)
+        self.table_name = table_name or db_struct.table.name
+        if not os.path.exists(self.db_path):
+            raise FileNotFoundError(f"{self.db_path} does not exist")
+        self.max_bytes = max_bytes
+        self.cache: OrderedDict[tuple[str, tuple], tuple[pd.DataFrame, int]] = OrderedDict()
+        self.cached_bytes = 0
+        self.stats: dict[str, int] = {"hits": 0, "misses": 0, "evictions": 0, "invalidations": 0}
+        self.data_version: int | None = None
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(f"file:{self.db_path}?mode=ro", uri=True, check_same_thread=False)
+        table_info = self.conn.execute(f"PRAGMA table_info({self.table_name})").fetchall()
+        if not table_info:
+            self.conn.close()
+            raise ValueError(f"table {SFY(self.table_name)} does not exist in {self.db_path}")
+        self.dtypes = {name: self.get_dtype(sql_type) for _, name, sql_type, _, _, _ in table_info}
+
+    @staticmethod
+    def get_dtype(sql_type: str) -> str | None:
+        """
+        by the type affinity rules of sqlite
+
+        :return: pandas dtype, None if values are kept as they are read
+        """
+        sql_type = sql_type.upper()
+        if "INT" in sql_type:
+            return "Int64"
+        elif any(t in sql_type for t in ("CHAR", "CLOB", "TEXT")):
+            return "str"
+        elif any(t in sql_type for t in ("REAL", "FLOA", "DOUB")):
+            return "float64"
+        return None
+
+    def ensure_indexes(self) -> int:
+        """
+        create indexes for queries by date and by code, those covered by the primary key are skipped.
+        It needs write access, and waits for writers to commit.
+
+        :return: number of indexes created
+        """
+        indexes = [("trade_date",)] + [(v, "trade_date") for v in self.CODE_VARS if v in self.dtypes]
+        with closing(sqlite3.connect(self.db_path, timeout=60)) as conn:
+            return create_table_indexes(conn, self.table_name, indexes)
+
+    def __check_version(self):
+        data_version = self.conn.execute("PRAGMA data_version").fetchone()[0]
+        if data_version != self.data_version:
+            if self.cache:
+                self.stats["invalidations"] += 1
+            self.cache.clear()
+            self.cached_bytes = 0
+            self.data_version = data_version
+
+    def __evict(self):
+        while self.cached_bytes > self.max_bytes and self.cache:
+            _, (_, nbytes) = self.cache.popitem(last=False)
+            self.cached_bytes -= nbytes
+            self.stats["evictions"] += 1
+
+    def query(self, bgn_date: str, stp_date: str, fields: list[str] | None = None,
+              instruments: list[str] | None = None, contracts: list[str] | None = None) -> pd.DataFrame:
+        """
+
+        :param bgn_date:
+        :param stp_date: rows with trade_date in [bgn_date, stp_date) are returned
+        :param fields: columns to return, all columns by default
+        :param instruments: if not None, only rows of these instruments
+        :param contracts: if not None, only rows of these ts_code
+        :return: rows sorted by trade_date, typed by the column types of the table.
+                 A copy is returned, callers are free to modify it.
+        """
+        fields = fields or list(self.dtypes)
+        if unknown := [f for f in fields if f not in self.dtypes]:
+            raise ValueError(f"fields {unknown} are not in {self.table_name}")
+        conditions, params = ["trade_date >= ?", "trade_date < ?"], [bgn_date, stp_date]
+        for var, codes in zip(self.CODE_VARS, (instruments, contracts)):
+            if codes is not None:
+                conditions.append(f"{var} IN ({', '.join(['?'] * len(codes))})")
+                params.extend(codes)
+        sql = (f"SELECT {', '.join(fields)} FROM {self.table_name} "
+               f"WHERE {' AND '.join(conditions)} ORDER BY trade_date")
+        key = (sql, tuple(params))
+        with self.lock:
+            self.__check_version()
+            if key in self.cache:
+                self.cache.move_to_end(key)
+                self.stats["hits"] += 1
+                data = self.cache[key][0]
+            else:
+                self.stats["misses"] += 1
+                data = None
+            metrics.inc("cache_requests_total", cache="db_reader", result="miss" if data is None else "hit")
+            if data is None:
+                with metrics.timer("db_reader_seconds", table=self.table_name):
+                    data = pd.read_sql(sql, self.conn, params=params)
+                    data = data.astype({f: dtype for f in fields if (dtype := self.dtypes[f]) is not None})
+                nbytes = int(data.memory_usage(index=True, deep=True).sum())
+                self.cache[key] = (data, nbytes)
+                self.cached_bytes += nbytes
+                self.__evict()
+        return data.copy()
+
+    def clear(self):
+        with self.lock:
+            self.cache.clear()
+            self.cached_bytes = 0
         return 0
 
+    def report(self) -> str:
+        with self.lock:
+            return (f"hits = {self.stats['hits']}, misses = {self.stats['misses']}, "
+                    f"evictions = {self.stats['evictions']}, invalidations = {self.stats['invalidations']}, "
+                    f"cached = {len(self.cache)} items / {self.cached_bytes / 1024 ** 2:.1f} MB")
+
+    def close(self):
+        with self.lock:
+            self.conn.close()
+
 
 class CDbWriterFmd(__CDbWriter):
+    # dominant table "{table}_dominant", one row for each (trade_date, instrument). The dominant contract
+    # is the one with the largest vol, unless it expires earlier than the dominant of the previous date,
+    # which is kept then, so the dominant never rolls back. The sub-dominant is the one with the largest
+    # vol among contracts expiring later than the dominant. Ties are broken by oi, then by the earlier one.
+    # continuous table "{table}_continuous", daily data of the dominant contract of each instrument. Prices
+    # times factor are continuous across rolls: at a roll, factor is multiplied by the close of the old
+    # dominant on the previous date over pre_close of the new one, and it is 1 on the first date.
+    DOMINANT_CHUNK_SIZE = 120
+    DOMINANT_KEYS = ("trade_date", "instrument")
+    DOMINANT_COLUMNS = {
+        "trade_date": "TEXT", "instrument": "TEXT", "dominant": "TEXT", "sub_dominant": "TEXT", "rolled": "INTEGER",
+    }
+    CONTINUOUS_PRICE_VARS = ("pre_close", "open", "high", "low", "close", "settle")
+    CONTINUOUS_COLUMNS = {
+        "trade_date": "TEXT", "instrument": "TEXT", "contract": "TEXT",
+        "pre_close": "REAL", "open": "REAL", "high": "REAL", "low": "REAL", "close": "REAL", "settle": "REAL",
+        "vol": "REAL", "amount": "REAL", "oi": "REAL", "factor": "REAL",
+    }
+
     def __init__(
             self,
             db_struct: CDbStruct, raw_data_root_dir: str, raw_data_info: CSaveDataInfo,
@@ -60,10 +462,7 @@ class CDbWriterFmd(__CDbWriter):
         super().__init__(db_struct, raw_data_root_dir, raw_data_info)
 
     def load_cntrcts(self, trade_date: str) -> pd.DataFrame:
-        cntrcts_data_dir = os.path.join(self.save_root_dir, trade_date[0:4], trade_date)
-        cntrcts_data_file = self.cntrcts_data_info.file_format.format(trade_date)
-        cntrcts_data_path = os.path.join(cntrcts_data_dir, cntrcts_data_file)
-        cntrcts_data = pd.read_csv(cntrcts_data_path)
+        cntrcts_data = self.cntrcts_data_info.load(self.save_root_dir, trade_date)
         return cntrcts_data
 
     def reformat(self, raw_data: pd.DataFrame, trade_date: str) -> pd.DataFrame:
@@ -73,11 +472,268 @@ class CDbWriterFmd(__CDbWriter):
         rft_data = raw_data[self.db_struct.table.vars.names]
         return rft_data
 
+    @property
+    def dominant_name(self) -> str:
+        return f"{self.db_struct.table.name}_dominant"
+
+    @property
+    def continuous_name(self) -> str:
+        return f"{self.db_struct.table.name}_continuous"
+
+    def load_md_cntrcts(self, trade_date: str) -> pd.DataFrame:
+        """
+
+        :return: market data of contracts listed in the trade date, with trade_date, instrument and contract
+        """
+        md = self.load_data(trade_date).rename(columns={"ts_code": "contract", " settle": "settle"})
+        md_cntrcts = pd.merge(left=self.load_cntrcts(trade_date)[["contract"]], right=md.drop(columns="trade_date"),
+                              on="contract", how="left")
+        md_cntrcts["trade_date"] = trade_date
+        md_cntrcts["instrument"] = md_cntrcts["contract"].map(parse_instrument_from_contract)
+        md_cntrcts[["vol", "oi"]] = md_cntrcts[["vol", "oi"]].fillna(0)
+        return md_cntrcts
+
+    @staticmethod
+    def rank_contracts(data: pd.DataFrame) -> pd.DataFrame:
+        """
+
+        :return: data sorted by trade_date, instrument, then contracts of larger vol first
+        """
+        return data.sort_values(
+            by=["trade_date", "instrument", "vol", "oi", "contract"], ascending=[True, True, False, False, True],
+        )
+
+    @staticmethod
+    def select_dominant(data: pd.DataFrame, prev_dominant: pd.DataFrame) -> pd.DataFrame:
+        """
+
+        :param data: market data of consecutive trade dates, from load_md_cntrcts
+        :param prev_dominant: the last rows of the dominant table of each instrument before these dates,
+                              may be empty
+        :return: dominant table of these dates
+        """
+        keys = list(CDbWriterFmd.DOMINANT_KEYS)
+        top = CDbWriterFmd.rank_contracts(data).drop_duplicates(subset=keys)[keys + ["contract"]]
+        both = pd.concat(
+            [prev_dominant[keys + ["dominant"]].rename(columns={"dominant": "contract"}), top],
+            axis=0, ignore_index=True,
+        ).sort_values(by=["instrument", "trade_date"])
+
+        # contract codes sort by expiry within an instrument, so a running max of their ranks
+        # keeps the dominant from rolling back
+        codes, contracts = pd.factorize(both["contract"], sort=True)
+        both["dominant"] = contracts[pd.Series(codes, index=both.index).groupby(both["instrument"]).cummax().to_numpy()]
+        prev = both.groupby("instrument")["dominant"].shift(1)
+        both["rolled"] = (prev.notna() & (prev != both["dominant"])).astype(int)
+        dominant = both[both["trade_date"].isin(top["trade_date"])]
+
+        later = pd.merge(left=data, right=dominant[keys + ["dominant"]], on=keys, how="inner")
+        later = later[later["contract"] > later["dominant"]]
+        sub = CDbWriterFmd.rank_contracts(later).drop_duplicates(subset=keys)
+        dominant = pd.merge(
+            left=dominant, right=sub[keys + ["contract"]].rename(columns={"contract": "sub_dominant"}),
+            on=keys, how="left",
+        )
+        return dominant.sort_values(by=keys)[list(CDbWriterFmd.DOMINANT_COLUMNS)]
+
+    @staticmethod
+    def make_continuous(data: pd.DataFrame, dominant: pd.DataFrame, prev_continuous: pd.DataFrame) -> pd.DataFrame:
+        """
+
+        :param data: market data of consecutive trade dates, from load_md_cntrcts
+        :param dominant: dominant table of these dates, from select_dominant
+        :param prev_continuous: the last rows of the continuous table of each instrument before these dates,
+                                may be empty
+        :return: continuous table of these dates
+        """
+        keys = list(CDbWriterFmd.DOMINANT_KEYS)
+        continuous = pd.merge(
+            left=dominant[keys + ["dominant"]].rename(columns={"dominant": "contract"}),
+            right=data.drop(columns="instrument"), on=["trade_date", "contract"], how="left",
+        )
+        continuous["factor"] = np.nan
+        if not prev_continuous.empty:  # an empty frame of object columns would turn prices into objects
+            continuous = pd.concat([prev_continuous, continuous], axis=0, ignore_index=True)
+        both = continuous.sort_values(by=["instrument", "trade_date"])
+        prev = both.groupby("instrument")[["contract", "close"]].shift(1)
+        is_roll = prev["contract"].notna() & (prev["contract"] != both["contract"])
+        ratio = (prev["close"] / both["pre_close"]).where(is_roll & (both["pre_close"] > 0) & prev["close"].notna())
+        is_new = both["trade_date"].isin(dominant["trade_date"])
+        # rows of prev_continuous carry their factors, which new rows of the same instrument build on
+        both["factor"] = ratio.fillna(1.0).where(is_new, both["factor"]).groupby(both["instrument"]).cumprod()
+        return both[is_new].sort_values(by=keys)[list(CDbWriterFmd.CONTINUOUS_COLUMNS)]
+
+    def create_dominant_tables(self, conn: sqlite3.Connection):
+        for name, columns in ((self.dominant_name, self.DOMINANT_COLUMNS),
+                              (self.continuous_name, self.CONTINUOUS_COLUMNS)):
+            conn.execute(
+                f"CREATE TABLE IF NOT EXISTS {name} "
+                f"({', '.join(f'{k} {v}' for k, v in columns.items())}, "
+                f"PRIMARY KEY ({', '.join(self.DOMINANT_KEYS)}))"
+            )
+        return 0
+
+    @staticmethod
+    def read_last_rows(conn: sqlite3.Connection, table_name: str, trade_date: str) -> pd.DataFrame:
+        """
+
+        :return: the last row of each instrument in the table before trade_date
+        """
+        return pd.read_sql(
+            f"SELECT t.* FROM {table_name} AS t JOIN "
+            f"(SELECT instrument, MAX(trade_date) AS trade_date FROM {table_name} "
+            f"WHERE trade_date < ? GROUP BY instrument) USING (instrument, trade_date)",
+            conn, params=(trade_date,),
+        )
+
+    def update_dominant(self, conn: sqlite3.Connection, trade_dates: list[str], replace: bool = False) -> int:
+        """
+        build dominant and continuous tables of trade_dates, which follow the last date of the
+        dominant table, from raw market data and contracts, and append them in one transaction
+
+        :param replace: if True, rows of [trade_dates[0], trade_dates[-1]] in both tables are
+                        deleted first, in the same transaction, dates before them must be built
+        :return: rows of dominant table written
+        """
+        data = pd.concat([self.load_md_cntrcts(d) for d in trade_dates], axis=0, ignore_index=True)
+        data = data[~data["instrument"].str.startswith("SCTAS")]
+        dominant = self.select_dominant(data, self.read_last_rows(conn, self.dominant_name, trade_dates[0]))
+        continuous = self.make_continuous(
+            data, dominant, self.read_last_rows(conn, self.continuous_name, trade_dates[0]),
+        )
+        with conn:  # one transaction
+            for name, table_data in ((self.dominant_name, dominant), (self.continuous_name, continuous)):
+                if replace:
+                    conn.execute(f"DELETE FROM {name} WHERE trade_date BETWEEN ? AND ?",
+                                 (trade_dates[0], trade_dates[-1]))
+                sql = (f"INSERT OR REPLACE INTO {name} ({', '.join(table_data.columns)}) "
+                       f"VALUES ({', '.join(['?'] * len(table_data.columns))})")
+                conn.executemany(sql, table_data.astype(object).where(table_data.notna(), None).to_numpy().tolist())
+        return len(dominant)
+
+    def sync_dominant(self) -> int:
+        """
+        build dominant and continuous tables for dates of the fmd table after the last date of
+        the dominant table, DOMINANT_CHUNK_SIZE dates at a time, so only new dates are read
+        after an update, and the whole history is built once when the tables are created
+
+        :return: number of dates built
+        """
+        if not os.path.exists(db_path := self.get_db_path()):
+            return 0
+        table_name = self.db_struct.table.name
+        with closing(sqlite3.connect(db_path)) as conn:
+            if conn.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?",
+                            (table_name,)).fetchone() is None:
+                return 0
+            create_table_indexes(conn, table_name, self.INDEXES)  # new dates are found by the index
+            self.create_dominant_tables(conn)
+            last_date = conn.execute(f"SELECT MAX(trade_date) FROM {self.dominant_name}").fetchone()[0]
+            new_dates = [row[0] for row in conn.execute(
+                f"SELECT DISTINCT trade_date FROM {table_name} WHERE trade_date > ? ORDER BY trade_date",
+                (last_date or "",),
+            )]
+            for i in range(0, len(new_dates), self.DOMINANT_CHUNK_SIZE):
+                chunk_dates = new_dates[i:i + self.DOMINANT_CHUNK_SIZE]
+                rows = self.update_dominant(conn, chunk_dates)
+                metrics.inc("rows_written_total", rows, dataset=f"sqlite.{self.dominant_name}")
+        if new_dates:
+            logger.info(f"{self.dominant_name} and {self.continuous_name} are updated "
+                        f"from {new_dates[0]} to {new_dates[-1]}")
+        return len(new_dates)
+
+    def refresh_dominant(self, trade_dates: list[str]) -> int:
+        """
+        build dominant and continuous tables again from the first of trade_dates, after they are
+        replaced in the fmd table. A changed dominant or factor carries over to later dates, so
+        later dates are built again too, DOMINANT_CHUNK_SIZE dates at a time, until each instrument
+        whose rows changed has unchanged rows again, after which nothing can change. Dates after
+        the last date of the dominant table are left to sync_dominant.
+
+        :param trade_dates: sorted dates replaced
+        :return: number of dates built
+        """
+        if not os.path.exists(db_path := self.get_db_path()):
+            return 0
+        table_name = self.db_struct.table.name
+        with closing(sqlite3.connect(db_path)) as conn:
+            if conn.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?",
+                            (self.dominant_name,)).fetchone() is None:
+                return 0
+            last_date = conn.execute(f"SELECT MAX(trade_date) FROM {self.dominant_name}").fetchone()[0]
+            if last_date is None or trade_dates[0] > last_date:
+                return 0
+            dates = [row[0] for row in conn.execute(
+                f"SELECT DISTINCT trade_date FROM {table_name} WHERE trade_date BETWEEN ? AND ? ORDER BY trade_date",
+                (trade_dates[0], last_date),
+            )]
+            sql = (f"SELECT * FROM {self.dominant_name} JOIN {self.continuous_name} USING (trade_date, instrument) "
+                   f"WHERE trade_date BETWEEN ? AND ?")
+            changed: set[str] = set()
+            n_dates = 0
+            for i in range(0, len(dates), self.DOMINANT_CHUNK_SIZE):
+                chunk_dates = dates[i:i + self.DOMINANT_CHUNK_SIZE]
+                old_rows = pd.read_sql(sql, conn, params=(chunk_dates[0], chunk_dates[-1]))
+                rows = self.update_dominant(conn, chunk_dates, replace=True)
+                metrics.inc("rows_written_total", rows, dataset=f"sqlite.{self.dominant_name}")
+                new_rows = pd.read_sql(sql, conn, params=(chunk_dates[0], chunk_dates[-1]))
+                diff = pd.concat([old_rows, new_rows], axis=0, ignore_index=True).drop_duplicates(keep=False)
+                changed = (changed - set(new_rows["instrument"])) | set(diff["instrument"])
+                n_dates += len(chunk_dates)
+                if chunk_dates[-1] >= trade_dates[-1] and not changed:
+                    break
+        if n_dates > 0:
+            logger.info(f"{self.dominant_name} and {self.continuous_name} are built again "
+                        f"from {dates[0]} to {dates[n_dates - 1]}")
+        return n_dates
+
+    def main(self, bgn_date: str | None, stp_date: str, calendar: CCalendar, silent: bool = False,
+             chunk_size: int = 0, resume: bool = False, workers: int = 1, replace: bool = False):
+        """
+        the same as __CDbWriter.main, then the dominant and continuous tables catch up with
+        the dates written, even if the update fails after some chunks are written. If replace
+        is True, dates replaced and those depending on them are built again first.
+
+        """
+        try:
+            return super().main(bgn_date, stp_date, calendar, silent=silent,
+                                chunk_size=chunk_size, resume=resume, workers=workers, replace=replace)
+        finally:
+            with metrics.timer("db_writer_seconds", table=self.db_struct.table.name, stage="dominant"):
+                if replace and not resume and bgn_date is not None and bgn_date < stp_date:
+                    self.refresh_dominant(calendar.get_iter_list(bgn_date, stp_date))
+                self.sync_dominant()
+
 
 class CDbWriterPos(__CDbWriter):
+    EXCHANGE_MAP = {
+        "SHFE": "SHF",
+        "INE": "INE",
+        "DCE": "DCE",
+        "CZCE": "ZCE",
+        "GFEX": "GFE",
+        "CFFEX": "CFX",
+    }
+    CONTRACT_PATTERN = r"^[A-Z]{1,2}[\d]{4}\.[A-Z]{3}$"  # format "XX0000.YYY" or "X0000.YYY"
+    INSTRUMENT_PATTERN = r"^[A-Z]{1,2}\.[A-Z]{3}$"  # format "XX.YYY" or "X.YYY"
+
+    # summary table "{table}_summary", one row for each (trade_date, instrument, code_type), holdings of
+    # each broker are summed over contracts first. top_* are sums of the SUMMARY_TOP largest brokers,
+    # *_diff are changes from the previous trade date in the table, NULL if the group is not in it.
+    SUMMARY_TOP = 20
+    SUMMARY_CHUNK_SIZE = 60
+    SUMMARY_KEYS = ("trade_date", "instrument", "code_type")
+    SUMMARY_SUM_VARS = ("vol", "long_hld", "long_chg", "short_hld", "short_chg")
+    SUMMARY_COLUMNS = {
+        "trade_date": "TEXT", "instrument": "TEXT", "code_type": "INTEGER", "brokers": "INTEGER",
+        "vol": "REAL", "long_hld": "REAL", "long_chg": "REAL", "short_hld": "REAL", "short_chg": "REAL",
+        "net_hld": "REAL", "top_long": "REAL", "top_short": "REAL", "top_net": "REAL",
+        "net_hld_diff": "REAL", "top_net_diff": "REAL",
+    }
+
     @staticmethod
     def drop_symbols(raw_data: pd.DataFrame) -> pd.DataFrame:
-        filter_rows = raw_data["symbol"].map(lambda _: not _.endswith("ACTV"))
+        filter_rows = ~raw_data["symbol"].str.endswith("ACTV")
         return raw_data[filter_rows].copy()
 
     @staticmethod
@@ -85,6 +741,15 @@ class CDbWriterPos(__CDbWriter):
         check_cols = ["broker", "vol", "vol_chg", "long_hld", "long_chg", "short_hld", "short_chg"]
         return raw_data.dropna(axis=0, subset=check_cols, how="all")
 
+    @staticmethod
+    def map_unique(data: pd.Series, func: Callable[[str], str | int]) -> pd.Series:
+        """
+        brokers and symbols repeat heavily, so func is called once for each unique value,
+        and the results are mapped back by a hash lookup
+
+        """
+        return data.map({v: func(v) for v in data.unique()})
+
     @staticmethod
     def rft_broker(broker: str) -> str:
         return broker.replace("（代客）", "").replace("(代客)", "")
@@ -100,38 +765,194 @@ class CDbWriterPos(__CDbWriter):
 
     @staticmethod
     def rft_exchange(exchange: str) -> str:
-        return {
-            "SHFE": "SHF",
-            "INE": "INE",
-            "DCE": "DCE",
-            "CZCE": "ZCE",
-            "GFEX": "GFE",
-            "CFFEX": "CFX",
-        }[exchange]
+        return CDbWriterPos.EXCHANGE_MAP[exchange]
 
     @staticmethod
-    def parse_code_type(code: str, trade_date: str) -> int:
-        if re.match(pattern=r"^[A-Z]{1,2}[\d]{4}\.[A-Z]{3}$", string=code) is not None:
-            # format "XX0000.YYY" or "X0000.YYY"
-            return 0
-        elif re.match(pattern=r"^[A-Z]{1,2}\.[A-Z]{3}$", string=code) is not None:
-            # format "XX.YYY" or "X.YYY"
-            return 1
-        else:
+    def parse_code_types(codes: pd.Series, trade_date: str) -> pd.Series:
+        is_contract = codes.str.match(CDbWriterPos.CONTRACT_PATTERN)
+        is_instrument = codes.str.match(CDbWriterPos.INSTRUMENT_PATTERN)
+        if not (is_contract | is_instrument).all():
+            code = codes[~(is_contract | is_instrument)].iloc[0]
             raise ValueError(f"Pattern can not be parsed for code = {SFY(code)} @ {SFY(trade_date)}")
+        return pd.Series(np.where(is_contract, 0, 1), index=codes.index)
 
     def reformat(self, raw_data: pd.DataFrame, trade_date: str) -> pd.DataFrame:
         raw_data = self.drop_symbols(raw_data)
         raw_data = self.drop_nan_rows(raw_data)
-        raw_data["broker"] = raw_data["broker"].map(self.rft_broker)
-        raw_data["symbol"] = raw_data["symbol"].map(self.rft_symbol)
-        raw_data["exchange"] = raw_data["exchange"].map(self.rft_exchange)
-        raw_data["ts_code"] = raw_data[["symbol", "exchange"]].apply(lambda z: f"{z['symbol']}.{z['exchange']}", axis=1)
-        raw_data["instrument"] = raw_data["ts_code"].map(parse_instrument_from_contract)
-        raw_data["code_type"] = raw_data["ts_code"].map(lambda _: self.parse_code_type(_, trade_date))
+        raw_data["broker"] = self.map_unique(raw_data["broker"], self.rft_broker)
+        raw_data["symbol"] = self.map_unique(raw_data["symbol"], self.rft_symbol)
+        raw_data["exchange"] = raw_data["exchange"].map(self.EXCHANGE_MAP)
+        if raw_data["exchange"].isna().any():
+            raise KeyError(f"Unknown exchange in position data @ {SFY(trade_date)}")
+        raw_data["ts_code"] = raw_data["symbol"] + "." + raw_data["exchange"]
+        raw_data["instrument"] = self.map_unique(raw_data["ts_code"], parse_instrument_from_contract)
+        raw_data["code_type"] = self.parse_code_types(raw_data["ts_code"], trade_date)
         rft_data = raw_data[self.db_struct.table.vars.names]
         return rft_data
 
+    @property
+    def summary_name(self) -> str:
+        return f"{self.db_struct.table.name}_summary"
+
+    @staticmethod
+    def summarize(data: pd.DataFrame, top: int) -> pd.DataFrame:
+        """
+
+        :param data: rows of the position table, of one or more trade dates
+        :param top: number of largest brokers summed in top_*
+        :return: summary of each (trade_date, instrument, code_type), without *_diff
+        """
+        keys, sum_vars = list(CDbWriterPos.SUMMARY_KEYS), list(CDbWriterPos.SUMMARY_SUM_VARS)
+        by_broker = data.groupby(keys + ["broker"])[sum_vars].sum(min_count=1).reset_index()
+        summary = by_broker.groupby(keys).agg(
+            brokers=("broker", "size"), **{v: (v, "sum") for v in sum_vars},
+        )
+        summary["net_hld"] = summary["long_hld"] - summary["short_hld"]
+        for side in ("long", "short"):
+            ranked = by_broker.sort_values(f"{side}_hld", ascending=False)
+            summary[f"top_{side}"] = ranked.groupby(keys).head(top).groupby(keys)[f"{side}_hld"].sum()
+        summary["top_net"] = summary["top_long"] - summary["top_short"]
+        return summary.reset_index()
+
+    @staticmethod
+    def add_diffs(summary: pd.DataFrame, prev_summary: pd.DataFrame) -> pd.DataFrame:
+        """
+
+        :param summary: of consecutive trade dates
+        :param prev_summary: of the trade date before them, may be empty
+        :return: summary with net_hld_diff and top_net_diff
+        """
+        both = pd.concat([prev_summary, summary], axis=0, ignore_index=True)
+        dates = np.sort(both["trade_date"].unique())
+        both["date_idx"] = np.searchsorted(dates, both["trade_date"])
+        both = both.sort_values(by=["instrument", "code_type", "date_idx"])
+        prev = both.groupby(["instrument", "code_type"])[["date_idx", "net_hld", "top_net"]].shift(1)
+        is_prev_date = prev["date_idx"] == both["date_idx"] - 1
+        both["net_hld_diff"] = (both["net_hld"] - prev["net_hld"]).where(is_prev_date)
+        both["top_net_diff"] = (both["top_net"] - prev["top_net"]).where(is_prev_date)
+        both = both[both["trade_date"].isin(summary["trade_date"])]
+        return both.sort_values(by=list(CDbWriterPos.SUMMARY_KEYS))[list(CDbWriterPos.SUMMARY_COLUMNS)]
+
+    def create_summary_table(self, conn: sqlite3.Connection):
+        columns = ", ".join(f"{k} {v}" for k, v in self.SUMMARY_COLUMNS.items())
+        conn.execute(
+            f"CREATE TABLE IF NOT EXISTS {self.summary_name} "
+            f"({columns}, PRIMARY KEY ({', '.join(self.SUMMARY_KEYS)}))"
+        )
+        return 0
+
+    def update_summary(self, conn: sqlite3.Connection, trade_dates: list[str], replace: bool = False) -> int:
+        """
+        summarize rows of trade_dates in the position table, which follow the last date of
+        the summary table, and append them in one transaction
+
+        :param replace: if True, rows of [trade_dates[0], trade_dates[-1]] in the summary table
+                        are deleted first, in the same transaction
+        :return: rows of summary written
+        """
+        table_name = self.db_struct.table.name
+        columns = ", ".join(self.SUMMARY_KEYS[:1] + ("broker",) + self.SUMMARY_KEYS[1:] + self.SUMMARY_SUM_VARS)
+        data = pd.read_sql(
+            f"SELECT {columns} FROM {table_name} WHERE trade_date BETWEEN ? AND ?",
+            conn, params=(trade_dates[0], trade_dates[-1]),
+        )
+        prev_summary = pd.read_sql(
+            f"SELECT * FROM {self.summary_name} WHERE trade_date = "
+            f"(SELECT MAX(trade_date) FROM {self.summary_name} WHERE trade_date < ?)",
+            conn, params=(trade_dates[0],),
+        )
+        if data.empty:  # all dates are deleted from the position table
+            summary = pd.DataFrame(columns=list(self.SUMMARY_COLUMNS))
+        else:
+            summary = self.add_diffs(self.summarize(data, self.SUMMARY_TOP), prev_summary)
+        sql = (f"INSERT OR REPLACE INTO {self.summary_name} ({', '.join(summary.columns)}) "
+               f"VALUES ({', '.join(['?'] * len(summary.columns))})")
+        rows = summary.astype(object).where(summary.notna(), None).to_numpy().tolist()
+        with conn:  # one transaction
+            if replace:
+                conn.execute(f"DELETE FROM {self.summary_name} WHERE trade_date BETWEEN ? AND ?",
+                             (trade_dates[0], trade_dates[-1]))
+            conn.executemany(sql, rows)
+        return len(rows)
+
+    def sync_summary(self) -> int:
+        """
+        summarize dates of the position table after the last date of the summary table,
+        SUMMARY_CHUNK_SIZE dates at a time, so only new dates are read after an update,
+        and the whole history is summarized once when the summary table is created
+
+        :return: number of dates summarized
+        """
+        if not os.path.exists(db_path := self.get_db_path()):
+            return 0
+        table_name = self.db_struct.table.name
+        with closing(sqlite3.connect(db_path)) as conn:
+            if conn.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?",
+                            (table_name,)).fetchone() is None:
+                return 0
+            create_table_indexes(conn, table_name, self.INDEXES)  # new dates are found by the index
+            self.create_summary_table(conn)
+            last_date = conn.execute(f"SELECT MAX(trade_date) FROM {self.summary_name}").fetchone()[0]
+            new_dates = [row[0] for row in conn.execute(
+                f"SELECT DISTINCT trade_date FROM {table_name} WHERE trade_date > ? ORDER BY trade_date",
+                (last_date or "",),
+            )]
+            for i in range(0, len(new_dates), self.SUMMARY_CHUNK_SIZE):
+                chunk_dates = new_dates[i:i + self.SUMMARY_CHUNK_SIZE]
+                rows = self.update_summary(conn, chunk_dates)
+                metrics.inc("rows_written_total", rows, dataset=f"sqlite.{self.summary_name}")
+        if new_dates:
+            logger.info(f"{self.summary_name} is updated from {new_dates[0]} to {new_dates[-1]}")
+        return len(new_dates)
+
+    def refresh_summary(self, trade_dates: list[str]) -> int:
+        """
+        summarize trade_dates again after they are replaced in the position table, with the
+        date after them, whose *_diff depend on them. Dates after the last date of the summary
+        table are left to sync_summary.
+
+        :param trade_dates: sorted dates replaced
+        :return: number of dates summarized
+        """
+        if not os.path.exists(db_path := self.get_db_path()):
+            return 0
+        table_name = self.db_struct.table.name
+        with closing(sqlite3.connect(db_path)) as conn:
+            if conn.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?",
+                            (self.summary_name,)).fetchone() is None:
+                return 0
+            last_date = conn.execute(f"SELECT MAX(trade_date) FROM {self.summary_name}").fetchone()[0]
+            if last_date is None or trade_dates[0] > last_date:
+                return 0
+            next_date = conn.execute(f"SELECT MIN(trade_date) FROM {table_name} WHERE trade_date > ?",
+                                     (trade_dates[-1],)).fetchone()[0]
+            dates = [d for d in trade_dates if d <= last_date]
+            if next_date is not None and next_date <= last_date:
+                dates.append(next_date)
+            for i in range(0, len(dates), self.SUMMARY_CHUNK_SIZE):
+                chunk_dates = dates[i:i + self.SUMMARY_CHUNK_SIZE]
+                rows = self.update_summary(conn, chunk_dates, replace=True)
+                metrics.inc("rows_written_total", rows, dataset=f"sqlite.{self.summary_name}")
+        logger.info(f"{self.summary_name} is summarized again from {dates[0]} to {dates[-1]}")
+        return len(dates)
+
+    def main(self, bgn_date: str | None, stp_date: str, calendar: CCalendar, silent: bool = False,
+             chunk_size: int = 0, resume: bool = False, workers: int = 1, replace: bool = False):
+        """
+        the same as __CDbWriter.main, then the summary table catches up with the dates
+        written, even if the update fails after some chunks are written. If replace is
+        True, dates replaced are summarized again first.
+
+        """
+        try:
+            return super().main(bgn_date, stp_date, calendar, silent=silent,
+                                chunk_size=chunk_size, resume=resume, workers=workers, replace=replace)
+        finally:
+            with metrics.timer("db_writer_seconds", table=self.db_struct.table.name, stage="summary"):
+                if replace and not resume and bgn_date is not None and bgn_date < stp_date:
+                    self.refresh_summary(calendar.get_iter_list(bgn_date, stp_date))
+                self.sync_summary()
+
 
 class CDbWriterBasis(__CDbWriter):
     def reformat(self, raw_data: pd.DataFrame, trade_date: str) -> pd.DataFrame:
@@ -145,3 +966,55 @@ class CDbWriterStock(__CDbWriter):
         raw_data["trade_date"] = trade_date
         rft_data = raw_data[self.db_struct.table.vars.names]
         return rft_data
+
+
+class CDbWriterMinuteBar(__CDbWriter):
+    """
+    Built for bulk ingest of millions of rows. Each chunk is inserted with one prepared
+    statement in one transaction. When BULK_DATES or more dates are appended, the index on
+    (ts_code, trade_date, timestamp) is dropped before loading and rebuilt once after it,
+    so inserts do not maintain it row by row. Daily updates keep it.
+    """
+
+    INDEXES = (("trade_date",), ("ts_code", "trade_date", "timestamp"))
+    BULK_DATES = 60
+    CHUNK_SIZE = 20
+
+    def reformat(self, raw_data: pd.DataFrame, trade_date: str) -> pd.DataFrame:
+        raw_data["trade_date"] = trade_date
+        if pd.api.types.is_datetime64_any_dtype(raw_data["timestamp"]):
+            raw_data["timestamp"] = raw_data["timestamp"].dt.strftime("%Y-%m-%d %H:%M:%S")
+        rft_data = raw_data[self.db_struct.table.vars.names]
+        return rft_data
+
+    def bulk_insert(self, new_data: pd.DataFrame):
+        var_names = self.db_struct.table.vars.names
+        sql = (f"INSERT INTO {self.db_struct.table.name} ({', '.join(var_names)}) "
+               f"VALUES ({', '.join(['?'] * len(var_names))})")
+        rows = new_data[var_names].to_numpy(dtype=object).tolist()  # numpy scalars to python objects
+        with closing(sqlite3.connect(self.get_db_path())) as conn:
+            conn.execute("PRAGMA synchronous = NORMAL")
+            conn.execute("PRAGMA cache_size = -262144")  # 256MB
+            with conn:  # one transaction
+                conn.executemany(sql, rows)
+        return 0
+
+    def to_sqldb(self, new_data: pd.DataFrame, calendar: CCalendar, sqldb: CMgrSqlDb | None = None,
+                 incoming_date: str | None = None) -> int:
+        sqldb = sqldb or self.get_sqldb()
+        incoming_date = incoming_date or new_data["trade_date"].iloc[0]
+        if (continuity := sqldb.check_continuity(incoming_date=incoming_date, calendar=calendar)) == 0:
+            if not new_data.empty:
+                self.bulk_insert(new_data)
+        return continuity
+
+    def main(self, bgn_date: str | None, stp_date: str, calendar: CCalendar, silent: bool = False,
+             chunk_size: int = 0, resume: bool = False, workers: int = 1, replace: bool = False):
+        """
+        the same as __CDbWriter.main, but data is always written in chunks, CHUNK_SIZE dates
+        if chunk_size is 0, because minute bars of a year do not fit in memory.
+
+        """
+        return super().main(bgn_date, stp_date, calendar, silent=silent,
+                            chunk_size=chunk_size or self.CHUNK_SIZE, resume=resume, workers=workers,
+                            replace=replace)
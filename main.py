@@ -1,10 +1,27 @@
 import argparse
+import datetime as dt
+from typing import TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from husfort.qcalendar import CCalendar
+
+# Only argparse is imported at module level, project_cfg, engines, writers and provider SDKs
+# are imported by the switches needing them, so "--help" and "update" start quickly.
+
+DOWNLOAD_SWITCHES = ("fmd", "contract", "universe", "minute", "position", "basis", "stock")
+UPDATE_SWITCHES = ("fmd", "position", "basis", "stock", "minute")
 
 
 def parse_args():
     arg_parser_main = argparse.ArgumentParser(description="Project to download data from tushare")
-    arg_parser_main.add_argument("--bgn", type=str, required=True)
+    arg_parser_main.add_argument("--bgn", type=str, default=None, help="optional only for 'update --resume'")
     arg_parser_main.add_argument("--stp", type=str, default=None)
+    arg_parser_main.add_argument(
+        "--profile", type=str, default=None,
+        help="save metrics of this run to this path, like 'logs/profile.json', in Prometheus textfile format "
+             "if it ends with '.prom': wall time of each stage, provider latency, time slept for rate limits "
+             "and retries, rows and bytes of each date, cache hit rates and peak RSS",
+    )
 
     arg_parser_subs = arg_parser_main.add_subparsers(
         title="sub function",
@@ -14,16 +31,86 @@ def parse_args():
 
     # func: download
     arg_parser_sub = arg_parser_subs.add_parser(name="download", help="Download data from tushare and wind")
+    arg_parser_sub.add_argument("--switch", type=str, required=True, choices=DOWNLOAD_SWITCHES)
     arg_parser_sub.add_argument(
-        "--switch", type=str, required=True,
-        choices=("fmd", "contract", "universe", "minute", "position", "basis", "stock"),
+        "--sweep", default=False, action="store_true",
+        help="only works for switch 'minute', read tick data of each month in one sequential pass",
+    )
+    arg_parser_sub.add_argument(
+        "--tick-cache", default=False, action="store_true",
+        help="only works for switch 'minute', decode tick data of each contract-day once into "
+             "pro_cfg.tick_cache_dir and read it from there in later runs",
+    )
+    arg_parser_sub.add_argument(
+        "--batch", type=int, default=0,
+        help="only works for switch 'basis' and 'stock', download this many dates in one wind request, "
+             "0 means download date by date",
     )
 
     # func: update
     arg_parser_sub = arg_parser_subs.add_parser(name="update", help="Update data for database")
+    arg_parser_sub.add_argument("--switch", type=str, required=True, choices=UPDATE_SWITCHES)
+    arg_parser_sub.add_argument(
+        "--chunk", type=int, default=0,
+        help="write every this many dates in one transaction to keep memory flat, 0 means write all at once",
+    )
+    arg_parser_grp = arg_parser_sub.add_mutually_exclusive_group()
+    arg_parser_grp.add_argument(
+        "--resume", default=False, action="store_true",
+        help="start from the date after the last date in the table, --bgn is only used if the table is empty; "
+             "without --stp, update to the last date whose raw data exists",
+    )
+    arg_parser_grp.add_argument(
+        "--replace", default=False, action="store_true",
+        help="delete rows of dates in [bgn, stp) and insert them again in one transaction for each chunk, "
+             "any window works, like one in the middle of history, derived tables are rebuilt from it",
+    )
+    arg_parser_sub.add_argument(
+        "--workers", type=int, default=1,
+        help="number of processes to reformat raw data, the next files are read ahead by threads, 1 means sequential",
+    )
+
+    # func: manifest
+    arg_parser_sub = arg_parser_subs.add_parser(
+        name="manifest", help="Report missing and empty dates of daily data, from the manifest of saved partitions"
+    )
+    arg_parser_sub.add_argument(
+        "--switch", type=str, nargs="*", default=list(DOWNLOAD_SWITCHES), choices=DOWNLOAD_SWITCHES,
+        help="datasets to check, all by default",
+    )
+    arg_parser_sub.add_argument(
+        "--rebuild", default=False, action="store_true",
+        help="record existing files which are not in the manifest, run it once for data saved before the manifest",
+    )
+    arg_parser_sub.add_argument(
+        "--repair", default=False, action="store_true",
+        help="implies --rebuild, verify recorded files, move corrupt ones aside, and download missing dates again",
+    )
+    arg_parser_sub.add_argument(
+        "--quick", default=False, action="store_true",
+        help="verify files by size only in --repair, instead of by checksum",
+    )
+
+    # func: run
+    arg_parser_sub = arg_parser_subs.add_parser(
+        name="run", help="Download all data and update all databases in one process, independent steps in parallel"
+    )
+    arg_parser_sub.add_argument(
+        "--skip", type=str, nargs="*", default=[],
+        help="steps to skip, like 'download.minute', their outputs are assumed to be ready",
+    )
+    arg_parser_sub.add_argument("--workers", type=int, default=4, help="max number of steps running at once")
+    arg_parser_sub.add_argument(
+        "--sweep", default=False, action="store_true",
+        help="read tick data of each month in one sequential pass for step 'download.minute'",
+    )
+    arg_parser_sub.add_argument(
+        "--tick-cache", default=False, action="store_true",
+        help="cache decoded tick data in pro_cfg.tick_cache_dir for step 'download.minute'",
+    )
     arg_parser_sub.add_argument(
-        "--switch", type=str, required=True,
-        choices=("fmd", "position", "basis", "stock"),
+        "--batch", type=int, default=0,
+        help="download this many dates in one wind request for steps 'download.basis' and 'download.stock'",
     )
 
     # --- parse args
@@ -31,132 +118,313 @@ def parse_args():
     return _args
 
 
+def download(switch: str, bgn: str, stp: str, calendar: "CCalendar",
+             sweep: bool = False, batch: int = 0, tick_cache: bool = False, rate_limiter=None, silent: bool = False):
+    """
+
+    :param tick_cache: only works for switch 'minute', cache decoded tick data in pro_cfg.tick_cache_dir
+    :param rate_limiter: shared by tushare and wind engines running at the same time, if None, a new one is created
+    :return: 1 if any date is skipped, after retries, else 0
+    """
+    from project_cfg import pro_cfg
+
+    if switch in ("fmd", "position", "basis", "stock") and rate_limiter is None:
+        from throttle import CRateLimiter
+
+        rate_limiter = CRateLimiter({**pro_cfg.tushare_rate_limits, **pro_cfg.wind_rate_limits})
+
+    if switch == "fmd":
+        from data_engines import CDataEngineTushareFutDailyMd
+
+        engine = CDataEngineTushareFutDailyMd(
+            save_root_dir=pro_cfg.daily_data_root_dir,
+            save_data_info=pro_cfg.futures_md,
+            rate_limiter=rate_limiter,
+        )
+    elif switch == "contract":
+        from data_engines import CDataEngineTushareFutDailyCntrcts
+
+        engine = CDataEngineTushareFutDailyCntrcts(
+            save_root_dir=pro_cfg.daily_data_root_dir,
+            save_data_info=pro_cfg.futures_contracts,
+            md_data_info=pro_cfg.futures_md,
+        )
+    elif switch == "universe":
+        from data_engines import CDataEngineTushareFutDailyUnvrs
+
+        engine = CDataEngineTushareFutDailyUnvrs(
+            save_root_dir=pro_cfg.daily_data_root_dir,
+            save_data_info=pro_cfg.futures_universe,
+            cntrcts_data_info=pro_cfg.futures_contracts,
+            exceptions={"SCTAS.INE"},
+        )
+    elif switch == "minute":
+        from data_engines import CDataEngineTushareFutDailyMinuteBar
+
+        engine = CDataEngineTushareFutDailyMinuteBar(
+            save_root_dir=pro_cfg.daily_data_root_dir,
+            save_data_info=pro_cfg.futures_minute_bar,
+            md_data_info=pro_cfg.futures_md,
+            cntrcts_data_info=pro_cfg.futures_contracts,
+            tick_data_root_dir=pro_cfg.tick_data_root_dir,
+            calendar=calendar,
+            month_sweep=sweep,
+            tick_cache_dir=pro_cfg.tick_cache_dir if tick_cache else None,
+        )
+    elif switch == "position":
+        from data_engines import CDataEngineTushareFutDailyPos
+
+        engine = CDataEngineTushareFutDailyPos(
+            save_root_dir=pro_cfg.daily_data_root_dir,
+            save_data_info=pro_cfg.futures_pos,
+            exchanges=pro_cfg.futures_exchanges,
+            rate_limiter=rate_limiter,
+        )
+    elif switch == "basis":
+        from data_engines import CDataEngineWindFutDailyBasis
+
+        engine = CDataEngineWindFutDailyBasis(
+            save_root_dir=pro_cfg.daily_data_root_dir,
+            save_data_info=pro_cfg.futures_basis,
+            unvrs_data_info=pro_cfg.futures_universe,
+            rate_limiter=rate_limiter,
+            range_batch=batch,
+        )
+    elif switch == "stock":
+        from data_engines import CDataEngineWindFutDailyStock
+
+        engine = CDataEngineWindFutDailyStock(
+            save_root_dir=pro_cfg.daily_data_root_dir,
+            save_data_info=pro_cfg.futures_stock,
+            unvrs_data_info=pro_cfg.futures_universe,
+            rate_limiter=rate_limiter,
+            range_batch=batch,
+        )
+    else:
+        raise ValueError(f"switch = {switch} is illegal")
+    engine.download_data_range(bgn_date=bgn, stp_date=stp, calendar=calendar, silent=silent)
+    return 1 if engine.skipped_dates else 0
+
+
+def update(switch: str, bgn: str | None, stp: str, calendar: "CCalendar", silent: bool = False,
+           chunk: int = 0, resume: bool = False, workers: int = 1, replace: bool = False) -> int:
+    """
+
+    :return: 0 if all dates are written, else the result of the failed continuity check
+    """
+    from project_cfg import pro_cfg, db_struct_cfg
+
+    if switch == "fmd":
+        from databases import CDbWriterFmd
+
+        sqldb_writer = CDbWriterFmd(
+            db_struct=db_struct_cfg.fmd,
+            raw_data_root_dir=pro_cfg.daily_data_root_dir,
+            raw_data_info=pro_cfg.futures_md,
+            cntrcts_data_info=pro_cfg.futures_contracts,
+        )
+    elif switch == "position":
+        from databases import CDbWriterPos
+
+        sqldb_writer = CDbWriterPos(
+            db_struct=db_struct_cfg.position,
+            raw_data_root_dir=pro_cfg.daily_data_root_dir,
+            raw_data_info=pro_cfg.futures_pos,
+        )
+    elif switch == "basis":
+        from databases import CDbWriterBasis
+
+        sqldb_writer = CDbWriterBasis(
+            db_struct=db_struct_cfg.basis,
+            raw_data_root_dir=pro_cfg.daily_data_root_dir,
+            raw_data_info=pro_cfg.futures_basis,
+        )
+    elif switch == "stock":
+        from databases import CDbWriterStock
+
+        sqldb_writer = CDbWriterStock(
+            db_struct=db_struct_cfg.stock,
+            raw_data_root_dir=pro_cfg.daily_data_root_dir,
+            raw_data_info=pro_cfg.futures_stock,
+        )
+    elif switch == "minute":
+        from databases import CDbWriterMinuteBar
+
+        sqldb_writer = CDbWriterMinuteBar(
+            db_struct=db_struct_cfg.fMinuteBar,
+            raw_data_root_dir=pro_cfg.daily_data_root_dir,
+            raw_data_info=pro_cfg.futures_minute_bar,
+        )
+    else:
+        raise ValueError(f"switch = {switch} is illegal")
+    return sqldb_writer.main(
+        bgn_date=bgn, stp_date=stp, calendar=calendar, silent=silent, chunk_size=chunk, resume=resume, workers=workers,
+        replace=replace,
+    )
+
+
+def manifest(switches: list[str], bgn: str, stp: str, calendar: "CCalendar",
+             rebuild: bool = False, repair: bool = False, quick: bool = False) -> int:
+    """
+
+    :return: 1 if any date of the switches is still missing, else 0
+    """
+    import os
+    from loguru import logger
+    from project_cfg import pro_cfg
+    from manifest import get_manifest
+    from storage import get_save_path, rebuild_manifest
+
+    data_infos = {
+        "fmd": pro_cfg.futures_md,
+        "contract": pro_cfg.futures_contracts,
+        "universe": pro_cfg.futures_universe,
+        "minute": pro_cfg.futures_minute_bar,
+        "position": pro_cfg.futures_pos,
+        "basis": pro_cfg.futures_basis,
+        "stock": pro_cfg.futures_stock,
+    }
+    root_dir = pro_cfg.daily_data_root_dir
+    partition_manifest = get_manifest(root_dir)
+    if not (iter_dates := calendar.get_iter_list(bgn, stp)):
+        return 0
+    exit_code = 0
+    for switch in DOWNLOAD_SWITCHES:  # in the order of dependencies, contract is built from fmd, and so on
+        if switch not in switches:
+            continue
+        data_info = data_infos[switch]
+        if rebuild or repair:
+            n = rebuild_manifest(root_dir, data_info.file_format, iter_dates)
+            logger.info(f"{n} existing partitions of {data_info.desc} are recorded")
+        if repair:
+            partitions = partition_manifest.get_partitions(data_info.file_format, iter_dates[0], iter_dates[-1])
+            bad_dates: list[str] = []
+            for trade_date in iter_dates:
+                if (partition := partitions.get(trade_date)) is not None:
+                    reason = partition_manifest.verify(partition, checksum=not quick)
+                elif os.path.exists(get_save_path(root_dir, data_info.file_format, trade_date)):
+                    reason = "not readable"  # rebuild_manifest left it out
+                else:
+                    continue
+                if reason is not None:
+                    logger.warning(f"{data_info.desc} for {trade_date} is {reason}, it will be downloaded again")
+                    bad_dates.append(trade_date)
+            for trade_date in bad_dates:
+                if os.path.exists(path := get_save_path(root_dir, data_info.file_format, trade_date)):
+                    os.replace(path, f"{path}.bad")
+            partition_manifest.remove(data_info.file_format, bad_dates)
+            if bad_dates or len(partitions) < len(iter_dates):
+                download(switch, bgn, stp, calendar)
+        report = partition_manifest.get_gap_report(data_info.file_format, iter_dates)
+        missing, empty = report["missing"], report["empty"]
+        print(f"{data_info.desc:<36s} dates = {len(iter_dates):>5d}, missing = {len(missing):>5d}, "
+              f"empty = {len(empty):>5d}" + (f", first missing = {missing[0:5]}" if missing else ""))
+        if missing:
+            exit_code = 1
+    return exit_code
+
+
+def run(bgn: str, stp: str, calendar: "CCalendar", skip: list[str], workers: int, sweep: bool, batch: int,
+        tick_cache: bool = False) -> int:
+    """
+    the same steps as run_all.ps1, in one process. Downloading of positions, the chain of
+    fmd -> contract -> universe and the wind steps run in parallel, wind steps share one
+    api session, so they never run at the same time, neither do database updates.
+
+    """
+    from functools import partial
+    from project_cfg import pro_cfg
+    from throttle import CRateLimiter
+    from pipeline import CPipelineStep, CPipeline
+
+    rate_limiter = CRateLimiter({**pro_cfg.tushare_rate_limits, **pro_cfg.wind_rate_limits})
+    dl = partial(download, bgn=bgn, stp=stp, calendar=calendar, rate_limiter=rate_limiter, silent=True)
+    up = partial(update, bgn=bgn, stp=stp, calendar=calendar, silent=True)
+    steps = [
+        CPipelineStep("download.fmd", partial(dl, "fmd")),
+        CPipelineStep("download.contract", partial(dl, "contract"), deps=("download.fmd",)),
+        CPipelineStep("download.universe", partial(dl, "universe"), deps=("download.contract",)),
+        CPipelineStep("download.position", partial(dl, "position")),
+        CPipelineStep("download.basis", partial(dl, "basis", batch=batch),
+                      deps=("download.universe",), resources=("wind",)),
+        CPipelineStep("download.stock", partial(dl, "stock", batch=batch),
+                      deps=("download.universe",), resources=("wind",)),
+        CPipelineStep("download.minute", partial(dl, "minute", sweep=sweep, tick_cache=tick_cache),
+                      deps=("download.contract",)),
+        CPipelineStep("update.fmd", partial(up, "fmd"),
+                      deps=("download.fmd", "download.contract"), resources=("sqlite",)),
+        CPipelineStep("update.position", partial(up, "position"),
+                      deps=("download.position",), resources=("sqlite",)),
+        CPipelineStep("update.basis", partial(up, "basis"), deps=("download.basis",), resources=("sqlite",)),
+        CPipelineStep("update.stock", partial(up, "stock"), deps=("download.stock",), resources=("sqlite",)),
+        CPipelineStep("update.minute", partial(up, "minute"), deps=("download.minute",), resources=("sqlite",)),
+    ]
+    for step_name in skip:
+        if step_name not in (all_names := [step.name for step in steps]):
+            raise ValueError(f"step = {step_name} is illegal, available steps: {all_names}")
+    steps = [
+        CPipelineStep(step.name, step.func if step.name not in skip else (lambda: 0), step.deps, step.resources)
+        for step in steps
+    ]
+    status = CPipeline(steps, max_workers=workers).run()
+    return 0 if all(step_status == "done" for step_status in status.values()) else 1
+
+
 if __name__ == "__main__":
     import sys
-    from project_cfg import pro_cfg
+
+    args = parse_args()
+
+    from loguru import logger
     from husfort.qlog import define_logger
     from husfort.qcalendar import CCalendar
+    from project_cfg import pro_cfg
 
     define_logger()
+    logger.add("logs/download_and_update.log")
     calendar = CCalendar(calendar_path=pro_cfg.calendar_path)
 
-    args = parse_args()
+    resume = args.func == "update" and args.resume
+    if args.bgn is None and not resume:
+        print("bgn is required, unless func = update with --resume")
+        sys.exit(1)
     try:
-        bgn, stp = args.bgn, args.stp or calendar.get_next_date(args.bgn, shift=1)
+        if args.stp is not None:
+            bgn, stp = args.bgn, args.stp
+        elif resume:
+            bgn, stp = args.bgn, (dt.date.today() + dt.timedelta(days=1)).strftime("%Y%m%d")
+        else:
+            bgn, stp = args.bgn, calendar.get_next_date(args.bgn, shift=1)
     except ValueError:
-        print(f"Invalid bgn = {args.bgn} or stp = {args.stp}, func = {args.func}, switch = {args.switch}")
+        print(f"Invalid bgn = {args.bgn} or stp = {args.stp}, func = {args.func}, "
+              f"switch = {getattr(args, 'switch', None)}")
         sys.exit(1)
 
-    if args.func == "download":
-        if args.switch == "fmd":
-            from data_engines import CDataEngineTushareFutDailyMd
-
-            engine = CDataEngineTushareFutDailyMd(
-                save_root_dir=pro_cfg.daily_data_root_dir,
-                save_data_info=pro_cfg.futures_md,
-            )
-            engine.download_data_range(bgn_date=bgn, stp_date=stp, calendar=calendar)
-        elif args.switch == "contract":
-            from data_engines import CDataEngineTushareFutDailyCntrcts
-
-            engine = CDataEngineTushareFutDailyCntrcts(
-                save_root_dir=pro_cfg.daily_data_root_dir,
-                save_data_info=pro_cfg.futures_contracts,
-                md_data_info=pro_cfg.futures_md,
-            )
-            engine.download_data_range(bgn_date=bgn, stp_date=stp, calendar=calendar)
-        elif args.switch == "universe":
-            from data_engines import CDataEngineTushareFutDailyUnvrs
-
-            engine = CDataEngineTushareFutDailyUnvrs(
-                save_root_dir=pro_cfg.daily_data_root_dir,
-                save_data_info=pro_cfg.futures_universe,
-                cntrcts_data_info=pro_cfg.futures_contracts,
-                exceptions={"SCTAS.INE"},
-            )
-            engine.download_data_range(bgn_date=bgn, stp_date=stp, calendar=calendar)
-        elif args.switch == "minute":
-            from data_engines import CDataEngineTushareFutDailyMinuteBar
-
-            engine = CDataEngineTushareFutDailyMinuteBar(
-                save_root_dir=pro_cfg.daily_data_root_dir,
-                save_data_info=pro_cfg.futures_minute_bar,
-                md_data_info=pro_cfg.futures_md,
-                cntrcts_data_info=pro_cfg.futures_contracts,
-                tick_data_root_dir=pro_cfg.tick_data_root_dir,
-                calendar=calendar,
-            )
-            engine.download_data_range(bgn_date=bgn, stp_date=stp, calendar=calendar)
-        elif args.switch == "position":
-            from data_engines import CDataEngineTushareFutDailyPos
-
-            engine = CDataEngineTushareFutDailyPos(
-                save_root_dir=pro_cfg.daily_data_root_dir,
-                save_data_info=pro_cfg.futures_pos,
-                exchanges=pro_cfg.futures_exchanges,
-            )
-            engine.download_data_range(bgn_date=bgn, stp_date=stp, calendar=calendar)
-        elif args.switch == "basis":
-            from data_engines import CDataEngineWindFutDailyBasis
-
-            engine = CDataEngineWindFutDailyBasis(
-                save_root_dir=pro_cfg.daily_data_root_dir,
-                save_data_info=pro_cfg.futures_basis,
-                unvrs_data_info=pro_cfg.futures_universe,
-            )
-            engine.download_data_range(bgn_date=bgn, stp_date=stp, calendar=calendar)
-        elif args.switch == "stock":
-            from data_engines import CDataEngineWindFutDailyStock
-
-            engine = CDataEngineWindFutDailyStock(
-                save_root_dir=pro_cfg.daily_data_root_dir,
-                save_data_info=pro_cfg.futures_stock,
-                unvrs_data_info=pro_cfg.futures_universe,
-            )
-            engine.download_data_range(bgn_date=bgn, stp_date=stp, calendar=calendar)
-        else:
-            raise ValueError(f"switch = {args.switch} is illegal")
-    elif args.func == "update":
-        if args.switch == "fmd":
-            from databases import CDbWriterFmd
-            from project_cfg import pro_cfg, db_struct_cfg
-
-            sqldb_writer = CDbWriterFmd(
-                db_struct=db_struct_cfg.fmd,
-                raw_data_root_dir=pro_cfg.daily_data_root_dir,
-                raw_data_info=pro_cfg.futures_md,
-                cntrcts_data_info=pro_cfg.futures_contracts,
-            )
-            sqldb_writer.main(bgn_date=bgn, stp_date=stp, calendar=calendar)
-        elif args.switch == "position":
-            from databases import CDbWriterPos
-            from project_cfg import pro_cfg, db_struct_cfg
-
-            sqldb_writer = CDbWriterPos(
-                db_struct=db_struct_cfg.position,
-                raw_data_root_dir=pro_cfg.daily_data_root_dir,
-                raw_data_info=pro_cfg.futures_pos,
-            )
-            sqldb_writer.main(bgn_date=bgn, stp_date=stp, calendar=calendar)
-        elif args.switch == "basis":
-            from databases import CDbWriterBasis
-            from project_cfg import pro_cfg, db_struct_cfg
-
-            sqldb_writer = CDbWriterBasis(
-                db_struct=db_struct_cfg.basis,
-                raw_data_root_dir=pro_cfg.daily_data_root_dir,
-                raw_data_info=pro_cfg.futures_basis,
-            )
-            sqldb_writer.main(bgn_date=bgn, stp_date=stp, calendar=calendar)
-        elif args.switch == "stock":
-            from databases import CDbWriterStock
-            from project_cfg import pro_cfg, db_struct_cfg
-
-            sqldb_writer = CDbWriterStock(
-                db_struct=db_struct_cfg.stock,
-                raw_data_root_dir=pro_cfg.daily_data_root_dir,
-                raw_data_info=pro_cfg.futures_stock,
-            )
-            sqldb_writer.main(bgn_date=bgn, stp_date=stp, calendar=calendar)
-        else:
-            raise ValueError(f"switch = {args.switch} is illegal")
+    from storage import data_store
+    from metrics import metrics
+
+    exit_code = 0
+    try:
+        with metrics.timer("command_seconds", func=args.func, switch=getattr(args, "switch", "")):
+            if args.func == "download":
+                exit_code = download(args.switch, bgn, stp, calendar, sweep=args.sweep, batch=args.batch,
+                                     tick_cache=args.tick_cache)
+            elif args.func == "update":
+                exit_code = update(args.switch, bgn, stp, calendar, chunk=args.chunk, resume=args.resume,
+                                   workers=args.workers, replace=args.replace)
+            elif args.func == "manifest":
+                exit_code = manifest(args.switch, bgn, stp, calendar,
+                                     rebuild=args.rebuild, repair=args.repair, quick=args.quick)
+            elif args.func == "run":
+                exit_code = run(bgn, stp, calendar, skip=args.skip, workers=args.workers, sweep=args.sweep,
+                                batch=args.batch, tick_cache=args.tick_cache)
+            else:
+                raise ValueError(f"func = {args.func} is illegal")
+    finally:
+        logger.info(f"Daily data store: {data_store.report()}")
+        if args.profile is not None:
+            metrics.set_gauge("cached_bytes", data_store.cached_bytes, cache="data_store")
+            metrics.set_gauge("cached_items", len(data_store.cache), cache="data_store")
+            metrics.export(args.profile)
+            logger.info(f"Metrics are saved to {args.profile}")
+    sys.exit(exit_code)
@@ -0,0 +1,155 @@
+import os
+import zlib
+import time
+import sqlite3
+import threading
+from dataclasses import dataclass
+
+# One manifest for each root dir of daily data, at {root_dir}/manifest.db. Each partition
+# (file_format, trade_date) written by save_daily_data is recorded with its row count, size,
+# crc32 and write time, so skipping done dates and gap reports do not touch the file system.
+
+MANIFEST_NAME = "manifest.db"
+CHECKSUM_CHUNK = 1024 ** 2
+
+
+def get_checksum(path: str) -> str:
+    crc = 0
+    with open(path, "rb") as f:
+        while chunk := f.read(CHECKSUM_CHUNK):
+            crc = zlib.crc32(chunk, crc)
+    return f"{crc:08x}"
+
+
+@dataclass(frozen=True)
+class CPartition:
+    file_format: str
+    trade_date: str
+    path: str  # relative to root_dir
+    rows: int
+    nbytes: int
+    checksum: str
+    written_at: str
+
+
+class CPartitionManifest:
+    def __init__(self, root_dir: str):
+        """
+        thread-safe, all threads share one connection. Other processes may use the same
+        manifest at the same time, sqlite serializes their writes.
+
+        """
+        self.root_dir = root_dir
+        self.db_path = os.path.join(root_dir, MANIFEST_NAME)
+        os.makedirs(root_dir, exist_ok=True)
+        self.conn = sqlite3.connect(self.db_path, check_same_thread=False, timeout=60)
+        self.lock = threading.Lock()
+        with self.lock, self.conn:
+            self.conn.execute(
+                "CREATE TABLE IF NOT EXISTS partitions ("
+                "file_format TEXT, trade_date TEXT, path TEXT, rows INTEGER, nbytes INTEGER, "
+                "checksum TEXT, written_at TEXT, PRIMARY KEY (file_format, trade_date))"
+            )
+
+    def record(self, file_format: str, trade_date: str, path: str, rows: int) -> CPartition:
+        """
+        record a partition just written to path
+
+        """
+        partition = CPartition(
+            file_format=file_format,
+            trade_date=trade_date,
+            path=os.path.relpath(path, self.root_dir),
+            rows=rows,
+            nbytes=os.path.getsize(path),
+            checksum=get_checksum(path),
+            written_at=time.strftime("%Y-%m-%d %H:%M:%S"),
+        )
+        with self.lock, self.conn:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO partitions VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (partition.file_format, partition.trade_date, partition.path, partition.rows,
+                 partition.nbytes, partition.checksum, partition.written_at),
+            )
+        return partition
+
+    def remove(self, file_format: str, trade_dates: list[str]):
+        with self.lock, self.conn:
+            self.conn.executemany(
+                "DELETE FROM partitions WHERE file_format = ? AND trade_date = ?",
+                [(file_format, trade_date) for trade_date in trade_dates],
+            )
+        return 0
+
+    def get_partitions(self, file_format: str, bgn_date: str, end_date: str) -> dict[str, CPartition]:
+        """
+
+        :return: partitions with trade_date in [bgn_date, end_date], keyed by trade_date
+        """
+        with self.lock:
+            rows = self.conn.execute(
+                "SELECT * FROM partitions WHERE file_format = ? AND trade_date BETWEEN ? AND ? ORDER BY trade_date",
+                (file_format, bgn_date, end_date),
+            ).fetchall()
+        return {row[1]: CPartition(*row) for row in rows}
+
+    def get_dates(self, file_format: str, bgn_date: str, end_date: str) -> set[str]:
+        """
+
+        :return: trade dates in [bgn_date, end_date] recorded
+        """
+        with self.lock:
+            rows = self.conn.execute(
+                "SELECT trade_date FROM partitions WHERE file_format = ? AND trade_date BETWEEN ? AND ?",
+                (file_format, bgn_date, end_date),
+            ).fetchall()
+        return {row[0] for row in rows}
+
+    def verify(self, partition: CPartition, checksum: bool = True) -> str | None:
+        """
+
+        :param partition:
+        :param checksum: if False, only existence and size are checked
+        :return: None if the file matches the record, else the reason
+        """
+        path = os.path.join(self.root_dir, partition.path)
+        if not os.path.exists(path):
+            return "missing"
+        if os.path.getsize(path) != partition.nbytes:
+            return "size changed"
+        if checksum and get_checksum(path) != partition.checksum:
+            return "checksum changed"
+        return None
+
+    def get_gap_report(self, file_format: str, trade_dates: list[str]) -> dict[str, list[str]]:
+        """
+
+        :param file_format:
+        :param trade_dates: sorted, all dates expected to be written
+        :return: {"missing": dates not in the manifest, "empty": dates written with 0 rows}
+        """
+        partitions = self.get_partitions(file_format, trade_dates[0], trade_dates[-1]) if trade_dates else {}
+        return {
+            "missing": [d for d in trade_dates if d not in partitions],
+            "empty": [d for d in trade_dates if d in partitions and partitions[d].rows == 0],
+        }
+
+    def close(self):
+        with self.lock:
+            self.conn.close()
+
+
+_manifests: dict[str, CPartitionManifest] = {}
+_manifests_lock = threading.Lock()
+
+
+def get_manifest(root_dir: str) -> CPartitionManifest:
+    """
+    manifests are cached per process, one for each root_dir
+
+    """
+    key = os.path.abspath(root_dir)
+    with _manifests_lock:
+        if (manifest := _manifests.get(key)) is None:
+            manifest = _manifests[key] = CPartitionManifest(root_dir)
+    return manifest
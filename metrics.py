@@ -0,0 +1,210 @@
+import os
+import sys
+import json
+import time
+import threading
+from contextlib import contextmanager
+
+# Metrics are keyed by (name, labels), labels being a sorted tuple of (key, value) pairs.
+# timers:   seconds of a stage or a call, as [count, sum, max]
+# counters: rows, bytes, hits, sleeps, anything that only grows
+# gauges:   values set at export, like cache sizes and peak RSS
+# per_date: rows and bytes read and written of each (dataset, trade_date), only exported to json
+
+TMetricKey = tuple[str, tuple[tuple[str, str], ...]]
+PROMETHEUS_PREFIX = "dmt_"
+
+
+def get_dataset_name(file_format: str) -> str:
+    """
+
+    :param file_format: like "tushare_futures_md_{}.csv.gz"
+    :return: like "tushare_futures_md"
+    """
+    return file_format.split("{}")[0].rstrip("_")
+
+
+def get_peak_rss() -> dict[str, int]:
+    """
+
+    :return: peak resident set size in bytes, of this process, and of its terminated children
+             on posix. Empty if it is not available on this platform.
+    """
+    try:
+        import resource
+    except ImportError:  # Windows
+        try:
+            import psutil
+            return {"self": int(psutil.Process().memory_info().peak_wset)}
+        except (ImportError, AttributeError):
+            return {}
+    unit = 1 if sys.platform == "darwin" else 1024  # bytes on macOS, KB on Linux
+    return {
+        "self": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * unit,
+        "children": resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss * unit,
+    }
+
+
+class CMetrics:
+    def __init__(self):
+        """
+        Thread-safe registry of metrics of this process. Worker processes record into their
+        own registry, drain it after each task and send the snapshot back with the result,
+        the parent merges it, so the export covers the whole run.
+
+        """
+        self.timers: dict[TMetricKey, list[float]] = {}
+        self.counters: dict[TMetricKey, float] = {}
+        self.gauges: dict[TMetricKey, float] = {}
+        self.per_date: dict[tuple[str, str], dict[str, float]] = {}
+        self.created_at = time.time()
+        self.lock = threading.Lock()
+
+    @staticmethod
+    def get_key(name: str, labels: dict[str, str]) -> TMetricKey:
+        return name, tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+    def observe(self, name: str, seconds: float, **labels):
+        key = self.get_key(name, labels)
+        with self.lock:
+            if (timer := self.timers.get(key)) is None:
+                self.timers[key] = [1, seconds, seconds]
+            else:
+                timer[0] += 1
+                timer[1] += seconds
+                timer[2] = max(timer[2], seconds)
+
+    @contextmanager
+    def timer(self, name: str, **labels):
+        t0 = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - t0, **labels)
+
+    def inc(self, name: str, value: float = 1, **labels):
+        key = self.get_key(name, labels)
+        with self.lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    def set_gauge(self, name: str, value: float, **labels):
+        key = self.get_key(name, labels)
+        with self.lock:
+            self.gauges[key] = value
+
+    def record_io(self, dataset: str, trade_date: str, op: str, rows: int, nbytes: int | None = None):
+        """
+
+        :param dataset:
+        :param trade_date:
+        :param op: "read" or "written"
+        :param rows:
+        :param nbytes: size of the file, compressed, None if it is unknown, like rows in sqlite
+        """
+        self.inc(f"rows_{op}_total", rows, dataset=dataset)
+        if nbytes is not None:
+            self.inc(f"bytes_{op}_total", nbytes, dataset=dataset)
+        with self.lock:
+            record = self.per_date.setdefault((dataset, trade_date), {})
+            record[f"rows_{op}"] = record.get(f"rows_{op}", 0) + rows
+            if nbytes is not None:
+                record[f"bytes_{op}"] = record.get(f"bytes_{op}", 0) + nbytes
+
+    def drain(self) -> dict:
+        """
+
+        :return: a picklable snapshot of timers, counters and per date records, which are reset
+        """
+        with self.lock:
+            snapshot = {"timers": self.timers, "counters": self.counters, "per_date": self.per_date}
+            self.timers, self.counters, self.per_date = {}, {}, {}
+        return snapshot
+
+    def merge(self, snapshot: dict):
+        with self.lock:
+            for key, (count, total, max_seconds) in snapshot["timers"].items():
+                if (timer := self.timers.get(key)) is None:
+                    self.timers[key] = [count, total, max_seconds]
+                else:
+                    timer[0] += count
+                    timer[1] += total
+                    timer[2] = max(timer[2], max_seconds)
+            for key, value in snapshot["counters"].items():
+                self.counters[key] = self.counters.get(key, 0) + value
+            for date_key, values in snapshot["per_date"].items():
+                record = self.per_date.setdefault(date_key, {})
+                for k, v in values.items():
+                    record[k] = record.get(k, 0) + v
+
+    def update_process_gauges(self):
+        for process, nbytes in get_peak_rss().items():
+            self.set_gauge("peak_rss_bytes", nbytes, process=process)
+        self.set_gauge("wall_seconds", time.time() - self.created_at)
+
+    def to_dict(self) -> dict:
+        def entries(metrics: dict[TMetricKey, float]) -> list[dict]:
+            return [{"name": name, "labels": dict(labels), "value": value}
+                    for (name, labels), value in sorted(metrics.items())]
+
+        with self.lock:
+            return {
+                "created": time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(self.created_at)),
+                "timers": [
+                    {"name": name, "labels": dict(labels), "count": count, "seconds": total, "max_seconds": max_s}
+                    for (name, labels), (count, total, max_s) in sorted(self.timers.items())
+                ],
+                "counters": entries(self.counters),
+                "gauges": entries(self.gauges),
+                "per_date": [
+                    {"dataset": dataset, "trade_date": trade_date, **values}
+                    for (dataset, trade_date), values in sorted(self.per_date.items())
+                ],
+            }
+
+    def to_prometheus(self) -> str:
+        """
+
+        :return: text exposition format, timers as summaries without quantiles
+        """
+
+        def fmt_labels(labels: tuple[tuple[str, str], ...]) -> str:
+            if not labels:
+                return ""
+            escaped = (v.replace("\\", "\\\\").replace('"', '\\"') for _, v in labels)
+            return "{" + ",".join(f'{k}="{v}"' for (k, _), v in zip(labels, escaped)) + "}"
+
+        lines: list[str] = []
+        with self.lock:
+            for metric_type, metrics in [("counter", self.counters), ("gauge", self.gauges)]:
+                declared: set[str] = set()
+                for (name, labels), value in sorted(metrics.items()):
+                    if name not in declared:
+                        lines.append(f"# TYPE {PROMETHEUS_PREFIX}{name} {metric_type}")
+                        declared.add(name)
+                    lines.append(f"{PROMETHEUS_PREFIX}{name}{fmt_labels(labels)} {value}")
+            declared = set()
+            for (name, labels), (count, total, max_seconds) in sorted(self.timers.items()):
+                if name not in declared:
+                    lines.append(f"# TYPE {PROMETHEUS_PREFIX}{name} summary")
+                    declared.add(name)
+                lines.append(f"{PROMETHEUS_PREFIX}{name}_count{fmt_labels(labels)} {count}")
+                lines.append(f"{PROMETHEUS_PREFIX}{name}_sum{fmt_labels(labels)} {total}")
+        return "\n".join(lines) + "\n"
+
+    def export(self, path: str):
+        """
+        write metrics to path, in Prometheus textfile format if it ends with ".prom", else in json.
+        The file is replaced atomically, so a node exporter never reads a partial file.
+
+        """
+        self.update_process_gauges()
+        content = self.to_prometheus() if path.endswith(".prom") else json.dumps(self.to_dict(), indent=2)
+        if save_dir := os.path.dirname(path):
+            os.makedirs(save_dir, exist_ok=True)
+        with open(tmp_path := f"{path}.tmp", "w", encoding="utf-8") as f:
+            f.write(content)
+        os.replace(tmp_path, path)
+        return 0
+
+
+metrics = CMetrics()
@@ -0,0 +1,105 @@
+from dataclasses import dataclass
+from typing import Callable
+from concurrent.futures import ThreadPoolExecutor, Future, wait, FIRST_COMPLETED
+from loguru import logger
+from husfort.qutility import qtimer, SFG, SFR, SFY
+from metrics import metrics
+
+
+@dataclass(frozen=True)
+class CPipelineStep:
+    name: str
+    func: Callable[[], int]  # 0 for success, the step fails if it raises or returns anything else
+    deps: tuple[str, ...] = ()
+    resources: tuple[str, ...] = ()  # steps sharing a resource, like "wind" or "sqlite", never run at the same time
+
+
+class CPipeline:
+    def __init__(self, steps: list[CPipelineStep], max_workers: int = 4):
+        """
+        Steps run in threads of one process, as soon as all their dependencies are done
+        and their resources are free. Data saved by a step is put into the shared data
+        store, so the steps depending on it load it from memory instead of from disk.
+
+        :param steps:
+        :param max_workers: max number of steps running at the same time
+        """
+        self.steps: dict[str, CPipelineStep] = {step.name: step for step in steps}
+        self.max_workers = max_workers
+        self.check_dag()
+
+    def check_dag(self):
+        for step in self.steps.values():
+            for dep in step.deps:
+                if dep not in self.steps:
+                    raise ValueError(f"Dependency {SFY(dep)} of step {SFY(step.name)} is not defined")
+        visited: set[str] = set()
+        visiting: set[str] = set()
+
+        def visit(name: str):
+            if name in visiting:
+                raise ValueError(f"Pipeline has a cycle at step {SFY(name)}")
+            if name not in visited:
+                visiting.add(name)
+                for dep in self.steps[name].deps:
+                    visit(dep)
+                visiting.remove(name)
+                visited.add(name)
+
+        for step_name in self.steps:
+            visit(step_name)
+        return 0
+
+    def get_descendants(self, name: str) -> set[str]:
+        descendants: set[str] = set()
+        front = [name]
+        while front:
+            parent = front.pop()
+            for step in self.steps.values():
+                if parent in step.deps and step.name not in descendants:
+                    descendants.add(step.name)
+                    front.append(step.name)
+        return descendants
+
+    def run_step(self, step: CPipelineStep) -> int:
+        logger.info(f"Step {SFG(step.name)} is started")
+        with metrics.timer("step_seconds", step=step.name):
+            if (code := step.func()) != 0:
+                raise RuntimeError(f"Step {step.name} returned {code}")
+        logger.info(f"Step {SFG(step.name)} is done")
+        return 0
+
+    @qtimer
+    def run(self) -> dict[str, str]:
+        """
+
+        :return: status of each step, "done", "failed" or "skipped" (one of its dependencies failed)
+        """
+        status: dict[str, str] = {}
+        running: dict[Future, CPipelineStep] = {}
+        busy_resources: set[str] = set()
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            while True:
+                for step in self.steps.values():
+                    if (step.name in status) or (step in running.values()) or (len(running) >= self.max_workers):
+                        continue
+                    if all(status.get(dep) == "done" for dep in step.deps) and busy_resources.isdisjoint(step.resources):
+                        busy_resources.update(step.resources)
+                        running[executor.submit(self.run_step, step)] = step
+                if not running:
+                    break
+                finished, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in finished:
+                    step = running.pop(future)
+                    busy_resources.difference_update(step.resources)
+                    if (e := future.exception()) is not None:
+                        logger.opt(exception=e).error(f"Step {SFR(step.name)} failed")
+                        status[step.name] = "failed"
+                        for descendant in self.get_descendants(step.name):
+                            status.setdefault(descendant, "skipped")
+                    else:
+                        status[step.name] = "done"
+        for step_name, step_status in status.items():
+            if step_status != "done":
+                logger.warning(f"Step {SFY(step_name)} is {step_status}")
+        return status
@@ -1,6 +1,6 @@
-import yaml
+import sys
 from dataclasses import dataclass
-from data_engines import CSaveDataInfo
+from data_info import CSaveDataInfo
 from husfort.qsqlite import CDbStruct, CSqlTable
 
 
@@ -13,7 +13,10 @@ class CProCfg:
     daily_data_root_dir: str
     db_struct_path: str
     tick_data_root_dir: str
+    tick_cache_dir: str  # decoded tick data, used with --tick-cache
     futures_exchanges: list[str]
+    tushare_rate_limits: dict[str, int]  # calls per minute of each endpoint
+    wind_rate_limits: dict[str, int]  # calls per minute of "wss" and "wsd", the same limiter as tushare endpoints
     futures_md: CSaveDataInfo
     futures_contracts: CSaveDataInfo
     futures_universe: CSaveDataInfo
@@ -53,6 +56,7 @@ futures_pos = CSaveDataInfo(
         "broker", "vol", "vol_chg", "long_hld", "long_chg", "short_hld", "short_chg",
         "exchange",
     ),
+    compression_level=6,  # pandas writes gzip at level 9, 2-3x slower for about 2% smaller files
 )
 
 futures_basis = CSaveDataInfo(
@@ -74,6 +78,7 @@ futures_minute_bar = CSaveDataInfo(
         "ts_code", "trade_date", "timestamp",
         "open", "high", "low", "close",
         "vol", "amount", "oi"),
+    compression_level=6,
 )
 
 pro_cfg = CProCfg(
@@ -82,7 +87,15 @@ pro_cfg = CProCfg(
     daily_data_root_dir=r"E:\OneDrive\Data\tushare\by_date",
     db_struct_path=r"E:\OneDrive\Data\tushare\db_struct.yaml",
     tick_data_root_dir=r"E:\OneDrive\Data\juejindata",
+    tick_cache_dir=r"E:\Data\juejindata_cache",
     futures_exchanges=["SHFE", "INE", "DCE", "CZCE", "GFEX", "CFFEX"],
+    tushare_rate_limits={
+        "fut_daily": 120,
+        "fut_holding": 300,
+    },
+    wind_rate_limits={
+        "wss": 120,
+    },
     futures_md=futures_md,
     futures_contracts=futures_contracts,
     futures_universe=futures_universe,
@@ -93,8 +106,8 @@ pro_cfg = CProCfg(
 )
 
 # ---------- databases structure ----------
-with open(pro_cfg.db_struct_path, "r") as f:
-    db_struct = yaml.safe_load(f)
+# db_struct and db_struct_cfg are built at the first access, "from project_cfg import db_struct_cfg"
+# works as before, but commands that never touch a database do not read and parse the yaml
 
 
 @dataclass(frozen=True)
@@ -106,30 +119,49 @@ class CDbStructCfg:
     fMinuteBar: CDbStruct
 
 
-db_struct_cfg = CDbStructCfg(
-    fmd=CDbStruct(
-        db_save_dir=pro_cfg.root_dir,
-        db_name=db_struct["fmd"]["db_name"],
-        table=CSqlTable(cfg=db_struct["fmd"]["table"]),
-    ),
-    position=CDbStruct(
-        db_save_dir=pro_cfg.root_dir,
-        db_name=db_struct["position"]["db_name"],
-        table=CSqlTable(cfg=db_struct["position"]["table"]),
-    ),
-    basis=CDbStruct(
-        db_save_dir=pro_cfg.root_dir,
-        db_name=db_struct["basis"]["db_name"],
-        table=CSqlTable(cfg=db_struct["basis"]["table"]),
-    ),
-    stock=CDbStruct(
-        db_save_dir=pro_cfg.root_dir,
-        db_name=db_struct["stock"]["db_name"],
-        table=CSqlTable(cfg=db_struct["stock"]["table"]),
-    ),
-    fMinuteBar=CDbStruct(
-        db_save_dir=pro_cfg.root_dir,
-        db_name=db_struct["fMinuteBar"]["db_name"],
-        table=CSqlTable(cfg=db_struct["fMinuteBar"]["table"])
+def load_db_struct(db_struct_path: str) -> dict:
+    import yaml
+
+    with open(db_struct_path, "r") as f:
+        return yaml.safe_load(f)
+
+
+def get_db_struct_cfg(db_struct: dict) -> CDbStructCfg:
+    return CDbStructCfg(
+        fmd=CDbStruct(
+            db_save_dir=pro_cfg.root_dir,
+            db_name=db_struct["fmd"]["db_name"],
+            table=CSqlTable(cfg=db_struct["fmd"]["table"]),
+        ),
+        position=CDbStruct(
+            db_save_dir=pro_cfg.root_dir,
+            db_name=db_struct["position"]["db_name"],
+            table=CSqlTable(cfg=db_struct["position"]["table"]),
+        ),
+        basis=CDbStruct(
+            db_save_dir=pro_cfg.root_dir,
+            db_name=db_struct["basis"]["db_name"],
+            table=CSqlTable(cfg=db_struct["basis"]["table"]),
+        ),
+        stock=CDbStruct(
+            db_save_dir=pro_cfg.root_dir,
+            db_name=db_struct["stock"]["db_name"],
+            table=CSqlTable(cfg=db_struct["stock"]["table"]),
+        ),
+        fMinuteBar=CDbStruct(
+            db_save_dir=pro_cfg.root_dir,
+            db_name=db_struct["fMinuteBar"]["db_name"],
+            table=CSqlTable(cfg=db_struct["fMinuteBar"]["table"])
+        )
     )
-)
+
+
+def __getattr__(name: str):
+    if name == "db_struct":
+        value = load_db_struct(pro_cfg.db_struct_path)
+    elif name == "db_struct_cfg":
+        value = get_db_struct_cfg(getattr(sys.modules[__name__], "db_struct"))
+    else:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    globals()[name] = value  # cached, later accesses do not come here
+    return value
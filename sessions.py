@@ -0,0 +1,235 @@
+import numpy as np
+from dataclasses import dataclass
+from husfort.qutility import SFR
+
+# Trading session rules of each product group, as data. Times are "HH:MM" after the midnight of an anchor day:
+#   "prev": the previous trade date, night sessions start on it
+#   "tail": the day after the previous trade date, night sessions past midnight end on it
+#   "this": the trade date itself
+# revisions: (anchor, bgn, end, to), ticks in [bgn, end] are moved to end if to == "end", for the open of
+#            a session, or to 1ms before bgn if to == "bgn", for the close of a session. Intervals do not
+#            overlap, so the first match wins.
+# sections:  (anchor, bgn, anchor, end), revised ticks in [bgn, end) are kept
+
+
+@dataclass(frozen=True)
+class CSessionRule:
+    revisions: tuple[tuple[str, str, str, str], ...]
+    sections: tuple[tuple[str, str, str, str], ...]
+
+
+def make_commodity_rule(close_anchor: str, close: str, close_revised_to: str) -> CSessionRule:
+    """
+    commodity sessions, the night session starts at 21:00 of the previous trade date
+
+    :param close_anchor: "prev" if the night session closes before midnight, else "tail"
+    :param close: close of the night session, like "23:00"
+    :param close_revised_to: ticks in [close, close_revised_to] belong to the last bar of the night
+    """
+    return CSessionRule(
+        revisions=(
+            ("prev", "20:59", "21:00", "end"), (close_anchor, close, close_revised_to, "bgn"),  # night
+            ("this", "08:59", "09:00", "end"), ("this", "10:15", "10:16", "bgn"),  # morning
+            ("this", "10:29", "10:30", "end"), ("this", "11:30", "11:31", "bgn"),  # middle
+            ("this", "13:29", "13:30", "end"), ("this", "15:00", "15:05", "bgn"),  # afternoon
+        ),
+        sections=(("prev", "21:00", close_anchor, close), ("this", "09:00", "this", "15:00")),
+    )
+
+
+SESSION_COMMODITY = make_commodity_rule("tail", "02:30", "02:35")  # also for products without night sessions
+SESSION_NIGHT_2300 = make_commodity_rule("prev", "23:00", "23:05")
+SESSION_NIGHT_2330 = make_commodity_rule("prev", "23:30", "23:35")
+SESSION_NIGHT_0100 = make_commodity_rule("tail", "01:00", "01:05")
+
+SESSION_CFX_9_15 = CSessionRule(
+    revisions=(
+        ("this", "09:10", "09:15", "end"), ("this", "11:30", "11:31", "bgn"),  # morning
+        ("this", "12:59", "13:00", "end"), ("this", "15:15", "15:20", "bgn"),  # afternoon
+    ),
+    sections=(("this", "09:15", "this", "15:15"),),
+)
+
+SESSION_CFX_9_30 = CSessionRule(
+    revisions=(
+        ("this", "09:25", "09:30", "end"), ("this", "11:30", "11:31", "bgn"),  # morning
+        ("this", "12:59", "13:00", "end"), ("this", "15:00", "15:05", "bgn"),  # afternoon
+    ),
+    sections=(("this", "09:30", "this", "15:00"),),
+)
+
+SESSION_CFX_9_30_15_15 = CSessionRule(
+    revisions=(
+        ("this", "09:25", "09:30", "end"), ("this", "11:30", "11:31", "bgn"),  # morning
+        ("this", "12:59", "13:00", "end"), ("this", "15:15", "15:20", "bgn"),  # afternoon
+    ),
+    sections=(("this", "09:30", "this", "15:15"),),
+)
+
+EQT_TRADE_TIME_CHG_DATE = "20160101"
+BND_TRADE_TIME_CHG_DATE = "20200720"  # bond futures open at 09:30 instead of 09:15, still close at 15:15
+
+# group -> [(first trade date, rule)], sorted by first trade date, each rule works until the next one.
+# The date of a change is the first trade date whose night session follows the new hours, as the
+# night session belongs to the next trade date.
+SESSION_RULES: dict[str, list[tuple[str, CSessionRule]]] = {
+    "commodity": [("00000000", SESSION_COMMODITY)],
+    "night_2300": [("00000000", SESSION_NIGHT_2300)],
+    "night_0100": [("00000000", SESSION_NIGHT_0100)],
+    "shf_0100_2300": [("00000000", SESSION_NIGHT_0100), ("20160504", SESSION_NIGHT_2300)],
+    "dce_night": [("00000000", SESSION_COMMODITY), ("20150511", SESSION_NIGHT_2330),
+                  ("20190401", SESSION_NIGHT_2300)],
+    "zce_night": [("00000000", SESSION_NIGHT_2330), ("20191213", SESSION_NIGHT_2300)],
+    "cfx_equity": [("00000000", SESSION_CFX_9_15), (EQT_TRADE_TIME_CHG_DATE, SESSION_CFX_9_30)],
+    "cfx_bond": [("00000000", SESSION_CFX_9_15), (BND_TRADE_TIME_CHG_DATE, SESSION_CFX_9_30_15_15)],
+}
+
+# instrument -> group, instruments not listed use group "commodity", whose night session closes at 02:30,
+# like AU.SHF, AG.SHF and SC.INE, or have no night session at all. Those of CFX must be listed.
+# A product with its own night session gets its own group in SESSION_RULES.
+PRODUCT_SESSION_GROUPS: dict[str, str] = {
+    **{f"{p}.SHF": "shf_0100_2300" for p in ("RB", "HC", "BU", "RU")},
+    **{f"{p}.SHF": "night_2300" for p in ("FU", "SP", "BR")},
+    **{f"{p}.INE": "night_2300" for p in ("LU", "NR")},
+    **{f"{p}.SHF": "night_0100" for p in ("CU", "AL", "ZN", "PB", "NI", "SN", "SS", "AO")},
+    "BC.INE": "night_0100",
+    **{f"{p}.DCE": "dce_night" for p in (
+        "A", "B", "M", "Y", "P", "C", "CS", "I", "J", "JM", "L", "PP", "V", "EG", "EB", "PG", "RR",
+    )},
+    **{f"{p}.ZCE": "zce_night" for p in (
+        "CF", "SR", "TA", "MA", "ME", "RM", "OI", "FG", "ZC", "TC", "SA", "PF", "CY", "SH", "PX", "PR",
+    )},
+    "IH.CFX": "cfx_equity",
+    "IF.CFX": "cfx_equity",
+    "IC.CFX": "cfx_equity",
+    "IM.CFX": "cfx_equity",
+    "TS.CFX": "cfx_bond",
+    "TF.CFX": "cfx_bond",
+    "T.CFX": "cfx_bond",
+    "TL.CFX": "cfx_bond",
+}
+
+
+def get_session_group(instru: str, exchange: str) -> str:
+    """
+
+    :param instru: like "CU.SHF", "IF.CFX"
+    :param exchange: like "SHF", "CFX"
+    :return: a key of SESSION_RULES
+    """
+    if (group := PRODUCT_SESSION_GROUPS.get(instru.upper())) is not None:
+        return group
+    if exchange == "CFX":
+        raise ValueError(f"instru = {SFR(instru)} is illegal for CFX")
+    return "commodity"
+
+
+def to_offset(hhmm: str) -> np.timedelta64:
+    return np.timedelta64(int(hhmm[0:2]) * 60 + int(hhmm[3:5]), "m").astype("timedelta64[ns]")
+
+
+class CSessionRegistry:
+    def __init__(self, rules: dict[str, list[tuple[str, CSessionRule]]] | None = None):
+        """
+        Session boundaries of each product group for each trade date, computed once for all
+        dates added. For group g and the trade date in row i
+            revisions[g][i]: (n, 3) datetime64[ns] of (bgn, end, target)
+            sections[g][i]:  (m, 2) datetime64[ns] of (bgn, end)
+        rows of rules with fewer revisions or sections than others of their group are padded
+        with NaT, which matches no tick. The registry is picklable, the main process sends it
+        to each worker once, by the initializer of the pool.
+
+        :param rules: default is SESSION_RULES
+        """
+        self.rules = SESSION_RULES if rules is None else rules
+        self.rows: dict[str, int] = {}
+        self.revisions: dict[str, np.ndarray] = {
+            g: np.empty((0, max(len(r.revisions) for _, r in versions), 3), dtype="datetime64[ns]")
+            for g, versions in self.rules.items()
+        }
+        self.sections: dict[str, np.ndarray] = {
+            g: np.empty((0, max(len(r.sections) for _, r in versions), 2), dtype="datetime64[ns]")
+            for g, versions in self.rules.items()
+        }
+
+    @staticmethod
+    def fill_bounds(rule: CSessionRule, anchors: dict[str, np.ndarray],
+                    revisions: np.ndarray, sections: np.ndarray) -> None:
+        """
+        fill boundaries of one rule for some dates in place
+
+        :param rule:
+        :param anchors: anchor name -> datetime64[ns] midnights of these dates
+        :param revisions: (n_dates, n, 3)
+        :param sections: (n_dates, m, 2)
+        """
+        for k, (anchor, bgn, end, to) in enumerate(rule.revisions):
+            db, de = anchors[anchor] + to_offset(bgn), anchors[anchor] + to_offset(end)
+            revisions[:, k, 0], revisions[:, k, 1] = db, de
+            revisions[:, k, 2] = de if to == "end" else db - np.timedelta64(1, "ms")
+        for k, (anchor_bgn, bgn, anchor_end, end) in enumerate(rule.sections):
+            sections[:, k, 0] = anchors[anchor_bgn] + to_offset(bgn)
+            sections[:, k, 1] = anchors[anchor_end] + to_offset(end)
+
+    def add_dates(self, trade_dates: list[str], prev_trade_dates: list[str]) -> None:
+        """
+
+        :param trade_dates: dates already added are ignored
+        :param prev_trade_dates: previous trade date of each date
+        """
+        new: dict[str, str] = {}
+        for trade_date, prev_trade_date in zip(trade_dates, prev_trade_dates):
+            if trade_date not in self.rows:
+                new[trade_date] = prev_trade_date
+        if not new:
+            return None
+        dates = np.array(list(new))
+        this_days = np.array([f"{d[0:4]}-{d[4:6]}-{d[6:8]}" for d in new], dtype="datetime64[D]")
+        prev_days = np.array([f"{p[0:4]}-{p[4:6]}-{p[6:8]}" for p in new.values()], dtype="datetime64[D]")
+        anchors = {
+            "prev": prev_days.astype("datetime64[ns]"),
+            "tail": (prev_days + np.timedelta64(1, "D")).astype("datetime64[ns]"),
+            "this": this_days.astype("datetime64[ns]"),
+        }
+        for group, versions in self.rules.items():
+            revisions = np.full((len(new), *self.revisions[group].shape[1:]), np.datetime64("NaT", "ns"))
+            sections = np.full((len(new), *self.sections[group].shape[1:]), np.datetime64("NaT", "ns"))
+            for v, (first_date, rule) in enumerate(versions):
+                in_effect = dates >= first_date
+                if v + 1 < len(versions):
+                    in_effect &= dates < versions[v + 1][0]
+                if in_effect.any():
+                    r, s = revisions[in_effect], sections[in_effect]
+                    self.fill_bounds(rule, {k: a[in_effect] for k, a in anchors.items()}, r, s)
+                    revisions[in_effect], sections[in_effect] = r, s
+            self.revisions[group] = np.concatenate([self.revisions[group], revisions])
+            self.sections[group] = np.concatenate([self.sections[group], sections])
+        for trade_date in new:
+            self.rows[trade_date] = len(self.rows)
+        return None
+
+    def lookup(self, group: str, trade_date: str, prev_trade_date: str) -> tuple[np.ndarray, np.ndarray]:
+        """
+
+        :return: (revisions, sections) of the group in the trade date, the date is added first if it is not
+        """
+        if (row := self.rows.get(trade_date)) is None:
+            self.add_dates([trade_date], [prev_trade_date])
+            row = self.rows[trade_date]
+        return self.revisions[group][row], self.sections[group][row]
+
+
+_session_registry = CSessionRegistry()
+
+
+def get_session_registry() -> CSessionRegistry:
+    return _session_registry
+
+
+def set_session_registry(registry: CSessionRegistry) -> None:
+    """
+    initializer of worker pools, so workers look up boundaries in the registry of the main process
+
+    """
+    global _session_registry
+    _session_registry = registry
@@ -0,0 +1,478 @@
+import os
+import time
+import queue
+import threading
+import pandas as pd
+from collections import OrderedDict
+from typing import TYPE_CHECKING
+from loguru import logger
+from husfort.qcalendar import CCalendar
+from metrics import metrics, get_dataset_name
+from manifest import get_manifest
+
+if TYPE_CHECKING:
+    import pyarrow as pa
+
+# Daily datasets are saved in one of two layouts, decided by the suffix of CSaveDataInfo.file_format
+# csv:     {root}/YYYY/YYYYMMDD/{file_format.format(trade_date)}, untyped, one directory for each date
+# parquet: {root}/YYYY/YYYYMM/{file_format.format(trade_date)}, typed, files of a month share one directory,
+#          so a range of dates can be loaded by one scan with column selection and predicate pushdown
+# The codec of csv files is given by the suffix, like ".csv.gz", ".csv.zst" or ".csv.lz4", the codec of
+# parquet files by CSaveDataInfo.codec. Both use CSaveDataInfo.compression_level if it is set.
+# pyarrow is imported by the parquet branches only, csv-only runs never load it.
+
+# aliases of arrow types, as pa.type_for_alias takes them
+FIELD_TYPES: dict[str, str] = {
+    "ts_code": "string",
+    "wd_code": "string",
+    "trade_date": "string",
+    "contract": "string",
+    "symbol": "string",
+    "broker": "string",
+    "exchange": "string",
+    "timestamp": "timestamp[ns]",
+}
+DEFAULT_FIELD_TYPE = "float64"
+PARQUET_COMPRESSION = "zstd"
+CSV_CODECS: dict[str, str] = {".gz": "gzip", ".zst": "zstd", ".lz4": "lz4"}
+CSV_DATE_FORMAT = "%Y-%m-%d %H:%M:%S"
+
+
+def get_arrow_schema(fields: tuple[str, ...]) -> "pa.Schema":
+    """
+    string for codes and dates, float64 for all other values. "trade_date" is always
+    included, even if the raw data does not provide it, because it is the partition key.
+
+    """
+    import pyarrow as pa
+
+    names = [field.strip() for field in fields]
+    if "trade_date" not in names:
+        names.append("trade_date")
+    return pa.schema([(name, pa.type_for_alias(FIELD_TYPES.get(name, DEFAULT_FIELD_TYPE))) for name in names])
+
+
+def is_columnar(file_format: str) -> bool:
+    return file_format.endswith(".parquet")
+
+
+def get_csv_codec(file_format: str) -> str | None:
+    return CSV_CODECS.get(os.path.splitext(file_format)[1])
+
+
+def write_csv(data: pd.DataFrame, save_path: str, compression_level: int | None = None):
+    """
+    data is converted to csv text once, and the text is compressed by the codec of the suffix,
+    at the same default levels as pandas: 9 for gzip, 3 for zstd. lz4 is not supported by
+    pandas, it is written by the optional package lz4
+
+    """
+    text = data.to_csv(index=False, date_format=CSV_DATE_FORMAT)
+    if (codec := get_csv_codec(save_path)) == "lz4":
+        import lz4.frame
+
+        with lz4.frame.open(save_path, mode="wb", compression_level=compression_level or 0) as f:
+            f.write(text.encode("utf-8"))
+    elif codec == "zstd":
+        import zstandard
+
+        compressor = zstandard.ZstdCompressor(level=3 if compression_level is None else compression_level)
+        with open(save_path, "wb") as f:
+            f.write(compressor.compress(text.encode("utf-8")))
+    elif codec == "gzip":
+        import gzip
+
+        with gzip.open(save_path, "wb", compresslevel=9 if compression_level is None else compression_level) as f:
+            f.write(text.encode("utf-8"))
+    else:
+        with open(save_path, "w", encoding="utf-8", newline="") as f:
+            f.write(text)
+    return 0
+
+
+def to_csv_dtypes(data: pd.DataFrame) -> pd.DataFrame:
+    """
+    data as read_csv gives it back from its csv file, without parsing the text: a new RangeIndex,
+    trade_date as str, datetime columns as the text written by write_csv, object columns of
+    numbers, like those from WindPy, as numbers
+
+    """
+    data = data.reset_index(drop=True).infer_objects()
+    for name in data.columns:
+        if pd.api.types.is_datetime64_any_dtype(data[name]):
+            data[name] = data[name].dt.strftime(CSV_DATE_FORMAT)
+    if "trade_date" in data.columns:
+        data["trade_date"] = data["trade_date"].astype(str)
+    return data
+
+
+def read_csv(load_path: str, columns: list[str] | None = None) -> pd.DataFrame:
+    if get_csv_codec(load_path) == "lz4":
+        import lz4.frame
+
+        with lz4.frame.open(load_path, mode="rb") as f:
+            return pd.read_csv(f, usecols=columns, dtype={"trade_date": str})
+    return pd.read_csv(load_path, usecols=columns, dtype={"trade_date": str})
+
+
+def get_save_dir(root_dir: str, file_format: str, trade_date: str) -> str:
+    if is_columnar(file_format):
+        return os.path.join(root_dir, trade_date[0:4], trade_date[0:6])
+    return os.path.join(root_dir, trade_date[0:4], trade_date)
+
+
+def get_save_path(root_dir: str, file_format: str, trade_date: str) -> str:
+    return os.path.join(get_save_dir(root_dir, file_format, trade_date), file_format.format(trade_date))
+
+
+def to_arrow_table(data: pd.DataFrame, schema: "pa.Schema", trade_date: str) -> "pa.Table":
+    import pyarrow as pa
+
+    data = data.reindex(columns=schema.names)
+    data["trade_date"] = trade_date
+    for field in schema:
+        if pa.types.is_string(field.type):
+            s = data[field.name]
+            data[field.name] = s.where(s.isna(), s.astype(str))
+    return pa.Table.from_pandas(data, schema=schema, preserve_index=False)
+
+
+def save_daily_data(data: pd.DataFrame, save_path: str, file_format: str, fields: tuple[str, ...], trade_date: str,
+                    root_dir: str | None = None, codec: str | None = None, compression_level: int | None = None):
+    """
+
+    data is written to a temporary file in the same directory, which is renamed to save_path
+    at last, so save_path is either the old file or the complete new one, even if it fails.
+    Everything that may fail is done before the rename, a file renamed to save_path is
+    always recorded in the manifest.
+
+    :param root_dir: if provided, the saved data is also put into the shared data store,
+                     and the partition is recorded in the manifest of root_dir
+    :param codec: only for parquet, default is PARQUET_COMPRESSION
+    :param compression_level: None for the default level of the codec
+    """
+    dataset = get_dataset_name(file_format)
+    if not is_columnar(file_format) and data.columns.empty:
+        raise ValueError(f"{file_format} for {trade_date} has no column, its csv can not be read back")
+    save_dir, file_name = os.path.split(save_path)
+    tmp_path = os.path.join(save_dir, f"~tmp{os.getpid()}_{file_name}")  # same suffix, not matched by file_format
+    with metrics.timer("write_seconds", dataset=dataset):
+        try:
+            if is_columnar(file_format):
+                import pyarrow.parquet as pq
+
+                table = to_arrow_table(data, get_arrow_schema(fields), trade_date)
+                pq.write_table(table, tmp_path, compression=codec or PARQUET_COMPRESSION,
+                               compression_level=compression_level)
+                data = table.to_pandas()
+            else:
+                write_csv(data, tmp_path, compression_level)
+                if root_dir is not None:  # the store keeps what read_csv gives back
+                    data = to_csv_dtypes(data)
+            os.replace(tmp_path, save_path)
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+    metrics.record_io(dataset, trade_date, "written", rows=len(data), nbytes=os.path.getsize(save_path))
+    if root_dir is not None:
+        get_manifest(root_dir).record(file_format, trade_date, save_path, rows=len(data))
+        data_store.put(root_dir, file_format, trade_date, data)
+    return 0
+
+
+class CWriteBehindError(Exception):
+    def __init__(self, name: str, errors: dict[str, BaseException]):
+        """
+
+        :param name: of the writer
+        :param errors: error of each failed write, keyed by the key it was submitted with, like the trade date
+        """
+        details = "; ".join(f"{key}: {e!r}" for key, e in errors.items())
+        super().__init__(f"{len(errors)} writes of {name} failed, {details}")
+        self.errors = errors
+
+
+class CWriteBehind:
+    def __init__(self, queue_size: int = 2, name: str = "writer"):
+        """
+        Writes submitted are done in order by a background thread, so compression and
+        disk writes of one date overlap with downloading or computing the next. At most
+        queue_size writes wait in the queue, submit blocks when it is full, so memory
+        stays bounded. A failed write is logged and recorded with its key, the other
+        writes go on, and all errors are raised together by CWriteBehindError when the
+        writer is closed.
+
+        :param queue_size:
+        :param name: like the dataset name, used in the thread name and metrics
+        """
+        self.name = name
+        self.queue: queue.Queue = queue.Queue(maxsize=queue_size)
+        self.errors: dict[str, BaseException] = {}
+        self.thread = threading.Thread(target=self.run, name=f"write-behind-{name}", daemon=True)
+        self.thread.start()
+
+    def run(self):
+        while (job := self.queue.get()) is not None:
+            key, func, args, kwargs = job
+            try:
+                func(*args, **kwargs)
+            except BaseException as e:
+                logger.error(f"Write behind {self.name} failed for {key}: {e}")
+                self.errors[key] = e
+
+    def raise_error(self):
+        if self.errors:
+            raise CWriteBehindError(self.name, dict(self.errors))
+
+    def submit(self, key: str, func, *args, **kwargs):
+        """
+
+        :param key: reported with the error if the write fails, like the trade date
+        """
+        t0 = time.perf_counter()
+        self.queue.put((key, func, args, kwargs))
+        metrics.inc("write_behind_wait_seconds_total", time.perf_counter() - t0, writer=self.name)
+        return 0
+
+    def close(self):
+        """
+        wait for all writes submitted, then stop the thread
+
+        """
+        self.queue.put(None)
+        self.thread.join()
+        return 0
+
+    def __enter__(self) -> "CWriteBehind":
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+        if exc_type is None:
+            self.raise_error()
+        elif self.errors:
+            logger.error(f"Write behind {self.name} failed for {', '.join(self.errors)}")
+        return False
+
+
+def find_saved_dates(root_dir: str, file_format: str, trade_dates: list[str]) -> set[str]:
+    """
+    only dates recorded in the manifest are saved. Files of the other dates, usually saved
+    before the manifest was introduced, are read once by rebuild_manifest, and recorded only
+    if they can be read, so a truncated file is downloaded again.
+
+    :param trade_dates: sorted
+    :return:
+    """
+    if not trade_dates:
+        return set()
+    manifest = get_manifest(root_dir)
+    saved = manifest.get_dates(file_format, trade_dates[0], trade_dates[-1])
+    unrecorded = [_ for _ in trade_dates if _ not in saved and os.path.exists(get_save_path(root_dir, file_format, _))]
+    if unrecorded and rebuild_manifest(root_dir, file_format, unrecorded) > 0:
+        saved = manifest.get_dates(file_format, trade_dates[0], trade_dates[-1])
+    return saved
+
+
+def rebuild_manifest(root_dir: str, file_format: str, trade_dates: list[str]) -> int:
+    """
+    record existing files not in the manifest yet, each of them is read once to count its rows
+
+    :return: number of partitions recorded
+    """
+    manifest = get_manifest(root_dir)
+    recorded = manifest.get_dates(file_format, trade_dates[0], trade_dates[-1]) if trade_dates else set()
+    n = 0
+    for trade_date in trade_dates:
+        if trade_date in recorded or not os.path.exists(path := get_save_path(root_dir, file_format, trade_date)):
+            continue
+        try:
+            rows = len(load_daily_data(root_dir, file_format, trade_date))
+        except Exception as e:  # truncated or corrupt, left out, so repair downloads it again
+            logger.warning(f"{path} can not be read, it is not recorded: {e}")
+            continue
+        manifest.record(file_format, trade_date, path, rows=rows)
+        n += 1
+    return n
+
+
+def load_daily_data(root_dir: str, file_format: str, trade_date: str, columns: list[str] | None = None) -> pd.DataFrame:
+    """
+
+    :param root_dir:
+    :param file_format:
+    :param trade_date:
+    :param columns: columns to load, None for all
+    :return:
+    """
+    load_path = get_save_path(root_dir, file_format, trade_date)
+    dataset = get_dataset_name(file_format)
+    with metrics.timer("read_seconds", dataset=dataset):
+        if is_columnar(file_format):
+            data = pd.read_parquet(load_path, columns=columns)
+        else:
+            data = read_csv(load_path, columns=columns)
+    metrics.record_io(dataset, trade_date, "read", rows=len(data), nbytes=os.path.getsize(load_path))
+    return data
+
+
+def iter_months(bgn_date: str, stp_date: str) -> list[str]:
+    """
+
+    :return: all months "YYYYMM" that have dates in [bgn_date, stp_date)
+    """
+    months, y, m = [], int(bgn_date[0:4]), int(bgn_date[4:6])
+    while (month := f"{y:04d}{m:02d}") <= stp_date[0:6]:
+        months.append(month)
+        y, m = (y + 1, 1) if m == 12 else (y, m + 1)
+    return months
+
+
+def find_columnar_files(root_dir: str, file_format: str, bgn_date: str, stp_date: str) -> list[str]:
+    """
+    list the month directories only, dates are parsed from file names,
+    so no data file out of [bgn_date, stp_date) is opened
+
+    """
+    prefix, suffix = file_format.split("{}")
+    paths: list[str] = []
+    for month in iter_months(bgn_date, stp_date):
+        month_dir = os.path.join(root_dir, month[0:4], month)
+        if not os.path.exists(month_dir):
+            continue
+        for file_name in sorted(os.listdir(month_dir)):
+            if file_name.startswith(prefix) and file_name.endswith(suffix):
+                trade_date = file_name[len(prefix):len(file_name) - len(suffix)]
+                if bgn_date <= trade_date < stp_date:
+                    paths.append(os.path.join(month_dir, file_name))
+    return paths
+
+
+def load_daily_data_range(
+        root_dir: str, file_format: str, fields: tuple[str, ...],
+        bgn_date: str, stp_date: str, calendar: CCalendar,
+        columns: list[str] | None = None, codes: list[str] | None = None, code_field: str = "ts_code",
+) -> pd.DataFrame:
+    """
+    load data of all dates in [bgn_date, stp_date), sorted by trade_date.
+    For parquet, it is a single scan over the month partitions, columns are selected and
+    predicates on trade_date and codes are pushed down to the reader. For csv, files are
+    read date by date, and then filtered in memory. For both of them, a trade date in the
+    calendar without its file raises FileNotFoundError.
+
+    :param root_dir:
+    :param file_format:
+    :param fields: raw fields of the dataset, used to build the schema
+    :param bgn_date:
+    :param stp_date:
+    :param calendar:
+    :param columns: columns to load, None for all. "trade_date" is always loaded.
+    :param codes: only load rows whose code_field is in codes, None for all
+    :param code_field: "ts_code" for most datasets, "symbol" for positions
+    :return:
+    """
+    if columns is not None and "trade_date" not in columns:
+        columns = ["trade_date"] + columns
+
+    if is_columnar(file_format):
+        import pyarrow.dataset as ds
+
+        schema = get_arrow_schema(fields)
+        paths = find_columnar_files(root_dir, file_format, bgn_date, stp_date)
+        prefix, suffix = file_format.split("{}")
+        found = {os.path.basename(_)[len(prefix):-len(suffix)] for _ in paths}
+        if missing := [_ for _ in calendar.get_iter_list(bgn_date, stp_date) if _ not in found]:
+            raise FileNotFoundError(f"{len(missing)} dates of {file_format} are not saved, first is {missing[0]}")
+        if not paths:
+            return schema.empty_table().to_pandas()
+        predicate = (ds.field("trade_date") >= bgn_date) & (ds.field("trade_date") < stp_date)
+        if codes is not None:
+            predicate = predicate & ds.field(code_field).isin(codes)
+        dataset = ds.dataset(paths, schema=schema, format="parquet")
+        with metrics.timer("read_seconds", dataset=get_dataset_name(file_format)):
+            data = dataset.to_table(columns=columns, filter=predicate).to_pandas()
+        metrics.inc("bytes_read_total", sum(os.path.getsize(_) for _ in paths), dataset=get_dataset_name(file_format))
+        for trade_date, rows in data["trade_date"].value_counts().items():
+            metrics.record_io(get_dataset_name(file_format), trade_date, "read", rows=int(rows))
+        return data
+
+    dfs: list[pd.DataFrame] = []
+    for trade_date in calendar.get_iter_list(bgn_date, stp_date):
+        df = data_store.load(root_dir, file_format, trade_date)
+        df["trade_date"] = trade_date
+        if codes is not None:
+            df = df[df[code_field].isin(codes)]
+        dfs.append(df if columns is None else df[columns])
+    return pd.concat(dfs, axis=0, ignore_index=True)
+
+
+# --- shared daily data store ---
+class CDailyDataStore:
+    def __init__(self, max_bytes: int = 1024 ** 3):
+        """
+        In-process LRU cache of daily data, keyed by (root_dir, file_format, trade_date),
+        so each file is parsed only once, no matter how many engines or db writers load it.
+        It is thread-safe, each process has its own store.
+
+        :param max_bytes: the least recently used data is evicted when the total memory usage
+                          of cached data exceeds it
+        """
+        self.max_bytes = max_bytes
+        self.cache: OrderedDict[tuple[str, str, str], tuple[pd.DataFrame, int]] = OrderedDict()
+        self.cached_bytes = 0
+        self.stats: dict[str, int] = {"hits": 0, "misses": 0, "puts": 0, "evictions": 0}
+        self.lock = threading.Lock()
+
+    def __evict(self):
+        while self.cached_bytes > self.max_bytes and self.cache:
+            _, (_, nbytes) = self.cache.popitem(last=False)
+            self.cached_bytes -= nbytes
+            self.stats["evictions"] += 1
+
+    def put(self, root_dir: str, file_format: str, trade_date: str, data: pd.DataFrame):
+        key = (root_dir, file_format, trade_date)
+        nbytes = int(data.memory_usage(index=True, deep=True).sum())
+        with self.lock:
+            if key in self.cache:
+                self.cached_bytes -= self.cache.pop(key)[1]
+            self.cache[key] = (data, nbytes)
+            self.cached_bytes += nbytes
+            self.stats["puts"] += 1
+            self.__evict()
+        return 0
+
+    def load(self, root_dir: str, file_format: str, trade_date: str, columns: list[str] | None = None) -> pd.DataFrame:
+        """
+        load from cache, or from file if it is not cached. A copy is returned, callers are free to modify it.
+
+        """
+        key = (root_dir, file_format, trade_date)
+        with self.lock:
+            if key in self.cache:
+                self.cache.move_to_end(key)
+                self.stats["hits"] += 1
+                data = self.cache[key][0]
+            else:
+                self.stats["misses"] += 1
+                data = None
+        metrics.inc("cache_requests_total", cache="data_store", result="miss" if data is None else "hit")
+        if data is None:
+            # parse out of the lock, other keys can be loaded at the same time
+            data = load_daily_data(root_dir, file_format, trade_date)
+            self.put(root_dir, file_format, trade_date, data)
+        return data.copy() if columns is None else data[columns].copy()
+
+    def clear(self):
+        with self.lock:
+            self.cache.clear()
+            self.cached_bytes = 0
+        return 0
+
+    def report(self) -> str:
+        with self.lock:
+            return (f"hits = {self.stats['hits']}, misses = {self.stats['misses']}, "
+                    f"puts = {self.stats['puts']}, evictions = {self.stats['evictions']}, "
+                    f"cached = {len(self.cache)} items / {self.cached_bytes / 1024 ** 2:.1f} MB")
+
+
+data_store = CDailyDataStore()
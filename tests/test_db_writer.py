@@ -0,0 +1,20 @@
+from husfort.qcalendar import CCalendar
+from databases import CDbWriterPos
+from project_cfg import futures_pos
+from benchmarks.synthetic import build_dataset, make_pos_db_struct
+
+TRADE_DATES = ["20240108", "20240109", "20240110", "20240111"]
+
+
+def test_main_returns_continuity_failure(tmp_path):
+    paths = build_dataset(str(tmp_path), TRADE_DATES, n_ticks=10, n_pos_rows=50, seed=0)
+    calendar = CCalendar(paths["calendar_path"])
+    writer = CDbWriterPos(
+        db_struct=make_pos_db_struct(str(tmp_path)), raw_data_root_dir=paths["daily_data_root_dir"],
+        raw_data_info=futures_pos,
+    )
+    assert writer.main("20240108", "20240110", calendar, silent=True) == 0
+    assert writer.main("20240111", "20240112", calendar, silent=True) != 0  # 20240110 is not written
+    assert writer.get_last_date() == "20240109"
+    assert writer.main("20240110", "20240112", calendar, silent=True) == 0
+    assert writer.get_last_date() == "20240111"
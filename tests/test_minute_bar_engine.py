@@ -0,0 +1,78 @@
+import os
+import zipfile
+import pytest
+import pandas as pd
+from husfort.qcalendar import CCalendar
+from data_engines import CDataEngineTushareFutDailyMinuteBar
+from manifest import get_manifest
+from storage import load_daily_data
+from project_cfg import futures_md, futures_contracts, futures_minute_bar
+from benchmarks.synthetic import build_dataset
+
+TRADE_DATES = ["20240108", "20240109", "20240110"]
+
+
+def drop_tick_members(zip_path: str, trade_date: str):
+    with zipfile.ZipFile(zip_path, "r") as zf:
+        members = {name: zf.read(name) for name in zf.namelist() if f"/{trade_date}/" not in name}
+    with zipfile.ZipFile(zip_path, "w", compression=zipfile.ZIP_DEFLATED) as zf:
+        for name, content in members.items():
+            zf.writestr(name, content)
+
+
+@pytest.mark.parametrize("month_sweep", [False, True])
+def test_date_without_tick_members(tmp_path, month_sweep: bool):
+    paths = build_dataset(str(tmp_path), TRADE_DATES, n_ticks=200, n_pos_rows=10, seed=0)
+    drop_tick_members(os.path.join(paths["tick_data_root_dir"], "2024", "202401.zip"), "20240109")
+    calendar = CCalendar(paths["calendar_path"])
+    engine = CDataEngineTushareFutDailyMinuteBar(
+        save_root_dir=paths["daily_data_root_dir"],
+        save_data_info=futures_minute_bar,
+        md_data_info=futures_md,
+        cntrcts_data_info=futures_contracts,
+        tick_data_root_dir=paths["tick_data_root_dir"],
+        calendar=calendar,
+        month_sweep=month_sweep,
+        processes=1,
+    )
+    engine.download_data_range(TRADE_DATES[0], "20240111", calendar, silent=True)
+
+    manifest = get_manifest(paths["daily_data_root_dir"])
+    partitions = manifest.get_partitions(futures_minute_bar.file_format, TRADE_DATES[0], TRADE_DATES[-1])
+    assert sorted(partitions) == TRADE_DATES
+    assert partitions["20240109"].rows == 0
+    assert partitions["20240108"].rows > 0 and partitions["20240110"].rows > 0
+    empty_data = load_daily_data(paths["daily_data_root_dir"], futures_minute_bar.file_format, "20240109")
+    assert empty_data.empty and list(empty_data.columns) == list(futures_minute_bar.fields)
+    next_data = load_daily_data(paths["daily_data_root_dir"], futures_minute_bar.file_format, "20240110")
+    pd.testing.assert_index_equal(next_data.columns, pd.Index(futures_minute_bar.fields))
+
+
+def download_minute_bars(root_dir: str, month_sweep: bool,
+                         tick_cache_dir: str | None = None) -> dict[str, pd.DataFrame]:
+    paths = build_dataset(root_dir, TRADE_DATES, n_ticks=200, n_pos_rows=10, seed=0)
+    calendar = CCalendar(paths["calendar_path"])
+    engine = CDataEngineTushareFutDailyMinuteBar(
+        save_root_dir=paths["daily_data_root_dir"],
+        save_data_info=futures_minute_bar,
+        md_data_info=futures_md,
+        cntrcts_data_info=futures_contracts,
+        tick_data_root_dir=paths["tick_data_root_dir"],
+        calendar=calendar,
+        month_sweep=month_sweep,
+        processes=2,
+        chunksize=1,
+        tick_cache_dir=tick_cache_dir,
+    )
+    engine.download_data_range(TRADE_DATES[0], "20240111", calendar, silent=True)
+    return {d: load_daily_data(paths["daily_data_root_dir"], futures_minute_bar.file_format, d) for d in TRADE_DATES}
+
+
+def test_month_sweep_matches_pool(tmp_path):
+    expected = download_minute_bars(str(tmp_path / "pool"), month_sweep=False)
+    tick_cache_dir = str(tmp_path / "tick_cache")
+    for run in ("cold", "warm"):  # tick files are read from the zip, then from the tick cache
+        swept = download_minute_bars(str(tmp_path / run), month_sweep=True, tick_cache_dir=tick_cache_dir)
+        for trade_date in TRADE_DATES:
+            pd.testing.assert_frame_equal(swept[trade_date], expected[trade_date])
+    assert os.listdir(tick_cache_dir)
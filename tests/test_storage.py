@@ -0,0 +1,77 @@
+import os
+import numpy as np
+import pandas as pd
+import pytest
+from husfort.qcalendar import CCalendar
+from storage import save_daily_data, read_csv, get_save_path, load_daily_data_range, data_store
+from storage import CWriteBehind, CWriteBehindError
+
+FILE_FORMAT = "test_{}.csv.gz"
+TRADE_DATE = "20240108"
+
+
+def make_frames() -> dict[str, pd.DataFrame]:
+    timestamp = pd.date_range("2024-01-05 21:00", periods=4, freq="1min")
+    return {
+        "minute_bar": pd.DataFrame({
+            "ts_code": "CU2402.SHF", "trade_date": TRADE_DATE, "timestamp": timestamp,
+            "open": [1.0, 2.0, np.nan, 4.0], "vol": [1, 2, 3, 4],
+        }),
+        "int_trade_date": pd.DataFrame({"trade_date": [20240108] * 3, "symbol": ["rb2405", "PTA", "cuACTV"]}),
+        "wind": pd.DataFrame([[1.5, None], [2.5, 3.5]], index=["CU.SHF", "IF.CFX"], columns=["basis", "stock"],
+                             dtype=object).rename_axis("wd_code").reset_index().set_index("basis", drop=False),
+        "empty": pd.DataFrame(columns=["ts_code", "trade_date", "timestamp", "open"]),
+    }
+
+
+@pytest.mark.parametrize("name", list(make_frames()))
+def test_stored_data_is_what_read_csv_gives(tmp_path, name: str):
+    root_dir = str(tmp_path)
+    data = make_frames()[name]
+    save_path = os.path.join(root_dir, FILE_FORMAT.format(TRADE_DATE))
+    save_daily_data(data, save_path, FILE_FORMAT, fields=tuple(data.columns), trade_date=TRADE_DATE,
+                    root_dir=root_dir)
+    cached = data_store.load(root_dir, FILE_FORMAT, TRADE_DATE)
+    pd.testing.assert_frame_equal(cached, read_csv(save_path))
+
+
+def test_data_without_column_is_not_saved(tmp_path):
+    save_path = os.path.join(str(tmp_path), FILE_FORMAT.format(TRADE_DATE))
+    with pytest.raises(ValueError):
+        save_daily_data(pd.DataFrame(), save_path, FILE_FORMAT, fields=(), trade_date=TRADE_DATE,
+                        root_dir=str(tmp_path))
+    assert os.listdir(str(tmp_path)) == []
+
+
+def test_write_behind_keeps_writing_after_failure():
+    written: list[str] = []
+
+    def write(trade_date: str):
+        if trade_date == "20240109":
+            raise OSError("disk full")
+        written.append(trade_date)
+
+    with pytest.raises(CWriteBehindError) as exc_info:
+        with CWriteBehind(queue_size=1, name="test") as writer:
+            for trade_date in ["20240108", "20240109", "20240110", "20240111"]:
+                writer.submit(trade_date, write, trade_date)
+    assert written == ["20240108", "20240110", "20240111"]
+    assert list(exc_info.value.errors) == ["20240109"]
+    assert "20240109" in str(exc_info.value)
+
+
+def test_parquet_range(tmp_path):
+    root_dir, file_format = str(tmp_path), "test_{}.parquet"
+    trade_dates = ["20240108", "20240109"]
+    for trade_date in trade_dates:
+        data = pd.DataFrame({"ts_code": ["CU.SHF", "IF.CFX"], "vol": [1.0, 2.0]})
+        save_path = get_save_path(root_dir, file_format, trade_date)
+        os.makedirs(os.path.dirname(save_path), exist_ok=True)
+        save_daily_data(data, save_path, file_format, fields=("ts_code", "vol"), trade_date=trade_date)
+    calendar_path = str(tmp_path / "calendar.csv")
+    pd.DataFrame({"trade_date": trade_dates + ["20240110"]}).to_csv(calendar_path, index=False)
+    calendar = CCalendar(calendar_path)
+    data = load_daily_data_range(root_dir, file_format, ("ts_code", "vol"), "20240108", "20240110", calendar,
+                                 codes=["IF.CFX"])
+    assert data["trade_date"].tolist() == trade_dates
+    assert data["vol"].tolist() == [2.0, 2.0]
@@ -0,0 +1,8 @@
+import pytest
+from benchmarks import bench_tick_parity
+
+
+@pytest.mark.parametrize("case", bench_tick_parity.CASES, ids=lambda case: f"{case[0]}-{case[2]}")
+def test_vectorized_parser_matches_loop(case, monkeypatch):
+    monkeypatch.setattr(bench_tick_parity, "CASES", [case])
+    assert bench_tick_parity.main(n_ticks=2000, seed=0) == 0
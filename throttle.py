@@ -0,0 +1,188 @@
+import random
+import threading
+import time
+from typing import Any, Callable
+from loguru import logger
+from metrics import metrics
+
+
+class CTokenBucket:
+    def __init__(self, calls_per_minute: int, burst: int = 1):
+        """
+
+        :param calls_per_minute: refill rate of the bucket
+        :param burst: capacity of the bucket, 1 means calls are evenly spaced
+        """
+        self.rate = calls_per_minute / 60
+        self.capacity = burst
+        self.tokens = float(burst)
+        self.updated_at = time.monotonic()
+        self.waited = 0.0
+        self.lock = threading.Lock()
+
+    def acquire(self) -> float:
+        """
+        take one token, block until it is available. Tokens are reserved
+        under the lock, so concurrent callers are served in arrival order.
+
+        :return: seconds waited
+        """
+        with self.lock:
+            now = time.monotonic()
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate)
+            self.updated_at = now
+            self.tokens -= 1
+            wait = 0.0 if self.tokens >= 0 else -self.tokens / self.rate
+            self.waited += wait
+        if wait > 0:
+            time.sleep(wait)
+        return wait
+
+
+class CRateLimiter:
+    def __init__(self, calls_per_minute: dict[str, int], burst: int = 1):
+        """
+
+        :param calls_per_minute: like {"fut_daily": 200, "fut_holding": 200}, endpoints
+                                 not in this dict are not limited
+        :param burst: capacity of each bucket
+        """
+        self.buckets: dict[str, CTokenBucket] = {
+            endpoint: CTokenBucket(calls_per_minute=cpm, burst=burst) for endpoint, cpm in calls_per_minute.items()
+        }
+
+    def acquire(self, endpoint: str) -> float:
+        if (bucket := self.buckets.get(endpoint)) is None:
+            return 0.0
+        if (wait := bucket.acquire()) > 0:
+            metrics.inc("throttle_sleep_seconds_total", wait, endpoint=endpoint)
+        return wait
+
+    def waited(self) -> dict[str, float]:
+        return {endpoint: bucket.waited for endpoint, bucket in self.buckets.items()}
+
+
+class CProviderError(Exception):
+    def __init__(self, provider: str, code: int, msg: str = ""):
+        super().__init__(f"{provider} returns error code = {code}. {msg}".strip())
+        self.provider = provider
+        self.code = code
+
+
+class CDownloadSkipped(Exception):
+    pass
+
+
+class CCircuitBreaker:
+    def __init__(self, failure_threshold: int = 10, cooldown: float = 300.0):
+        """
+
+        :param failure_threshold: the breaker opens after this number of consecutive failed attempts
+        :param cooldown: seconds the breaker stays open, after that calls are allowed again, and
+                         the breaker opens again at the next failure
+        """
+        self.failure_threshold = failure_threshold
+        self.cooldown = cooldown
+        self.failures = 0
+        self.opened_at: float | None = None
+        self.lock = threading.Lock()
+
+    def allow(self) -> bool:
+        with self.lock:
+            return self.opened_at is None or time.monotonic() - self.opened_at >= self.cooldown
+
+    def record_success(self):
+        with self.lock:
+            self.failures = 0
+            self.opened_at = None
+
+    def record_failure(self):
+        with self.lock:
+            self.failures += 1
+            if self.failures >= self.failure_threshold:
+                self.opened_at = time.monotonic()
+
+
+class CRetryPolicy:
+    THROTTLE_KEYWORDS = ("最多访问", "频率", "too many requests", "rate limit")
+    FATAL_OS_ERRORS = (FileNotFoundError, PermissionError, IsADirectoryError, NotADirectoryError)
+
+    def __init__(self, max_attempts: int = 5, base_delay: float = 1.0, max_delay: float = 60.0,
+                 throttle_factor: float = 8.0, breaker: CCircuitBreaker | None = None):
+        """
+
+        :param max_attempts: a call is given up after this number of failed attempts
+        :param base_delay: backoff of the first retry, doubled at each retry
+        :param max_delay: cap of backoff
+        :param throttle_factor: backoff multiplier for errors telling the quota is used up
+        :param breaker:
+        """
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.throttle_factor = throttle_factor
+        self.breaker = breaker or CCircuitBreaker()
+        self.stats: dict[str, float] = {
+            "calls": 0,
+            "attempts": 0,
+            "retries": 0,
+            "given_up": 0,
+            "short_circuited": 0,
+            "time_failed": 0.0,  # seconds spent in failed attempts
+            "time_backoff": 0.0,  # seconds slept before retries
+        }
+        self.lock = threading.Lock()
+
+    def count(self, key: str, value: float = 1):
+        with self.lock:
+            self.stats[key] += value
+
+    def classify(self, e: Exception) -> str:
+        """
+
+        :return: "throttled", "transient" or "fatal", fatal errors are raised at once
+        """
+        msg = str(e).lower()
+        if any(kw in msg for kw in self.THROTTLE_KEYWORDS):
+            return "throttled"
+        if isinstance(e, self.FATAL_OS_ERRORS):
+            return "fatal"
+        if isinstance(e, (OSError, CProviderError)):
+            # TimeoutError, ConnectionError and requests exceptions are all OSError
+            return "transient"
+        return "fatal"
+
+    def backoff(self, attempt: int, kind: str) -> float:
+        delay = self.base_delay * (2 ** attempt) * (self.throttle_factor if kind == "throttled" else 1)
+        cap = min(self.max_delay, delay)
+        return random.uniform(cap / 2, cap)
+
+    def call(self, func: Callable[..., Any], *args, **kwargs) -> Any:
+        self.count("calls")
+        for attempt in range(self.max_attempts):
+            if not self.breaker.allow():
+                self.count("short_circuited")
+                raise CDownloadSkipped("circuit breaker is open")
+            self.count("attempts")
+            t0 = time.monotonic()
+            try:
+                result = func(*args, **kwargs)
+            except Exception as e:
+                self.count("time_failed", time.monotonic() - t0)
+                if (kind := self.classify(e)) == "fatal":
+                    raise
+                self.breaker.record_failure()
+                if attempt == self.max_attempts - 1:
+                    self.count("given_up")
+                    metrics.inc("provider_given_up_total")
+                    raise CDownloadSkipped(f"given up after {self.max_attempts} attempts, last error: {e}") from e
+                delay = self.backoff(attempt, kind)
+                logger.warning(f"{kind} error: {e}, retry {attempt + 1} in {delay:.1f} seconds")
+                self.count("retries")
+                self.count("time_backoff", delay)
+                metrics.inc("provider_retries_total", kind=kind)
+                metrics.inc("retry_sleep_seconds_total", delay)
+                time.sleep(delay)
+            else:
+                self.breaker.record_success()
+                return result